@@ -1,214 +1,224 @@
-from flask import Flask, request, jsonify
-import sys
-import json
-from services.pinecone_service import PineconeService
-from services.openai_service import OpenAIService
-from functions.product_search import ProductSearch
-from functions.order_creation import OrderCreation
-from utils.helpers import cargar_json
-
-app = Flask(__name__)
-
-# Almacenaremos las conversaciones en RAM. En producción conviene algo más robusto (DB/Redis).
-conversations = {}
-
-# Inicializar servicios
-pinecone_service = PineconeService()
-openai_service = OpenAIService()
-
-# Inicializar funciones
-product_search = ProductSearch(pinecone_service, openai_service)
-order_creation = OrderCreation()
-
-# Definir tools con JSON Schema (igual que en main.py)
-tools = [
-    {
-        "name": "buscar_producto",
-        "description": "Busca productos en Pinecone dada una query y retorna una lista con sus datos.",
-        "parameters": {
-            "type": "object",
-            "properties": {
-                "query": {
-                    "type": "string",
-                    "description": "Texto que describe lo que el usuario busca, e.g. 'coca cola'."
-                }
-            },
-            "required": ["query"],
-            "additionalProperties": False
-        }
-    },
-    {
-        "name": "crear_pedido",
-        "description": "Crea un pedido con los datos del cliente y los productos elegidos.",
-        "parameters": {
-            "type": "object",
-            "properties": {
-                "datos_cliente": {
-                    "type": "object",
-                    "properties": {
-                        "nombre": {"type": "string"},
-                        "telefono": {"type": "string"},
-                        "direccion": {"type": "string"},
-                        "modalidad_entrega": {"type": "string"}
-                    },
-                    "required": ["nombre", "telefono", "direccion", "modalidad_entrega"]
-                },
-                "productos": {
-                    "type": "array",
-                    "items": {
-                        "type": "object",
-                        "properties": {
-                            "nombre": {"type": "string"},
-                            "sku": {"type": "string"},
-                            "precio_bayovar": {"type": "number"}
-                        },
-                        "required": ["nombre", "sku", "precio_bayovar"]
-                    }
-                }
-            },
-            "required": ["datos_cliente", "productos"],
-            "additionalProperties": False
-        }
-    }
-]
-
-# Mensaje system inicial (igual que en main.py)
-SYSTEM_MESSAGE = {
-    "role": "system",
-    "content": (
-        "Eres un asistente de ventas que puede buscar productos en Pinecone y crear pedidos.\n"
-        "Reglas:\n"
-        "- Usa la función 'buscar_producto' cuando el usuario te pida buscar algo (por ejemplo, '¿Tienes alguna coca cola?').\n"
-        "- Cuando el usuario confirme la compra y proporcione sus datos, usa la función 'crear_pedido'.\n"
-        "- No muestres el SKU en la conversación, pero sí inclúyelo cuando crees el pedido.\n"
-        "- Muestra solo precios de Bayóvar (precio_bayovar).\n"
-        "- Después de crear el pedido, saluda con un mensaje como 'Perfecto, hemos tomado tu pedido...'\n"
-    )
-}
-
-@app.route('/api/chat', methods=['POST'])
-def chat():
+import hmac
+import math
+from flask import Flask, request, jsonify, Response, stream_with_context
+from config.settings import settings
+from services.admission import Saturado, instalar_admision
+from services.container import obtener_servicios, instalar_preparacion
+from functions.tools import FUNCIONES_CACHEABLES, SYSTEM_MESSAGE
+from utils.helpers import formatear_sse
+from utils.metrics import instrumentar_app
+
+def _sin_acceso():
     """
-    Endpoint para interactuar con la lógica del asistente que antes estaba en main.py.
-    - Espera JSON con al menos {"session_id": "abc123", "user_input": "Hola, quiero comprar..."}.
-    - Devuelve la respuesta final del asistente después de ejecutar las funciones correspondientes.
+    Respuesta de rechazo para /api/orders y /api/stats, o None si la petición está autorizada.
+    Exponen datos de clientes: sin ORDERS_API_TOKEN configurado quedan desactivados.
     """
-
-    data = request.get_json()
-    if not data:
-        return jsonify({"error": "Debe enviar un cuerpo JSON."}), 400
-
-    session_id = data.get("session_id")
-    user_input = data.get("user_input", "").strip()
-
-    if not session_id:
-        return jsonify({"error": "Falta session_id en la petición."}), 400
-
-    # Si el usuario escribe 'salir', finalizamos la conversación
-    if user_input.lower() == "salir":
-        # Eliminar la conversación de la memoria si existe
-        if session_id in conversations:
-            del conversations[session_id]
-        return jsonify({"message": "Saliendo..."}), 200
-
-    # Obtener o crear el historial de mensajes para esta sesión
-    if session_id not in conversations:
-        # Creamos una nueva conversación con el mensaje system inicial
-        conversations[session_id] = [SYSTEM_MESSAGE]
-
-    messages = conversations[session_id]
-
-    # Agregar el mensaje del usuario al historial
-    messages.append({"role": "user", "content": user_input})
-
-    # 1) Llamar a la API de OpenAI con la lista actualizada de mensajes
-    response = openai_service.chat_completion(messages=messages, functions=tools)
-
-    if response is None:
-        return jsonify({"error": "No se obtuvo respuesta de OpenAI."}), 500
-
-    assistant_msg = response
-    tool_call = assistant_msg.get("function_call")
-
-    if not tool_call:
-        # Respuesta normal (sin función)
-        assistant_content = assistant_msg.get("content")
-        if assistant_content:
-            messages.append({"role": "assistant", "content": assistant_content})
-            return jsonify({"assistant": assistant_content})
-        else:
+    if not settings.ORDERS_API_TOKEN:
+        return jsonify({"error": "Recurso no disponible."}), 404
+    recibido = request.headers.get("Authorization", "")
+    if not hmac.compare_digest(recibido, f"Bearer {settings.ORDERS_API_TOKEN}"):
+        return jsonify({"error": "No autorizado."}), 401
+    return None
+
+def create_app(servicios=None):
+    """
+    Crea la app Flask. Los servicios (Pinecone, OpenAI, sesiones, cachés) se construyen
+    la primera vez que se usan o durante el calentamiento, no al importar este módulo.
+    """
+    servicios = servicios or obtener_servicios()
+    app = Flask(__name__)
+    instrumentar_app(app)
+    instalar_preparacion(app, servicios)
+    instalar_admision(app)
+
+    @app.route('/api/chat/stream', methods=['POST'])
+    def chat_stream():
+        """
+        Variante de /api/chat que responde con Server-Sent Events:
+        - 'token': fragmento de texto del asistente según llega de OpenAI.
+        - 'herramienta': el asistente está ejecutando una función (p. ej. "Buscando productos…").
+        - 'fin': respuesta completa; el historial de la sesión ya está actualizado.
+        - 'error': no se pudo completar el turno.
+        """
+
+        data = request.get_json()
+        if not data:
+            return jsonify({"error": "Debe enviar un cuerpo JSON."}), 400
+
+        session_id = data.get("session_id")
+        user_input = data.get("user_input", "").strip()
+
+        if not session_id:
+            return jsonify({"error": "Falta session_id en la petición."}), 400
+
+        session_store = servicios.session_store
+        engine = servicios.engine
+        # El turno anterior de la sesión debe terminar antes de leer su historial;
+        # el candado se suelta al terminar el stream (o si el cliente se desconecta)
+        candado = servicios.session_locks.adquirir(session_id, settings.SESSION_LOCK_TIMEOUT)
+        try:
+            # Igual que /api/chat: 'salir' termina la conversación sin pasar por el modelo
+            if user_input.lower() == "salir":
+                with candado:
+                    session_store.eliminar(session_id)
+                return jsonify({"message": "Saliendo..."}), 200
+            messages = session_store.obtener(session_id) or [SYSTEM_MESSAGE]
+        except Exception:
+            candado.liberar()
+            raise
+        inicio_turno = len(messages)
+        messages.append({"role": "user", "content": user_input})
+
+        def generar():
+            guardar = True
+            try:
+                for evento, datos in engine.ejecutar_turno_stream(messages):
+                    yield formatear_sse(evento, datos)
+            except Saturado as e:
+                # Saturado antes de ejecutar funciones: no se guarda para que el cliente lo reintente
+                # (si ya se ejecutaron, el motor termina el turno con 'error' y sí se guarda)
+                guardar = False
+                yield formatear_sse("error", {
+                    "error": "Hay muchas solicitudes en este momento, intente nuevamente en unos segundos.",
+                    "reintentar_en": math.ceil(e.reintentar_en)
+                })
+            except Exception as e:
+                print(f"[ERROR] Error durante el streaming de /api/chat/stream: {e}")
+                yield formatear_sse("error", {"error": "Error al comunicarse con OpenAI."})
+            finally:
+                try:
+                    if guardar:
+                        session_store.guardar(session_id, messages)
+                    else:
+                        del messages[inicio_turno:]
+                finally:
+                    candado.liberar()
+
+        respuesta = Response(
+            stream_with_context(generar()),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+        respuesta.call_on_close(candado.liberar)
+        return respuesta
+
+    @app.route('/api/chat', methods=['POST'])
+    def chat():
+        """
+        Endpoint para interactuar con la lógica del asistente que antes estaba en main.py.
+        - Espera JSON con al menos {"session_id": "abc123", "user_input": "Hola, quiero comprar..."}.
+        - Devuelve la respuesta final del asistente después de ejecutar las funciones correspondientes.
+        """
+
+        data = request.get_json()
+        if not data:
+            return jsonify({"error": "Debe enviar un cuerpo JSON."}), 400
+
+        session_id = data.get("session_id")
+        user_input = data.get("user_input", "").strip()
+
+        if not session_id:
+            return jsonify({"error": "Falta session_id en la petición."}), 400
+
+        session_store = servicios.session_store
+
+        # Los mensajes de una misma sesión se atienden en orden: obtener -> turno -> guardar
+        with servicios.session_locks.adquirir(session_id, settings.SESSION_LOCK_TIMEOUT):
+            # Si el usuario escribe 'salir', finalizamos la conversación
+            if user_input.lower() == "salir":
+                # Eliminar la conversación del almacén si existe
+                session_store.eliminar(session_id)
+                return jsonify({"message": "Saliendo..."}), 200
+
+            # Obtener o crear el historial de mensajes para esta sesión
+            # (si no existe, empieza con el mensaje system inicial)
+            messages = session_store.obtener(session_id) or [SYSTEM_MESSAGE]
+
+            # Agregar el mensaje del usuario al historial
+            messages.append({"role": "user", "content": user_input})
+            inicio_turno = len(messages)
+
+            # Primer turno: intentar responder desde la caché semántica sin llamar al modelo
+            semantic_cache = servicios.semantic_cache
+            embedding = None
+            if semantic_cache is not None and inicio_turno == 2:
+                embedding = servicios.openai_service.generar_embedding(user_input)
+                if embedding is not None:
+                    cacheados = semantic_cache.buscar(embedding, user_input)
+                    if cacheados:
+                        messages.extend(cacheados)
+                        session_store.guardar(session_id, messages)
+                        return jsonify({"assistant": cacheados[-1]["content"]})
+
+            # Ejecutar el ciclo modelo -> funciones -> modelo
+            resultado = servicios.engine.ejecutar_turno(messages)
+            session_store.guardar(session_id, messages)
+
+            if (embedding is not None and resultado["contenido"]
+                    and set(resultado["funciones"]) <= FUNCIONES_CACHEABLES):
+                semantic_cache.guardar(embedding, messages[inicio_turno:], user_input)
+
+            if resultado["error"]:
+                return jsonify({"error": resultado["error"]}), 500
+
+            assistant_content = resultado["contenido"]
+            if assistant_content:
+                return jsonify({"assistant": assistant_content})
             return jsonify({"assistant": "", "info": "Asistente no devolvió texto."})
-    else:
-        # La IA está invocando una función
-        fn_name = tool_call.get("name")
-        fn_args_str = tool_call.get("arguments")
-
-        fn_args = cargar_json(fn_args_str)
-
-        funcion_resultado = None
-
-        if fn_name == "buscar_producto":
-            query_text = fn_args.get("query", "")
-            funcion_resultado = product_search.buscar_producto(query_text)
-
-        elif fn_name == "crear_pedido":
-            datos_cliente = fn_args.get("datos_cliente", {})
-            productos = fn_args.get("productos", [])
-            funcion_resultado = order_creation.crear_pedido(datos_cliente, productos)
-
-        else:
-            funcion_resultado = {"error": f"Función '{fn_name}' no existe."}
-
-        # Crear un mensaje de función con el resultado
-        tool_message = {
-            "role": "function",
-            "name": fn_name,
-            "content": json.dumps(funcion_resultado)
-        }
-        messages.append(tool_message)
-
-        # 2) Llamar nuevamente a la API de OpenAI con la respuesta de la función
-        response2 = openai_service.chat_completion(messages=messages, functions=tools)
-        if response2 is None:
-            return jsonify({"error": "No se obtuvo respuesta de OpenAI en la segunda llamada."}), 500
-
-        msg2 = response2
-        tool_call2 = msg2.get("function_call")
-
-        if not tool_call2:
-            # Respuesta final del asistente
-            assistant_content2 = msg2.get("content")
-            if assistant_content2:
-                messages.append({"role": "assistant", "content": assistant_content2})
-                return jsonify({"assistant": assistant_content2})
-            else:
-                return jsonify({"assistant": "", "info": "Asistente no devolvió texto en la segunda llamada."})
-        else:
-            # La IA hace una segunda llamada a función
-            fn2_name = tool_call2.get("name")
-            fn2_args_str = tool_call2.get("arguments")
-
-            fn2_args = cargar_json(fn2_args_str)
-
-            if fn2_name == "buscar_producto":
-                query_text2 = fn2_args.get("query", "")
-                funcion_resultado2 = product_search.buscar_producto(query_text2)
-
-            elif fn2_name == "crear_pedido":
-                datos_cliente2 = fn2_args.get("datos_cliente", {})
-                productos2 = fn2_args.get("productos", [])
-                funcion_resultado2 = order_creation.crear_pedido(datos_cliente2, productos2)
-            else:
-                funcion_resultado2 = {"error": f"Función '{fn2_name}' no existe."}
-
-            tool_message2 = {
-                "role": "function",
-                "name": fn2_name,
-                "content": json.dumps(funcion_resultado2)
-            }
-            messages.append(tool_message2)
-
-            # 3) Tercera llamada
-            response3 = openai_service.chat_completion(messages=messages, functions=tools)
-            if response3 is None:
-                return j
+
+    @app.route('/api/orders/<id_unico>', methods=['GET'])
+    def obtener_pedido(id_unico):
+        """
+        Pedido por id_unico (índice en memoria, sin recorrer el registro de ventas).
+        """
+        rechazo = _sin_acceso()
+        if rechazo is not None:
+            return rechazo
+        pedido = servicios.order_creation.order_index.por_id(id_unico)
+        if pedido is None:
+            return jsonify({"error": f"No existe el pedido {id_unico}."}), 404
+        return jsonify({"pedido": pedido})
+
+    @app.route('/api/orders', methods=['GET'])
+    def buscar_pedidos():
+        """
+        Pedidos filtrados por ?telefono=, ?sku= y/o rango ?desde=&hasta= (AAAA-MM-DD),
+        del más reciente al más antiguo. Acepta ?limite= (por defecto 50, máximo 500).
+        """
+        rechazo = _sin_acceso()
+        if rechazo is not None:
+            return rechazo
+        filtros = {k: request.args.get(k, "").strip() or None for k in ("telefono", "sku", "desde", "hasta")}
+        if not any(filtros.values()):
+            return jsonify({"error": "Indique al menos un filtro: telefono, sku, desde o hasta."}), 400
+        try:
+            limite = min(max(int(request.args.get("limite", 50)), 1), 500)
+        except ValueError:
+            return jsonify({"error": "limite debe ser un número."}), 400
+        pedidos = servicios.order_creation.order_index.buscar(limite=limite, **filtros)
+        return jsonify({"pedidos": pedidos, "total": len(pedidos)})
+
+    @app.route('/api/stats', methods=['GET'])
+    def estadisticas_ventas():
+        """
+        Agregados de ventas mantenidos en memoria: totales, serie por día (?desde=&hasta=
+        AAAA-MM-DD), los ?top= SKUs con más ingresos (por defecto 10, máximo 100) y los
+        totales por modalidad de entrega.
+        """
+        rechazo = _sin_acceso()
+        if rechazo is not None:
+            return rechazo
+        try:
+            top = min(max(int(request.args.get("top", 10)), 1), 100)
+        except ValueError:
+            return jsonify({"error": "top debe ser un número."}), 400
+        desde = request.args.get("desde", "").strip() or None
+        hasta = request.args.get("hasta", "").strip() or None
+        return jsonify(servicios.order_creation.sales_stats.resumen(desde=desde, hasta=hasta, top=top))
+
+    return app
+
+app = create_app()
+
+if __name__ == "__main__":
+    app.run(debug=True)
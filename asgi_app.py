@@ -0,0 +1,272 @@
+# asgi_app.py
+"""
+Entrada ASGI con los mismos contratos que app.py (/api/chat) y chats_app.py (/chat),
+más /ready y /metrics. Los turnos esperan a OpenAI y a Pinecone sin ocupar un hilo,
+así un solo proceso mantiene cientos de conversaciones en curso:
+
+    uvicorn asgi_app:app --workers 2
+
+No depende de ningún framework: JSON sobre HTTP y el protocolo lifespan.
+"""
+import asyncio
+import json
+import math
+import secrets
+import time
+from concurrent.futures import ThreadPoolExecutor
+from config.settings import settings
+from functions.tools import FUNCIONES_CACHEABLES, SYSTEM_MESSAGE
+from services.admission import Saturado, SesionOcupada
+from services.container import ServicioNoDisponible, obtener_servicios
+from utils.metrics import EN_CURSO, HTTP, metricas
+
+# Tope del cuerpo de una petición (los historiales de /chat modo clásico viajan completos)
+MAX_CUERPO_BYTES = 4 * 1024 * 1024
+
+def _json(estado, datos, encabezados=None):
+    encabezados = dict(encabezados or {})
+    encabezados["content-type"] = "application/json"
+    return estado, json.dumps(datos, ensure_ascii=False).encode("utf-8"), encabezados
+
+async def _leer_json(receive):
+    """
+    Cuerpo JSON de la petición, o None si falta, es inválido o supera MAX_CUERPO_BYTES.
+    """
+    partes = []
+    total = 0
+    while True:
+        mensaje = await receive()
+        if mensaje["type"] == "http.disconnect":
+            return None
+        cuerpo = mensaje.get("body", b"")
+        total += len(cuerpo)
+        if total > MAX_CUERPO_BYTES:
+            return None
+        partes.append(cuerpo)
+        if not mensaje.get("more_body"):
+            break
+    try:
+        datos = json.loads(b"".join(partes) or b"null")
+    except ValueError:
+        return None
+    return datos if isinstance(datos, dict) else None
+
+async def _enviar(send, estado, cuerpo, encabezados):
+    await send({
+        "type": "http.response.start",
+        "status": estado,
+        "headers": [(k.encode("latin-1"), str(v).encode("latin-1")) for k, v in encabezados.items()]
+    })
+    await send({"type": "http.response.body", "body": cuerpo})
+
+class AsgiApp:
+    """
+    Aplicación ASGI. Los servicios asíncronos se construyen al primer uso (en un hilo)
+    o con el calentamiento que se lanza al arrancar; comparten cachés con los de Flask.
+    """
+
+    def __init__(self, servicios=None):
+        self.servicios = servicios or obtener_servicios()
+        self.rutas = {
+            ("POST", "/api/chat"): self.api_chat,
+            ("POST", "/chat"): self.chat,
+            ("GET", "/ready"): self.ready,
+            ("GET", "/metrics"): self.metrics,
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+
+        manejador = self.rutas.get((scope["method"], scope["path"]))
+        endpoint = scope["path"] if manejador is not None else "desconocido"
+        inicio = time.perf_counter()
+        estado = 500
+        EN_CURSO.inc(endpoint=endpoint)
+        try:
+            if manejador is None:
+                estado, cuerpo, encabezados = _json(404, {"error": "Ruta no encontrada."})
+            else:
+                estado, cuerpo, encabezados = await self._atender(manejador, scope, receive)
+            await _enviar(send, estado, cuerpo, encabezados)
+        finally:
+            EN_CURSO.dec(endpoint=endpoint)
+            HTTP.observar(time.perf_counter() - inicio, endpoint=endpoint, estado=estado)
+
+    async def _atender(self, manejador, scope, receive):
+        try:
+            datos = await _leer_json(receive) if scope["method"] == "POST" else None
+            return await manejador(datos)
+        except Saturado as e:
+            return _json(
+                429, {"error": "Hay muchas solicitudes en este momento, intente nuevamente en unos segundos."},
+                {"retry-after": math.ceil(e.reintentar_en)}
+            )
+        except SesionOcupada:
+            return _json(409, {"error": "Hay otro mensaje de esta sesión en curso."})
+        except ServicioNoDisponible:
+            return _json(503, {"error": "Servicio no disponible, intente nuevamente."})
+        except Exception as e:
+            print(f"[ERROR] Error no controlado en {scope['path']}: {e}")
+            return _json(500, {"error": "Error interno del servidor."})
+
+    # --- Ciclo de vida ---
+
+    async def _lifespan(self, receive, send):
+        while True:
+            mensaje = await receive()
+            if mensaje["type"] == "lifespan.startup":
+                await self.iniciar()
+                await send({"type": "lifespan.startup.complete"})
+            elif mensaje["type"] == "lifespan.shutdown":
+                await self.cerrar()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def iniciar(self):
+        # Pinecone, el almacén de sesiones y el registro de pedidos corren en este pool
+        asyncio.get_running_loop().set_default_executor(
+            ThreadPoolExecutor(max_workers=settings.ASGI_HILOS, thread_name_prefix="asgi")
+        )
+        if settings.WARMUP_ENABLED:
+            self.servicios.iniciar_calentamiento()
+
+    async def cerrar(self):
+        openai_async = self.servicios.construido("async_openai_service")
+        if openai_async is not None:
+            await openai_async.cerrar()
+
+    # --- Rutas ---
+
+    async def ready(self, _datos):
+        listo, detalle = self.servicios.preparado()
+        return _json(200 if listo else 503, detalle)
+
+    async def metrics(self, _datos):
+        return 200, metricas.exportar().encode("utf-8"), {"content-type": "text/plain; version=0.0.4"}
+
+    async def api_chat(self, data):
+        """
+        Igual que /api/chat de app.py: {"session_id", "user_input"} -> {"assistant"}.
+        """
+        if not data:
+            return _json(400, {"error": "Debe enviar un cuerpo JSON."})
+
+        session_id = data.get("session_id")
+        user_input = data.get("user_input", "").strip()
+
+        if not session_id:
+            return _json(400, {"error": "Falta session_id en la petición."})
+
+        servicios = self.servicios
+        session_store = await servicios.obtener_async("session_store")
+        session_locks = await servicios.obtener_async("async_session_locks")
+
+        async with session_locks.adquirir(session_id, settings.SESSION_LOCK_TIMEOUT):
+            if user_input.lower() == "salir":
+                await asyncio.to_thread(session_store.eliminar, session_id)
+                return _json(200, {"message": "Saliendo..."})
+
+            messages = await asyncio.to_thread(session_store.obtener, session_id) or [SYSTEM_MESSAGE]
+            messages.append({"role": "user", "content": user_input})
+            inicio_turno = len(messages)
+
+            # Primer turno: intentar responder desde la caché semántica sin llamar al modelo
+            semantic_cache = await servicios.obtener_async("semantic_cache")
+            embedding = None
+            if semantic_cache is not None and inicio_turno == 2:
+                openai_async = await servicios.obtener_async("async_openai_service")
+                embedding = await openai_async.generar_embedding(user_input)
+                if embedding is not None:
+                    cacheados = semantic_cache.buscar(embedding, user_input)
+                    if cacheados:
+                        messages.extend(cacheados)
+                        await asyncio.to_thread(session_store.guardar, session_id, messages)
+                        return _json(200, {"assistant": cacheados[-1]["content"]})
+
+            engine = await servicios.obtener_async("async_engine")
+            resultado = await engine.ejecutar_turno(messages)
+            await asyncio.to_thread(session_store.guardar, session_id, messages)
+
+            if (embedding is not None and resultado["contenido"]
+                    and set(resultado["funciones"]) <= FUNCIONES_CACHEABLES):
+                semantic_cache.guardar(embedding, messages[inicio_turno:], user_input)
+
+        if resultado["error"]:
+            return _json(500, {"error": resultado["error"]})
+        if resultado["contenido"]:
+            return _json(200, {"assistant": resultado["contenido"]})
+        return _json(200, {"assistant": "", "info": "Asistente no devolvió texto."})
+
+    async def chat(self, data):
+        """
+        Igual que /chat de chats_app.py: modo clásico (el cliente envía el historial)
+        o con session_token.
+        """
+        if not data:
+            return _json(400, {"error": "Debe enviar un cuerpo JSON."})
+        user_input = data.get('mensaje', '').strip()
+
+        if not user_input:
+            return _json(400, {"error": "El campo 'mensaje' está vacío."})
+
+        if 'session_token' in data or (data.get('usar_sesion') and 'messages' not in data):
+            return await self._chat_con_sesion(data.get('session_token'), user_input)
+
+        if user_input.lower() == "salir":
+            return _json(200, {"message": "Saliendo..."})
+
+        messages = data['messages'] if 'messages' in data else [dict(SYSTEM_MESSAGE)]
+        messages.append({"role": "user", "content": user_input})
+
+        engine = await self.servicios.obtener_async("async_engine")
+        resultado = await engine.ejecutar_turno(messages)
+
+        if resultado["error"]:
+            return _json(500, {"error": resultado["error"]})
+        if not resultado["contenido"]:
+            return _json(500, {"error": "El asistente no devolvió texto."})
+        return _json(200, {"respuesta": resultado["contenido"], "messages": messages})
+
+    async def _chat_con_sesion(self, session_token, user_input):
+        if not session_token:
+            # Un token nuevo es único: no hace falta el candado de la sesión
+            return await self._turno_con_sesion(secrets.token_urlsafe(24), user_input, nuevo=True)
+        session_locks = await self.servicios.obtener_async("async_session_locks")
+        async with session_locks.adquirir(session_token, settings.SESSION_LOCK_TIMEOUT):
+            return await self._turno_con_sesion(session_token, user_input, nuevo=False)
+
+    async def _turno_con_sesion(self, session_token, user_input, nuevo):
+        session_store = await self.servicios.obtener_async("session_store")
+        if nuevo:
+            messages = [SYSTEM_MESSAGE]
+        else:
+            messages = await asyncio.to_thread(session_store.obtener, session_token)
+            if messages is None:
+                return _json(404, {"error": "session_token desconocido o expirado."})
+
+        if user_input.lower() == "salir":
+            await asyncio.to_thread(session_store.eliminar, session_token)
+            return _json(200, {"message": "Saliendo..."})
+
+        inicio = len(messages)
+        messages.append({"role": "user", "content": user_input})
+
+        engine = await self.servicios.obtener_async("async_engine")
+        resultado = await engine.ejecutar_turno(messages)
+        await asyncio.to_thread(session_store.guardar, session_token, messages)
+
+        if resultado["error"]:
+            return _json(500, {"error": resultado["error"], "session_token": session_token})
+        if not resultado["contenido"]:
+            return _json(500, {"error": "El asistente no devolvió texto.", "session_token": session_token})
+        return _json(200, {
+            "respuesta": resultado["contenido"],
+            "session_token": session_token,
+            "nuevos_mensajes": messages[inicio:]
+        })
+
+app = AsgiApp()
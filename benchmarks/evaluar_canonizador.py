@@ -0,0 +1,70 @@
+# benchmarks/evaluar_canonizador.py
+"""
+Tasa de colapso del canonizador de consultas: cuántas consultas distintas (ya normalizadas
+como las usa la caché de embeddings) comparten forma canónica y, por tanto, embedding.
+Acepta un archivo de texto (una consulta por línea) o JSONL con "texto" o "query";
+por defecto, la muestra de benchmarks/consultas.txt.
+
+    python -m benchmarks.evaluar_canonizador
+    python -m benchmarks.evaluar_canonizador --consultas consultas_reales.txt --sinonimos sinonimos.json --detalle
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if RAIZ not in sys.path:
+    sys.path.insert(0, RAIZ)
+
+from functions.query_canonicalizer import QueryCanonicalizer
+
+CONSULTAS_POR_DEFECTO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "consultas.txt")
+
+def cargar_consultas(ruta):
+    consultas = []
+    with open(ruta, "r", encoding="utf-8") as f:
+        for linea in f:
+            linea = linea.strip()
+            if not linea:
+                continue
+            if ruta.endswith(".jsonl"):
+                datos = json.loads(linea)
+                linea = datos.get("texto") or datos.get("query") or ""
+            consultas.append(linea)
+    return consultas
+
+def main():
+    parser = argparse.ArgumentParser(description="Tasa de colapso del canonizador de consultas.")
+    parser.add_argument("--consultas", default=CONSULTAS_POR_DEFECTO)
+    parser.add_argument("--sinonimos", default="", help="JSON {variante: forma canónica} adicional.")
+    parser.add_argument("--detalle", action="store_true", help="Muestra los grupos de consultas colapsadas.")
+    args = parser.parse_args()
+
+    canonizador = QueryCanonicalizer.desde_archivo(args.sinonimos) if args.sinonimos else QueryCanonicalizer()
+    consultas = cargar_consultas(args.consultas)
+    resultado = canonizador.evaluar(consultas)
+
+    # Costo por llamada sin la caché de formas canónicas
+    inicio = time.perf_counter()
+    for consulta in consultas:
+        canonizador._calcular(consulta)
+    resultado["us_por_consulta"] = round((time.perf_counter() - inicio) / max(len(consultas), 1) * 1e6, 1)
+
+    for clave, valor in resultado.items():
+        print(f"{clave:>16}: {round(valor, 3) if isinstance(valor, float) else valor}")
+
+    if args.detalle:
+        grupos = defaultdict(set)
+        for consulta in consultas:
+            grupos[canonizador.canonizar(consulta)].add(consulta)
+        for canonica, variantes in sorted(grupos.items()):
+            if len(variantes) > 1:
+                print(f"\n{canonica}")
+                for variante in sorted(variantes):
+                    print(f"    {variante}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+# benchmarks/evaluar_router.py
+"""
+Exactitud del enrutador local de intención sobre un conjunto etiquetado (JSONL texto/intencion).
+Por defecto usa el catálogo sintético de benchmarks/stubs.py; --catalogo permite usar el real.
+
+    python -m benchmarks.evaluar_router
+    python -m benchmarks.evaluar_router --catalogo data/catalogo.csv --umbral 0.85 --clasificador
+"""
+import argparse
+import json
+import os
+import sys
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if RAIZ not in sys.path:
+    sys.path.insert(0, RAIZ)
+
+from benchmarks import stubs
+from functions.intent_router import IntentRouter, ClasificadorBayes
+from functions.lexical_index import LexicalIndex
+from functions.product_cache import ProductRecord
+
+ETIQUETAS_POR_DEFECTO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "intenciones.jsonl")
+
+def cargar_registros(ruta):
+    if not ruta:
+        return [ProductRecord.desde_metadata(p["sku"], p) for p in stubs.catalogo_sintetico()]
+    from services.catalog_ingestion import leer_productos, preparar_producto
+    preparados = (preparar_producto(p) for p in leer_productos(ruta))
+    return [ProductRecord.desde_metadata(p[0], p[2]) for p in preparados if p is not None]
+
+def main():
+    parser = argparse.ArgumentParser(description="Evalúa el enrutador de intención.")
+    parser.add_argument("--etiquetas", default=ETIQUETAS_POR_DEFECTO)
+    parser.add_argument("--catalogo", default="", help="CSV/JSONL del catálogo (por defecto, el sintético).")
+    parser.add_argument("--umbral", type=float, default=0.8)
+    parser.add_argument("--clasificador", action="store_true",
+                        help="Entrenar el clasificador Bayes con la mitad par de los ejemplos y evaluar con la impar.")
+    args = parser.parse_args()
+
+    with open(args.etiquetas, "r", encoding="utf-8") as f:
+        ejemplos = [(e["texto"], e["intencion"]) for e in map(json.loads, f) if e]
+    indice = LexicalIndex(cargar_registros(args.catalogo))
+
+    clasificador = None
+    if args.clasificador:
+        clasificador = ClasificadorBayes().entrenar(ejemplos[0::2])
+        ejemplos = ejemplos[1::2]
+
+    router = IntentRouter(cobertura=indice.cobertura, clasificador=clasificador, umbral=args.umbral)
+    resultado = router.evaluar(ejemplos)
+    print(json.dumps(resultado, indent=2, ensure_ascii=False))
+
+    print("\nErrores:")
+    for texto, esperada in ejemplos:
+        decision = router.clasificar(texto)
+        predicha = decision.intencion if decision.intencion in ("busqueda", "pedido") else "otro"
+        real = esperada if esperada in ("busqueda", "pedido") else "otro"
+        if predicha != real:
+            print(f"  {texto!r}: esperada={esperada} predicha={decision.intencion} ({decision.confianza})")
+
+if __name__ == "__main__":
+    main()
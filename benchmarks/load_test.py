@@ -0,0 +1,281 @@
+# benchmarks/load_test.py
+"""
+Prueba de carga offline: reproduce conversaciones de varios turnos contra app.py, chats_app.py
+o asgi_app.py con N clientes concurrentes, usando los sustitutos de benchmarks/stubs.py (sin red ni costo).
+
+    python -m benchmarks.load_test --app api --clientes 8 --conversaciones 100
+    python -m benchmarks.load_test --app chats --latencia-chat log:0.8:0.5 --memoria
+    python -m benchmarks.load_test --servidor asgi --clientes 200 --conversaciones 400
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if RAIZ not in sys.path:
+    sys.path.insert(0, RAIZ)
+
+from benchmarks import stubs
+
+GUIONES_POR_DEFECTO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "conversaciones.json")
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p / 100))]
+
+def rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+class ClienteApi:
+    """Conversación contra /api/chat (historial en el servidor por session_id)."""
+
+    def __init__(self):
+        self.session_id = uuid.uuid4().hex
+
+    def peticion(self, texto):
+        return "/api/chat", {"session_id": self.session_id, "user_input": texto}
+
+    def procesar(self, estado, datos):
+        pass
+
+    def cierre(self):
+        return "/api/chat", {"session_id": self.session_id, "user_input": "salir"}
+
+class ClienteChats:
+    """Conversación contra /chat en modo clásico (el cliente reenvía el historial completo)."""
+
+    def __init__(self):
+        self.messages = None
+
+    def peticion(self, texto):
+        cuerpo = {"mensaje": texto}
+        if self.messages is not None:
+            cuerpo["messages"] = self.messages
+        return "/chat", cuerpo
+
+    def procesar(self, estado, datos):
+        if estado == 200:
+            self.messages = datos["messages"]
+
+    def cierre(self):
+        return None
+
+class ClienteChatsSesion:
+    """Conversación contra /chat con session_token."""
+
+    def __init__(self):
+        self.token = None
+
+    def peticion(self, texto):
+        cuerpo = {"mensaje": texto}
+        if self.token:
+            cuerpo["session_token"] = self.token
+        else:
+            cuerpo["usar_sesion"] = True
+        return "/chat", cuerpo
+
+    def procesar(self, estado, datos):
+        if estado == 200:
+            self.token = datos["session_token"]
+
+    def cierre(self):
+        if self.token:
+            return "/chat", {"mensaje": "salir", "session_token": self.token}
+        return None
+
+CLIENTES = {"api": ClienteApi, "chats": ClienteChats, "chats-sesion": ClienteChatsSesion}
+
+def cargar_app(nombre, servidor="flask"):
+    if servidor == "asgi":
+        import asgi_app as modulo
+    elif nombre == "api":
+        import app as modulo
+    else:
+        import chats_app as modulo
+    return modulo.app
+
+def ejecutar(app, clase_cliente, guiones, clientes, conversaciones):
+    """
+    Clientes en hilos contra una app Flask (test_client).
+    """
+    latencias = []
+    estados = {}
+    lock = threading.Lock()
+    siguiente = iter(range(conversaciones))
+
+    def trabajador():
+        http = app.test_client()
+        while True:
+            with lock:
+                i = next(siguiente, None)
+            if i is None:
+                return
+            conversacion = clase_cliente()
+            for texto in guiones[i % len(guiones)]:
+                ruta, cuerpo = conversacion.peticion(texto)
+                inicio = time.perf_counter()
+                r = http.post(ruta, json=cuerpo)
+                duracion = time.perf_counter() - inicio
+                conversacion.procesar(r.status_code, r.get_json())
+                with lock:
+                    latencias.append(duracion)
+                    estados[r.status_code] = estados.get(r.status_code, 0) + 1
+            cierre = conversacion.cierre()
+            if cierre:
+                http.post(cierre[0], json=cierre[1])
+
+    hilos = [threading.Thread(target=trabajador, name=f"cliente-{n}") for n in range(clientes)]
+    inicio = time.perf_counter()
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    return latencias, estados, time.perf_counter() - inicio
+
+async def post_asgi(app, ruta, cuerpo):
+    """
+    POST en proceso a una app ASGI (sin servidor ni sockets). Devuelve (estado, json).
+    """
+    datos = json.dumps(cuerpo).encode("utf-8")
+    pendiente = [{"type": "http.request", "body": datos, "more_body": False}]
+    respuesta = {"estado": None, "partes": []}
+
+    async def receive():
+        if pendiente:
+            return pendiente.pop()
+        await asyncio.Event().wait()
+
+    async def send(mensaje):
+        if mensaje["type"] == "http.response.start":
+            respuesta["estado"] = mensaje["status"]
+        else:
+            respuesta["partes"].append(mensaje.get("body", b""))
+
+    scope = {"type": "http", "method": "POST", "path": ruta, "headers": [(b"content-type", b"application/json")]}
+    await app(scope, receive, send)
+    return respuesta["estado"], json.loads(b"".join(respuesta["partes"]) or b"null")
+
+async def ejecutar_asgi(app, clase_cliente, guiones, clientes, conversaciones):
+    """
+    Clientes como tareas de asyncio contra una app ASGI, en un solo hilo.
+    """
+    latencias = []
+    estados = {}
+    siguiente = iter(range(conversaciones))
+
+    async def trabajador():
+        for i in siguiente:
+            conversacion = clase_cliente()
+            for texto in guiones[i % len(guiones)]:
+                ruta, cuerpo = conversacion.peticion(texto)
+                inicio = time.perf_counter()
+                estado, datos = await post_asgi(app, ruta, cuerpo)
+                latencias.append(time.perf_counter() - inicio)
+                estados[estado] = estados.get(estado, 0) + 1
+                conversacion.procesar(estado, datos)
+            cierre = conversacion.cierre()
+            if cierre:
+                await post_asgi(app, *cierre)
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(trabajador() for _ in range(clientes)))
+    return latencias, estados, time.perf_counter() - inicio
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga offline de /api/chat y /chat.")
+    parser.add_argument("--app", choices=sorted(CLIENTES), default="api")
+    parser.add_argument("--servidor", choices=["flask", "asgi"], default="flask",
+                        help="flask: app.py/chats_app.py con un hilo por cliente; asgi: asgi_app.py en un event loop.")
+    parser.add_argument("--clientes", type=int, default=8, help="Clientes concurrentes.")
+    parser.add_argument("--conversaciones", type=int, default=50, help="Conversaciones en total.")
+    parser.add_argument("--guiones", default=GUIONES_POR_DEFECTO, help="JSON con una lista de conversaciones (listas de mensajes).")
+    parser.add_argument("--latencia-chat", default="log:0.8:0.4", help='"0.5", "0.2-0.9" o "log:mediana:sigma" (segundos).')
+    parser.add_argument("--latencia-embedding", default="log:0.05:0.3")
+    parser.add_argument("--latencia-indice", default="log:0.03:0.3")
+    parser.add_argument("--productos", type=int, default=2000, help="Tamaño del catálogo sintético.")
+    parser.add_argument("--calentamiento", type=int, default=2, help="Conversaciones previas no medidas.")
+    parser.add_argument("--memoria", action="store_true", help="Medir asignaciones con tracemalloc (más lento).")
+    parser.add_argument("--json", action="store_true", help="Imprimir el resultado como JSON.")
+    args = parser.parse_args()
+
+    stubs.preparar_entorno()
+    fake_openai, _ = stubs.instalar(
+        latencia_chat=stubs.Latencia.desde_texto(args.latencia_chat),
+        latencia_embedding=stubs.Latencia.desde_texto(args.latencia_embedding),
+        latencia_indice=stubs.Latencia.desde_texto(args.latencia_indice),
+        productos=stubs.catalogo_sintetico(args.productos)
+    )
+    app = cargar_app(args.app, args.servidor)
+    with open(args.guiones, "r", encoding="utf-8") as f:
+        guiones = json.load(f)
+    clase_cliente = CLIENTES[args.app]
+
+    bucle = None
+    if args.servidor == "asgi":
+        bucle = asyncio.new_event_loop()
+        bucle.run_until_complete(app.iniciar())
+        correr = lambda clientes, n: bucle.run_until_complete(ejecutar_asgi(app, clase_cliente, guiones, clientes, n))
+    else:
+        correr = lambda clientes, n: ejecutar(app, clase_cliente, guiones, clientes, n)
+
+    if args.calentamiento:
+        correr(1, args.calentamiento)
+
+    if args.memoria:
+        tracemalloc.start()
+    rss_inicio = rss_mb()
+    llamadas_chat = fake_openai.llamadas_chat
+    llamadas_embedding = fake_openai.llamadas_embedding
+    tokens_prompt = fake_openai.tokens_prompt
+    latencias, estados, duracion = correr(args.clientes, args.conversaciones)
+    if bucle is not None:
+        bucle.run_until_complete(app.cerrar())
+        bucle.close()
+
+    resultado = {
+        "app": args.app,
+        "servidor": args.servidor,
+        "clientes": args.clientes,
+        "conversaciones": args.conversaciones,
+        "peticiones": len(latencias),
+        "estados": {str(k): v for k, v in sorted(estados.items())},
+        "segundos": round(duracion, 3),
+        "peticiones_por_segundo": round(len(latencias) / duracion, 2) if duracion else 0.0,
+        "p50_ms": round(percentil(latencias, 50) * 1000, 1),
+        "p95_ms": round(percentil(latencias, 95) * 1000, 1),
+        "p99_ms": round(percentil(latencias, 99) * 1000, 1),
+        "max_ms": round(max(latencias, default=0.0) * 1000, 1),
+        "chat_completions_por_turno": round((fake_openai.llamadas_chat - llamadas_chat) / len(latencias), 2) if latencias else 0.0,
+        "tokens_prompt_por_turno": round((fake_openai.tokens_prompt - tokens_prompt) / len(latencias), 1) if latencias else 0.0,
+        "embeddings_por_turno": round((fake_openai.llamadas_embedding - llamadas_embedding) / len(latencias), 2) if latencias else 0.0,
+        "rss_mb": round(rss_mb(), 1),
+        "rss_crecimiento_mb": round(rss_mb() - rss_inicio, 1)
+    }
+    if args.memoria:
+        actual, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        resultado["tracemalloc_retenido_mb"] = round(actual / 2 ** 20, 2)
+        resultado["tracemalloc_pico_mb"] = round(pico / 2 ** 20, 2)
+
+    if args.json:
+        print(json.dumps(resultado, indent=2))
+    else:
+        print("\n=== Resultado ===")
+        for clave, valor in resultado.items():
+            print(f"{clave:>28}: {valor}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+# benchmarks/micro.py
+"""
+Micro-benchmarks de las funciones del asistente, sin red (benchmarks/stubs.py con latencia 0):
+- buscar_producto por el camino léxico, por el vectorial con caché de embeddings y sin ella.
+- buscar_productos con varias consultas a la vez.
+- crear_pedido con cada modo de fsync del log de ventas.
+- /api/stats: resumen de los agregados incrementales frente a recorrer el log completo.
+
+    python -m benchmarks.micro --repeticiones 2000
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if RAIZ not in sys.path:
+    sys.path.insert(0, RAIZ)
+
+from benchmarks import stubs
+
+def medir(nombre, funcion, argumentos, repeticiones):
+    """
+    Ejecuta funcion(*argumentos[i % n]) `repeticiones` veces y reporta µs por operación.
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        funcion(*argumentos[0])
+        inicio = time.perf_counter()
+        for i in range(repeticiones):
+            funcion(*argumentos[i % len(argumentos)])
+        duracion = time.perf_counter() - inicio
+    por_operacion = duracion / repeticiones
+    print(f"{nombre:<42} {por_operacion * 1e6:>10.1f} µs/op {1 / por_operacion:>12.0f} op/s")
+
+def benchmark_busqueda(repeticiones, productos):
+    from services.openai_service import OpenAIService
+    from functions.product_search import ProductSearch
+
+    catalogo = stubs.catalogo_sintetico(productos)
+    _, vectores = stubs.instalar(productos=catalogo)
+    openai_service = OpenAIService()
+    with contextlib.redirect_stdout(io.StringIO()):
+        product_search = ProductSearch(vectores, openai_service)
+        product_search.precargar_cache()
+
+    exactas = [(p["nombre"],) for p in catalogo[:200]]
+    medir("buscar_producto (léxico, nombre exacto)", product_search.buscar_producto, exactas, repeticiones)
+
+    repetidas = [(f"algo para tomar {i}",) for i in range(50)]
+    medir("buscar_producto (vectorial, embedding en caché)", product_search.buscar_producto, repetidas, repeticiones)
+
+    contador = iter(range(10 ** 9))
+    nuevas = lambda: product_search.buscar_producto(f"consulta nueva {next(contador)}")
+    medir("buscar_producto (vectorial, embedding nuevo)", nuevas, [()], repeticiones)
+
+    lotes = [([f"producto {i}", f"otro producto {i}", catalogo[i]["nombre"]],) for i in range(50)]
+    medir("buscar_productos (3 consultas, en caché)", product_search.buscar_productos, lotes, repeticiones)
+
+def benchmark_pedidos(repeticiones):
+    from functions.order_creation import OrderCreation
+    from services.order_log import OrderLog
+
+    datos_cliente = {"nombre": "Cliente", "telefono": "999999999", "direccion": "Av. 123", "modalidad_entrega": "delivery"}
+    productos = [{"nombre": "Coca cola Zero 500 ML", "sku": "7750000000001", "precio_bayovar": 3.5}]
+    for modo in ("nunca", "intervalo", "siempre"):
+        directorio = tempfile.mkdtemp(prefix=f"ventas_{modo}_")
+        with contextlib.redirect_stdout(io.StringIO()):
+            order_creation = OrderCreation(OrderLog(directorio, fsync=modo))
+        # fsync por pedido es mucho más lento; se acota para no gastar el disco en vano
+        n = repeticiones if modo != "siempre" else min(repeticiones, 200)
+        medir(f"crear_pedido (fsync={modo})", order_creation.crear_pedido, [(datos_cliente, productos)], n)
+
+def benchmark_estadisticas(repeticiones, pedidos):
+    from services.order_log import OrderLog
+    from services.sales_stats import SalesStats
+
+    directorio = tempfile.mkdtemp(prefix="ventas_stats_")
+    order_log = OrderLog(directorio, fsync="nunca")
+    for i in range(pedidos):
+        order_log.agregar({"Pedido": {
+            "id_unico": str(i), "fecha": f"2026-{1 + i % 12:02d}-{1 + i % 28:02d}T12:00:00",
+            "datos_cliente": {"modalidad_entrega": ("delivery", "recojo")[i % 2]},
+            "productos": [{"nombre": f"Producto {i % 500}", "sku": str(7750000000000 + i % 500), "precio_bayovar": 3.5}]
+        }})
+    with contextlib.redirect_stdout(io.StringIO()):
+        sales_stats = SalesStats(order_log)
+        sales_stats.cargar()
+
+    def recorrido_completo():
+        por_dia = {}
+        for _, _, registro in order_log.iterar():
+            dia = registro["Pedido"]["fecha"][:10]
+            por_dia[dia] = por_dia.get(dia, 0.0) + sum(p["precio_bayovar"] for p in registro["Pedido"]["productos"])
+        return por_dia
+
+    medir(f"estadísticas ({pedidos} pedidos, agregados)", sales_stats.resumen, [()], repeticiones)
+    medir(f"estadísticas ({pedidos} pedidos, recorriendo el log)", recorrido_completo, [()], max(repeticiones // 100, 3))
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks de buscar_producto y crear_pedido.")
+    parser.add_argument("--repeticiones", type=int, default=1000)
+    parser.add_argument("--productos", type=int, default=2000, help="Tamaño del catálogo sintético.")
+    parser.add_argument("--pedidos", type=int, default=20000, help="Pedidos del log para las estadísticas.")
+    args = parser.parse_args()
+
+    stubs.preparar_entorno()
+    benchmark_busqueda(args.repeticiones, args.productos)
+    benchmark_pedidos(args.repeticiones)
+    benchmark_estadisticas(args.repeticiones, args.pedidos)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+# benchmarks/stubs.py
+"""
+Sustitutos locales de OpenAI y Pinecone para medir sin red ni costo.
+Llamar a preparar_entorno() antes de importar config.settings (o app.py/chats_app.py).
+"""
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+
+class Latencia:
+    """
+    Distribución de latencia simulada, en segundos.
+    tipo: "fija", "uniforme" o "lognormal" (mediana y sigma).
+    """
+
+    def __init__(self, tipo="lognormal", mediana=0.0, sigma=0.5, minimo=0.0, maximo=None):
+        self.tipo = tipo
+        self.mediana = mediana
+        self.sigma = sigma
+        self.minimo = minimo
+        self.maximo = maximo if maximo is not None else mediana * 2
+
+    @classmethod
+    def desde_texto(cls, texto):
+        """
+        "0", "0.2" (fija), "0.1-0.4" (uniforme) o "log:0.8:0.5" (lognormal mediana:sigma).
+        """
+        if texto.startswith("log:"):
+            _, mediana, sigma = texto.split(":")
+            return cls("lognormal", float(mediana), float(sigma))
+        if "-" in texto:
+            minimo, maximo = texto.split("-")
+            return cls("uniforme", minimo=float(minimo), maximo=float(maximo))
+        return cls("fija", float(texto))
+
+    def muestrear(self):
+        if self.tipo == "fija":
+            return self.mediana
+        if self.tipo == "uniforme":
+            return random.uniform(self.minimo, self.maximo)
+        if self.mediana <= 0:
+            return 0.0
+        return random.lognormvariate(0, self.sigma) * self.mediana
+
+    def esperar(self):
+        segundos = self.muestrear()
+        if segundos > 0:
+            time.sleep(segundos)
+
+    async def esperar_async(self):
+        segundos = self.muestrear()
+        if segundos > 0:
+            await asyncio.sleep(segundos)
+
+def preparar_entorno(directorio=None):
+    """
+    Variables de entorno para que los servicios no toquen datos reales ni la red.
+    """
+    directorio = directorio or tempfile.mkdtemp(prefix="chat_ventas_bench_")
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    os.environ.setdefault("PINECONE_API_KEY", "benchmark")
+    os.environ["EMBEDDING_CACHE_FILE"] = ""
+    os.environ["VENTAS_FILE"] = os.path.join(directorio, "ventas.json")
+    os.environ["VENTAS_LOG_DIR"] = os.path.join(directorio, "ventas_log")
+    os.environ["SESSION_BACKEND"] = "memoria"
+    os.environ["CATALOGO_VERSION_FILE"] = os.path.join(directorio, "catalogo_version")
+    os.environ["INGESTA_ESTADO_FILE"] = os.path.join(directorio, "ingesta_estado.sqlite3")
+    os.environ["SKU_ALIAS_FILE"] = os.path.join(directorio, "alias_sku.sqlite3")
+    return directorio
+
+# --- Catálogo sintético ---
+
+MARCAS = ["Coca cola", "Inca Kola", "Sprite", "Fanta", "Gloria", "Laive", "Costeño", "Bimbo", "Don Vittorio", "Alicorp"]
+TIPOS = ["Classic", "Zero", "Light", "Original", "Extra", "Integral", "Familiar", "Premium"]
+TAMANOS = ["500 ML", "1 LT", "1.5 LT", "2.25 LT", "400 G", "1 KG", "5 KG"]
+
+def catalogo_sintetico(n=2000, semilla=7):
+    aleatorio = random.Random(semilla)
+    productos = []
+    for i in range(n):
+        nombre = f"{aleatorio.choice(MARCAS)} {aleatorio.choice(TIPOS)} {aleatorio.choice(TAMANOS)}"
+        productos.append({
+            "sku": f"775{i:010d}",
+            "nombre": nombre,
+            "precio_base": round(aleatorio.uniform(1.5, 45.0), 2)
+        })
+    return productos
+
+def _semilla(texto):
+    return int.from_bytes(hashlib.blake2b(texto.encode("utf-8"), digest_size=8).digest(), "big")
+
+def embedding_falso(texto, dimension=1536):
+    aleatorio = random.Random(_semilla(texto.casefold()))
+    return [aleatorio.uniform(-1.0, 1.0) for _ in range(dimension)]
+
+class _Match:
+    __slots__ = ("id", "score", "metadata")
+
+    def __init__(self, id, score, metadata):
+        self.id = id
+        self.score = score
+        self.metadata = metadata
+
+class FakeVectorService:
+    """
+    Sustituto de PineconeService: query_index/fetch_metadata/upsert_vectores con latencia simulada.
+    Los resultados son deterministas a partir de las primeras componentes del vector.
+    """
+
+    def __init__(self, productos=None, latencia=None):
+        self.productos = productos or catalogo_sintetico()
+        self.latencia = latencia or Latencia("fija", 0.0)
+        self._por_id = {p["sku"]: p for p in self.productos}
+
+    def query_index(self, vector, top_k=5, namespace="", include_metadata=True):
+        self.latencia.esperar()
+        aleatorio = random.Random(_semilla(repr(vector[:4])))
+        elegidos = aleatorio.sample(self.productos, min(top_k, len(self.productos)))
+        return [
+            _Match(p["sku"], 1.0 - i * 0.01, dict(p) if include_metadata else None)
+            for i, p in enumerate(elegidos)
+        ]
+
+    def metadatos_completos(self):
+        return [(p["sku"], dict(p)) for p in self.productos]
+
+    def fetch_metadata(self, ids, namespace=""):
+        self.latencia.esperar()
+        return {id_: dict(self._por_id[id_]) for id_ in ids if id_ in self._por_id}
+
+    def upsert_vectores(self, vectores, namespace=""):
+        self.latencia.esperar()
+        return True
+
+# --- OpenAI ---
+
+class FakeOpenAI:
+    """
+    Reemplaza openai.ChatCompletion.create/acreate y openai.Embedding.create/acreate.
+    El modelo simulado sigue un guion simple a partir del último mensaje:
+    - usuario que pide un producto -> function_call buscar_producto,
+    - usuario que confirma con sus datos -> function_call crear_pedido,
+    - resultado de función o charla -> respuesta de texto.
+    """
+
+    PALABRAS_PEDIDO = ("confirmo", "mis datos", "mi nombre")
+    PALABRAS_BUSQUEDA = ("tienes", "tienen", "quiero", "busco", "hay", "precio")
+
+    def __init__(self, latencia_chat=None, latencia_embedding=None, productos=None):
+        self.latencia_chat = latencia_chat or Latencia("fija", 0.0)
+        self.latencia_embedding = latencia_embedding or Latencia("fija", 0.0)
+        self.productos = productos or catalogo_sintetico()
+        self.llamadas_chat = 0
+        self.llamadas_embedding = 0
+        self.tokens_prompt = 0
+        self._lock = threading.Lock()
+        self._originales = None
+
+    def instalar(self):
+        import openai
+        from openai.openai_object import OpenAIObject
+        self._objeto = OpenAIObject
+        self._originales = (
+            openai.ChatCompletion.create, openai.Embedding.create,
+            openai.ChatCompletion.acreate, openai.Embedding.acreate
+        )
+        openai.ChatCompletion.create = self.chat_create
+        openai.Embedding.create = self.embedding_create
+        openai.ChatCompletion.acreate = self.chat_acreate
+        openai.Embedding.acreate = self.embedding_acreate
+        return self
+
+    def desinstalar(self):
+        import openai
+        if self._originales:
+            (openai.ChatCompletion.create, openai.Embedding.create,
+             openai.ChatCompletion.acreate, openai.Embedding.acreate) = self._originales
+
+    def embedding_create(self, input, model, **kwargs):
+        self.latencia_embedding.esperar()
+        return self._embedding(input)
+
+    async def embedding_acreate(self, input, model, **kwargs):
+        await self.latencia_embedding.esperar_async()
+        return self._embedding(input)
+
+    def _embedding(self, input):
+        with self._lock:
+            self.llamadas_embedding += 1
+        textos = input if isinstance(input, list) else [input]
+        return self._objeto.construct_from({
+            "data": [{"index": i, "embedding": embedding_falso(t)} for i, t in enumerate(textos)],
+            "usage": {"prompt_tokens": sum(len(t) // 4 + 1 for t in textos), "total_tokens": 0}
+        })
+
+    def _decidir(self, messages):
+        ultimo = messages[-1]
+        if ultimo.get("role") in ("function", "tool"):
+            return {"role": "assistant", "content": "Encontré estas opciones para ti. ¿Deseas alguna?"}
+        texto = (ultimo.get("content") or "").lower()
+        if any(p in texto for p in self.PALABRAS_PEDIDO):
+            producto = self._ultimo_mostrado(messages) or self.productos[_semilla(texto) % len(self.productos)]
+            argumentos = {
+                "datos_cliente": {
+                    "nombre": "Cliente Benchmark", "telefono": "999999999",
+                    "direccion": "Av. Siempre Viva 123", "modalidad_entrega": "delivery"
+                },
+                "productos": [{"nombre": producto["nombre"], "sku": producto["sku"], "precio_bayovar": producto["precio_base"]}]
+            }
+            return {"role": "assistant", "content": None,
+                    "function_call": {"name": "crear_pedido", "arguments": json.dumps(argumentos)}}
+        if any(p in texto for p in self.PALABRAS_BUSQUEDA):
+            consulta = re.sub(r"^\W*(tienes|tienen|quiero|busco|hay|precio de)\s+", "", texto).strip(" ?¿!")
+            return {"role": "assistant", "content": None,
+                    "function_call": {"name": "buscar_producto", "arguments": json.dumps({"query": consulta})}}
+        return {"role": "assistant", "content": "¡Hola! ¿Qué producto estás buscando?"}
+
+    @staticmethod
+    def _ultimo_mostrado(messages):
+        """
+        Primer producto del último resultado de búsqueda (tabla compacta o JSON), como haría el modelo.
+        """
+        for mensaje in reversed(messages):
+            if mensaje.get("role") not in ("function", "tool"):
+                continue
+            contenido = mensaje.get("content") or ""
+            if contenido.startswith("ref|"):
+                for fila in contenido.splitlines()[1:]:
+                    partes = fila.split("|")
+                    if len(partes) == 3:
+                        return {"sku": partes[0], "nombre": partes[1], "precio_base": float(partes[2])}
+            else:
+                try:
+                    datos = json.loads(contenido)
+                except ValueError:
+                    continue
+                productos = datos.get("productos_encontrados") if isinstance(datos, dict) else None
+                if productos:
+                    return {"sku": productos[0]["sku"], "nombre": productos[0]["nombre"],
+                            "precio_base": productos[0]["precio_bayovar"]}
+        return None
+
+    def chat_create(self, **kwargs):
+        self.latencia_chat.esperar()
+        return self._chat(kwargs)
+
+    async def chat_acreate(self, **kwargs):
+        await self.latencia_chat.esperar_async()
+        return self._chat(kwargs)
+
+    def _chat(self, kwargs):
+        mensaje = self._decidir(kwargs["messages"])
+        prompt = sum(len(m.get("content") or "") for m in kwargs["messages"]) // 4
+        with self._lock:
+            self.llamadas_chat += 1
+            self.tokens_prompt += prompt
+        if kwargs.get("stream"):
+            return self._stream(mensaje)
+        return self._objeto.construct_from({
+            "choices": [{"index": 0, "message": mensaje, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt, "completion_tokens": 20, "total_tokens": prompt + 20}
+        })
+
+    def _stream(self, mensaje):
+        if mensaje.get("function_call"):
+            fc = mensaje["function_call"]
+            yield self._objeto.construct_from({"choices": [{"delta": {"function_call": {"name": fc["name"], "arguments": ""}}}]})
+            yield self._objeto.construct_from({"choices": [{"delta": {"function_call": {"arguments": fc["arguments"]}}}]})
+            return
+        for palabra in mensaje["content"].split(" "):
+            yield self._objeto.construct_from({"choices": [{"delta": {"content": palabra + " "}}]})
+
+def instalar(latencia_chat=None, latencia_embedding=None, latencia_indice=None, productos=None):
+    """
+    Instala los sustitutos: parchea openai y services.vector_store.crear_servicio_vectorial.
+    Debe llamarse antes de importar app.py, chats_app.py o asgi_app.py. Devuelve (FakeOpenAI, FakeVectorService).
+    """
+    import services.vector_store
+    from services.openai_service import OpenAIService
+    productos = productos or catalogo_sintetico()
+    # El calentamiento abriría una conexión real con OpenAI
+    OpenAIService.calentar = lambda self: None
+    fake_openai = FakeOpenAI(latencia_chat, latencia_embedding, productos).instalar()
+    fake_vectores = FakeVectorService(productos, latencia_indice)
+    services.vector_store.crear_servicio_vectorial = lambda: fake_vectores
+    return fake_openai, fake_vectores
@@ -10,186 +10,116 @@ current_dir = os.path.dirname(os.path.abspath(__file__))
 if current_dir not in sys.path:
     sys.path.append(current_dir)
 
+import secrets
+from contextlib import nullcontext
 from flask import Flask, request, jsonify
-from services.pinecone_service import PineconeService
-from services.openai_service import OpenAIService
-from functions.product_search import ProductSearch
-from functions.order_creation import OrderCreation
-from utils.helpers import cargar_json
-import json
-
-app = Flask(__name__)
-
-# Inicializar servicios y funciones
-pinecone_service = PineconeService()
-openai_service = OpenAIService()
-
-product_search = ProductSearch(pinecone_service, openai_service)
-order_creation = OrderCreation()
-
-# Definir tools con JSON Schema
-tools = [
-    {
-        "name": "buscar_producto",
-        "description": "Busca productos en Pinecone dada una query y retorna una lista con sus datos.",
-        "parameters": {
-            "type": "object",
-            "properties": {
-                "query": {
-                    "type": "string",
-                    "description": "Texto que describe lo que el usuario busca, e.g. 'coca cola'."
-                }
-            },
-            "required": ["query"],
-            "additionalProperties": False
-        }
-    },
-    {
-        "name": "crear_pedido",
-        "description": "Crea un pedido con los datos del cliente y los productos elegidos.",
-        "parameters": {
-            "type": "object",
-            "properties": {
-                "datos_cliente": {
-                    "type": "object",
-                    "properties": {
-                        "nombre": {"type": "string"},
-                        "telefono": {"type": "string"},
-                        "direccion": {"type": "string"},
-                        "modalidad_entrega": {"type": "string"}
-                    },
-                    "required": ["nombre", "telefono", "direccion", "modalidad_entrega"]
-                },
-                "productos": {
-                    "type": "array",
-                    "items": {
-                        "type": "object",
-                        "properties": {
-                            "nombre": {"type": "string"},
-                            "sku": {"type": "string"},
-                            "precio_bayovar": {"type": "number"}
-                        },
-                        "required": ["nombre", "sku", "precio_bayovar"]
-                    }
-                }
-            },
-            "required": ["datos_cliente", "productos"],
-            "additionalProperties": False
-        }
-    }
-]
-
-@app.route('/chat', methods=['POST'])
-def chat():
-    data = request.get_json()
-    user_input = data.get('mensaje', '').strip()
-
-    if not user_input:
-        return jsonify({"error": "El campo 'mensaje' está vacío."}), 400
-    if user_input.lower() == "salir":
-        return jsonify({"message": "Saliendo..."}), 200
-
-    # Inicializar historial de mensajes si no existe
-    if 'messages' not in data:
-        messages = [
-            {
-                "role": "system",
-                "content": (
-                    "Eres un asistente de ventas que puede buscar productos en Pinecone y crear pedidos.\n"
-                    "Reglas:\n"
-                    "- Usa la función 'buscar_producto' cuando el usuario te pida buscar algo (por ejemplo, '¿Tienes alguna coca cola?').\n"
-                    "- Cuando el usuario confirme la compra y proporcione sus datos, usa la función 'crear_pedido'.\n"
-                    "- No muestres el SKU en la conversación, pero sí inclúyelo cuando crees el pedido.\n"
-                    "- Muestra solo precios de Bayóvar (precio_bayovar).\n"
-                    "- Después de crear el pedido, saluda con un mensaje como 'Perfecto, hemos tomado tu pedido...'\n"
-                )
-            }
-        ]
-    else:
-        messages = data['messages']
+from config.settings import settings
+from services.admission import instalar_admision
+from services.container import obtener_servicios, instalar_preparacion
+from functions.tools import SYSTEM_MESSAGE
+from utils.metrics import instrumentar_app
+
+def create_app(servicios=None):
+    """
+    Crea la app Flask; los servicios se construyen al primer uso o durante el calentamiento.
+    """
+    servicios = servicios or obtener_servicios()
+    app = Flask(__name__)
+    instrumentar_app(app)
+    instalar_preparacion(app, servicios)
+    instalar_admision(app)
+
+    @app.route('/chat', methods=['POST'])
+    def chat():
+        """
+        Dos modos de uso:
+        - Clásico: el cliente envía {"mensaje", "messages"} y recibe el historial completo.
+        - Con sesión (opt-in): el cliente envía {"mensaje", "session_token"} (o {"mensaje",
+          "usar_sesion": true} para empezar) y recibe solo el token y los mensajes nuevos.
+        """
+        data = request.get_json()
+        if not data:
+            return jsonify({"error": "Debe enviar un cuerpo JSON."}), 400
+        user_input = data.get('mensaje', '').strip()
+
+        if not user_input:
+            return jsonify({"error": "El campo 'mensaje' está vacío."}), 400
+
+        if 'session_token' in data or (data.get('usar_sesion') and 'messages' not in data):
+            return chat_con_sesion(servicios, data.get('session_token'), user_input)
+
+        if user_input.lower() == "salir":
+            return jsonify({"message": "Saliendo..."}), 200
+
+        # Inicializar historial de mensajes si no existe
+        if 'messages' not in data:
+            messages = [dict(SYSTEM_MESSAGE)]
+        else:
+            messages = data['messages']
 
-    # Añadir mensaje del usuario
-    messages.append({"role": "user", "content": user_input})
+        # Añadir mensaje del usuario
+        messages.append({"role": "user", "content": user_input})
 
-    # Llamar a la API de OpenAI
-    response = openai_service.chat_completion(
-        messages=messages,
-        functions=tools
-    )
-
-    if response is None:
-        return jsonify({"error": "Error al comunicarse con OpenAI."}), 500
-
-    assistant_msg = response
-    tool_call = assistant_msg.get("function_call")
-
-    if not tool_call:
-        # Respuesta normal
-        assistant_content = assistant_msg.get("content")
-        if assistant_content:
-            messages.append({"role": "assistant", "content": assistant_content})
-            return jsonify({
-                "respuesta": assistant_content,
-                "messages": messages
-            })
-        else:
-            return jsonify({"error": "El asistente no devolvió texto."}), 500
+        # Ejecutar el ciclo modelo -> funciones -> modelo
+        resultado = servicios.engine.ejecutar_turno(messages)
 
-    # IA está invocando una función
-    fn_name = tool_call.get("name")
-    fn_args_str = tool_call.get("arguments")
+        if resultado["error"]:
+            return jsonify({"error": resultado["error"]}), 500
 
-    fn_args = cargar_json(fn_args_str)
+        assistant_content = resultado["contenido"]
+        if not assistant_content:
+            return jsonify({"error": "El asistente no devolvió texto."}), 500
 
-    # Ejecutar la función real
-    if fn_name == "buscar_producto":
-        query_text = fn_args.get("query", "")
-        funcion_resultado = product_search.buscar_producto(query_text)
+        return jsonify({
+            "respuesta": assistant_content,
+            "messages": messages
+        })
 
-    elif fn_name == "crear_pedido":
-        datos_cliente = fn_args.get("datos_cliente", {})
-        productos = fn_args.get("productos", [])
-        funcion_resultado = order_creation.crear_pedido(datos_cliente, productos)
+    return app
 
+def chat_con_sesion(servicios, session_token, user_input):
+    # Un token nuevo es único; solo los existentes pueden recibir mensajes concurrentes
+    if session_token:
+        candado = servicios.session_locks.adquirir(session_token, settings.SESSION_LOCK_TIMEOUT)
     else:
-        funcion_resultado = {"error": f"Función '{fn_name}' no existe."}
-
-    # Crear mensaje de la función
-    tool_message = {
-        "role": "function",
-        "name": fn_name,
-        "content": json.dumps(funcion_resultado)
-    }
-
-    # Añadir mensajes al historial
-    messages.append(tool_message)
-
-    # Llamar nuevamente a la API con la respuesta de la función
-    response2 = openai_service.chat_completion(
-        messages=messages,
-        functions=tools
-    )
-
-    if response2 is None:
-        return jsonify({"error": "Error al comunicarse con OpenAI en la segunda llamada."}), 500
-
-    msg2 = response2
-    tool_call2 = msg2.get("function_call")
-
-    if not tool_call2:
-        # Respuesta final del Asistente
-        assistant_content2 = msg2.get("content")
-        if assistant_content2:
-            messages.append({"role": "assistant", "content": assistant_content2})
-            return jsonify({
-                "respuesta": assistant_content2,
-                "messages": messages
-            })
-        else:
-            return jsonify({"error": "El asistente no devolvió texto en la segunda llamada."}), 500
+        candado = nullcontext()
+    with candado:
+        return _turno_con_sesion(servicios, session_token, user_input)
+
+def _turno_con_sesion(servicios, session_token, user_input):
+    session_store = servicios.session_store
+    if session_token:
+        messages = session_store.obtener(session_token)
+        if messages is None:
+            return jsonify({"error": "session_token desconocido o expirado."}), 404
     else:
-        # Manejar más llamadas si es necesario
-        return jsonify({"error": "La IA ha realizado múltiples llamadas a funciones. Considera implementar un bucle para manejar más casos."}), 500
+        session_token = secrets.token_urlsafe(24)
+        messages = [SYSTEM_MESSAGE]
+
+    if user_input.lower() == "salir":
+        session_store.eliminar(session_token)
+        return jsonify({"message": "Saliendo..."}), 200
+
+    inicio = len(messages)
+    messages.append({"role": "user", "content": user_input})
+
+    resultado = servicios.engine.ejecutar_turno(messages)
+    session_store.guardar(session_token, messages)
+
+    if resultado["error"]:
+        return jsonify({"error": resultado["error"], "session_token": session_token}), 500
+
+    assistant_content = resultado["contenido"]
+    if not assistant_content:
+        return jsonify({"error": "El asistente no devolvió texto.", "session_token": session_token}), 500
+
+    return jsonify({
+        "respuesta": assistant_content,
+        "session_token": session_token,
+        "nuevos_mensajes": messages[inicio:]
+    })
+
+app = create_app()
 
 # Solo ejecutar el servidor Flask si este archivo es ejecutado directamente
 if __name__ == "__main__":
@@ -13,6 +13,132 @@ class Settings:
     PINECONE_METRIC = "cosine"
     PINECONE_CLOUD = 'aws'
     PINECONE_REGION = 'us-east-1'
-    VENTAS_FILE = os.path.join(os.path.dirname(__file__), '..', 'data', 'ventas.json')
+
+    # El chequeo de existencia del índice se recuerda en un archivo compartido por los workers
+    PINECONE_INDEX_MARKER = os.getenv("PINECONE_INDEX_MARKER", os.path.join(os.path.dirname(__file__), '..', 'data', 'indice_pinecone_ok'))
+    PINECONE_INDEX_CHECK_TTL = int(os.getenv("PINECONE_INDEX_CHECK_TTL", "86400"))
+
+    # Calentamiento en segundo plano (conexiones, caché de productos) al arrancar cada worker; /ready lo refleja
+    WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "1") == "1"
+
+    # Backend de búsqueda vectorial: "pinecone" o "local" (snapshot NumPy en memoria)
+    VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "pinecone")
+    LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", os.path.join(os.path.dirname(__file__), '..', 'data', 'indice_local'))
+    VENTAS_FILE = os.getenv("VENTAS_FILE", os.path.join(os.path.dirname(__file__), '..', 'data', 'ventas.json'))
+
+    # Versión del catálogo: la ingesta la incrementa para invalidar las cachés derivadas
+    CATALOGO_VERSION_FILE = os.getenv("CATALOGO_VERSION_FILE", os.path.join(os.path.dirname(__file__), '..', 'data', 'catalogo_version'))
+
+    # Caché de registros de producto por id; CATALOGO_FILE (CSV/JSONL) permite precargarla con Pinecone
+    PRODUCT_CACHE_SIZE = int(os.getenv("PRODUCT_CACHE_SIZE", "50000"))
+    CATALOGO_FILE = os.getenv("CATALOGO_FILE", "")
+    # Índice léxico (SKU, nombre exacto, BM25) sobre el catálogo precargado
+    LEXICAL_SEARCH_ENABLED = os.getenv("LEXICAL_SEARCH_ENABLED", "1") == "1"
+    # Forma canónica de las consultas antes del embedding (tildes, medidas, marcas, relleno);
+    # QUERY_SYNONYMS_FILE: JSON {"variante": "forma canónica"} que amplía la tabla de marcas
+    QUERY_CANONICALIZATION_ENABLED = os.getenv("QUERY_CANONICALIZATION_ENABLED", "1") == "1"
+    QUERY_SYNONYMS_FILE = os.getenv("QUERY_SYNONYMS_FILE", "")
+
+    # buscar_productos: máximo de consultas por llamada y consultas al índice en paralelo
+    BUSQUEDA_MAX_CONSULTAS = int(os.getenv("BUSQUEDA_MAX_CONSULTAS", "10"))
+    BUSQUEDA_CONCURRENCIA = int(os.getenv("BUSQUEDA_CONCURRENCIA", "8"))
+
+    # Caché semántica de respuestas para primeros turnos (coseno >= umbral con un mensaje ya respondido)
+    SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "1") == "1"
+    SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+    SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "1000"))
+    SEMANTIC_CACHE_TTL = int(os.getenv("SEMANTIC_CACHE_TTL", "3600"))
+
+    # Ingesta del catálogo: tamaños de lote, concurrencia y estado (hash por producto) para omitir sin cambios
+    INGESTA_LOTE_EMBEDDINGS = int(os.getenv("INGESTA_LOTE_EMBEDDINGS", "100"))
+    INGESTA_LOTE_UPSERT = int(os.getenv("INGESTA_LOTE_UPSERT", "100"))
+    INGESTA_CONCURRENCIA = int(os.getenv("INGESTA_CONCURRENCIA", "4"))
+    INGESTA_ESTADO_FILE = os.getenv("INGESTA_ESTADO_FILE", os.path.join(os.path.dirname(__file__), '..', 'data', 'ingesta_estado.sqlite3'))
+
+    # Registro de pedidos de solo-anexado (JSON lines); fsync: "siempre", "intervalo" o "nunca"
+    VENTAS_LOG_DIR = os.getenv("VENTAS_LOG_DIR", os.path.join(os.path.dirname(__file__), '..', 'data', 'ventas_log'))
+    VENTAS_FSYNC = os.getenv("VENTAS_FSYNC", "siempre")
+    VENTAS_FSYNC_INTERVALO = float(os.getenv("VENTAS_FSYNC_INTERVALO", "1.0"))
+    VENTAS_SEGMENTO_MAX_BYTES = int(os.getenv("VENTAS_SEGMENTO_MAX_BYTES", str(64 * 1024 * 1024)))
+    # Estadísticas de ventas (/api/stats): snapshot de los agregados dentro de VENTAS_LOG_DIR,
+    # reescrito cada VENTAS_STATS_SNAPSHOT_CADA pedidos ("" no lo guarda)
+    VENTAS_STATS_SNAPSHOT = os.getenv("VENTAS_STATS_SNAPSHOT", "estadisticas.json")
+    VENTAS_STATS_SNAPSHOT_CADA = int(os.getenv("VENTAS_STATS_SNAPSHOT_CADA", "50"))
+
+    # Verificación de precios de cada pedido contra el catálogo: "corregir", "marcar" o "" (desactivada)
+    PRICE_VALIDATION_POLICY = os.getenv("PRICE_VALIDATION_POLICY", "corregir")
+    PRICE_VALIDATION_TOLERANCE = float(os.getenv("PRICE_VALIDATION_TOLERANCE", "0.01"))
+
+    # Resultados de funciones guardados en el historial: "compacto" (tabla ref|nombre|precio con el
+    # SKU abreviado, que crear_pedido restaura en el servidor) o "json" (el resultado completo)
+    FUNCTION_RESULT_FORMAT = os.getenv("FUNCTION_RESULT_FORMAT", "compacto")
+    # Mapa ref -> SKU compartido por los workers y persistente entre reinicios (vacío: solo en memoria)
+    SKU_ALIAS_FILE = os.getenv("SKU_ALIAS_FILE", os.path.join(os.path.dirname(__file__), '..', 'data', 'alias_sku.sqlite3'))
+
+    # Consulta de pedidos y estadísticas (/api/orders, /api/stats): exigen "Authorization: Bearer <token>";
+    # sin token configurado responden 404 (exponen nombres, teléfonos y direcciones de clientes)
+    ORDERS_API_TOKEN = os.getenv("ORDERS_API_TOKEN", "")
+
+    # Transporte hacia OpenAI: plazos por llamada (s), reintentos en 429/5xx, pool HTTP y
+    # cobertura (segunda petición) para embeddings lentos
+    OPENAI_TIMEOUT_CHAT = float(os.getenv("OPENAI_TIMEOUT_CHAT", "60"))
+    OPENAI_TIMEOUT_EMBEDDING = float(os.getenv("OPENAI_TIMEOUT_EMBEDDING", "10"))
+    OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "3"))
+    OPENAI_POOL_SIZE = int(os.getenv("OPENAI_POOL_SIZE", "32"))
+    OPENAI_HEDGE_EMBEDDINGS = os.getenv("OPENAI_HEDGE_EMBEDDINGS", "1") == "1"
+
+    # Control de admisión hacia OpenAI: peticiones y tokens por minuto (0 desactiva cada límite).
+    # Son por worker: repartir los límites de la cuenta entre los procesos. Las llamadas sin
+    # capacidad esperan en una cola acotada; si no caben o esperarían más de ADMISION_ESPERA_MAX (s)
+    # se responde 429 con Retry-After.
+    OPENAI_RPM = int(os.getenv("OPENAI_RPM", "0"))
+    OPENAI_TPM = int(os.getenv("OPENAI_TPM", "0"))
+    ADMISION_MAX_COLA = int(os.getenv("ADMISION_MAX_COLA", "100"))
+    ADMISION_ESPERA_MAX = float(os.getenv("ADMISION_ESPERA_MAX", "10"))
+
+    # asgi_app.py: conexiones simultáneas hacia OpenAI desde el event loop e hilos para las
+    # llamadas bloqueantes (Pinecone, almacén de sesiones, registro de pedidos)
+    ASGI_OPENAI_CONEXIONES = int(os.getenv("ASGI_OPENAI_CONEXIONES", "256"))
+    ASGI_HILOS = int(os.getenv("ASGI_HILOS", "64"))
+
+    # Ciclo de funciones: máximo de llamadas al modelo por turno e hilos para funciones en paralelo.
+    # OPENAI_PARALLEL_TOOLS usa la API de 'tools', que permite varias funciones por respuesta.
+    MAX_TOOL_ITERATIONS = int(os.getenv("MAX_TOOL_ITERATIONS", "5"))
+    TOOL_WORKERS = int(os.getenv("TOOL_WORKERS", "4"))
+    OPENAI_PARALLEL_TOOLS = os.getenv("OPENAI_PARALLEL_TOOLS", "0") == "1"
+
+    # Enrutador local de intención: las búsquedas claras llaman a buscar_producto sin el modelo.
+    # TOOL_SELECTION_MODEL (p. ej. "gpt-3.5-turbo") elige funciones en los turnos probables;
+    # INTENT_ROUTER_TRAINING_FILE (JSONL texto/intencion) entrena el clasificador opcional.
+    INTENT_ROUTER_ENABLED = os.getenv("INTENT_ROUTER_ENABLED", "1") == "1"
+    INTENT_ROUTER_THRESHOLD = float(os.getenv("INTENT_ROUTER_THRESHOLD", "0.8"))
+    INTENT_ROUTER_TRAINING_FILE = os.getenv("INTENT_ROUTER_TRAINING_FILE", "")
+    TOOL_SELECTION_MODEL = os.getenv("TOOL_SELECTION_MODEL", "")
+
+    # Compactación del historial enviado al modelo (0 desactiva); los últimos turnos van completos
+    HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "3000"))
+    HISTORY_RECENT_TURNS = int(os.getenv("HISTORY_RECENT_TURNS", "2"))
+
+    # Almacén de sesiones de /api/chat: "memoria", "sqlite" (compartido entre workers) o "redis" (requiere pip install redis)
+    SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memoria")
+    # Segundos que un mensaje espera a que termine el turno anterior de su misma sesión (luego 409)
+    SESSION_LOCK_TIMEOUT = float(os.getenv("SESSION_LOCK_TIMEOUT", "30"))
+    # Duración máxima (s) del arriendo de una sesión en el almacén (sqlite/redis): debe superar el turno más largo
+    SESSION_LEASE_TTL = float(os.getenv("SESSION_LEASE_TTL", "120"))
+    SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "10000"))
+    SESSION_IDLE_TTL = int(os.getenv("SESSION_IDLE_TTL", "7200"))
+    SESSION_MAX_BYTES = int(os.getenv("SESSION_MAX_BYTES", str(64 * 1024 * 1024)))
+    SESSION_DB_FILE = os.getenv("SESSION_DB_FILE", os.path.join(os.path.dirname(__file__), '..', 'data', 'sesiones.sqlite3'))
+    REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+    # Embeddings y su caché (memoria LRU + SQLite opcional; dejar el archivo vacío desactiva el disco)
+    EMBEDDING_MODEL = "text-embedding-ada-002"
+    EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "2048"))
+    EMBEDDING_CACHE_TTL = int(os.getenv("EMBEDDING_CACHE_TTL", "86400"))
+    EMBEDDING_CACHE_DISK_TTL = int(os.getenv("EMBEDDING_CACHE_DISK_TTL", str(30 * 86400)))
+    EMBEDDING_CACHE_FILE = os.getenv(
+        "EMBEDDING_CACHE_FILE",
+        os.path.join(os.path.dirname(__file__), '..', 'data', 'embeddings_cache.sqlite3')
+    )
 
 settings = Settings()
@@ -0,0 +1,270 @@
+# functions/intent_router.py
+import json
+import math
+import re
+import threading
+from collections import defaultdict
+from functions.lexical_index import tokenizar
+from functions.query_canonicalizer import UNIDADES
+from utils.helpers import quitar_acentos
+
+# Frases con las que suele empezar una búsqueda ("¿tienes ...?", "busco ...", "precio de ...")
+_DISPARADOR = re.compile(
+    r"^\W*(?:hola\W+|buenas?(?:\s+(?:dias|tardes|noches))?\W+)?"
+    r"(?:(?:me\s+)?(?:podrias?|puedes?|pueden)\s+(?:buscar|mostrar|decir)(?:me)?(?:\s+si\s+(?:tienen|tienes|hay))?"
+    r"|tienes?|tienen|hay|venden|vendes|busco|buscame|buscar|quiero|quisiera|necesito"
+    r"|(?:cual\s+es\s+el\s+)?precio\s+(?:de(?:l)?|del)|cuanto\s+(?:cuesta|cuestan|vale|valen|esta|estan)"
+    r"|me\s+(?:das|da|vendes|pasas)|dame)\s+"
+)
+# Referencias a algo ya mostrado o datos de un pedido: las resuelve el modelo
+_ANAFORA = {"eso", "esos", "esa", "esas", "ese", "este", "esta", "estos", "estas", "mismo", "misma",
+            "otro", "otra", "anterior", "primero", "primera", "segundo", "segunda", "ultimo", "ultima"}
+_PEDIDO = {"confirmo", "confirmar", "pedido", "direccion", "telefono", "celular", "nombre", "delivery",
+           "recojo", "recoger", "envio", "envios", "pagar", "pago", "yape", "efectivo", "tarjeta"}
+_CHARLA = {"hola", "buenas", "buenos", "dias", "tardes", "noches", "gracias", "ok", "vale", "adios",
+           "chau", "perfecto", "genial", "listo", "si", "no", "bien"}
+# Separadores entre productos pedidos en un mismo mensaje
+_SEPARADOR = re.compile(r"\s*(?:,|;|\by\b|\be\b|\bademas\b|\btambien\b)\s*")
+# Palabras de relleno que no forman parte de la consulta
+_RELLENO = {"algun", "alguna", "algunos", "algunas", "un", "una", "unos", "unas", "el", "la", "los", "las",
+            "por", "favor", "porfa", "porfavor", "de", "del", "que", "tal", "y"}
+
+class DecisionRuta:
+    """
+    intencion: "busqueda", "pedido", "charla" u "otro".
+    accion: "sintetizar" (llamar a buscar_producto/buscar_productos sin el modelo), "modelo_seleccion"
+    (primera llamada con el modelo barato) o "completo".
+    """
+    __slots__ = ("intencion", "confianza", "consultas", "accion")
+
+    def __init__(self, intencion, confianza, consultas=None, accion="completo"):
+        self.intencion = intencion
+        self.confianza = confianza
+        self.consultas = consultas or []
+        self.accion = accion
+
+    @property
+    def query(self):
+        return " ".join(self.consultas)
+
+class ClasificadorBayes:
+    """
+    Clasificador de intención Naive Bayes multinomial sobre tokens, entrenado con
+    ejemplos etiquetados [(texto, intencion)]. Es pequeño y no tiene dependencias.
+    """
+
+    def __init__(self, alfa=1.0):
+        self.alfa = alfa
+        self._previas = {}
+        self._frecuencias = {}
+        self._totales = {}
+        self._vocabulario = set()
+
+    @classmethod
+    def desde_archivo(cls, ruta):
+        with open(ruta, "r", encoding="utf-8") as f:
+            ejemplos = [json.loads(linea) for linea in f if linea.strip()]
+        return cls().entrenar((e["texto"], e["intencion"]) for e in ejemplos)
+
+    def entrenar(self, ejemplos):
+        conteos = defaultdict(int)
+        frecuencias = defaultdict(lambda: defaultdict(int))
+        for texto, intencion in ejemplos:
+            conteos[intencion] += 1
+            for token in tokenizar(texto):
+                frecuencias[intencion][token] += 1
+                self._vocabulario.add(token)
+        total = sum(conteos.values()) or 1
+        self._previas = {c: math.log(n / total) for c, n in conteos.items()}
+        self._frecuencias = {c: dict(f) for c, f in frecuencias.items()}
+        self._totales = {c: sum(f.values()) for c, f in frecuencias.items()}
+        return self
+
+    def predecir(self, texto):
+        """
+        Devuelve (intencion, probabilidad).
+        """
+        if not self._previas:
+            return "otro", 0.0
+        tokens = [t for t in tokenizar(texto) if t in self._vocabulario]
+        v = len(self._vocabulario) or 1
+        puntajes = {}
+        for clase, previa in self._previas.items():
+            frecuencias = self._frecuencias.get(clase, {})
+            denominador = self._totales.get(clase, 0) + self.alfa * v
+            puntajes[clase] = previa + sum(
+                math.log((frecuencias.get(t, 0) + self.alfa) / denominador) for t in tokens
+            )
+        maximo = max(puntajes.values())
+        exps = {c: math.exp(p - maximo) for c, p in puntajes.items()}
+        suma = sum(exps.values())
+        mejor = max(exps, key=exps.get)
+        return mejor, exps[mejor] / suma
+
+class IntentRouter:
+    """
+    Clasifica localmente el último mensaje del usuario antes de llamar al modelo:
+    - Búsquedas claras ("¿tienes coca cola zero?" con términos que el catálogo conoce)
+      -> se sintetiza la llamada a buscar_producto (o buscar_productos si pide varios)
+      y se ahorra la primera llamada al modelo.
+    - Búsquedas o pedidos probables -> la primera llamada puede usar un modelo más barato.
+    - Lo demás (referencias a mensajes anteriores, charla) sigue el camino completo.
+    - Nunca se sintetiza la respuesta a una pregunta del asistente ("¿cuántas deseas?" ->
+      "quiero 2"): ese mensaje solo se entiende con el historial.
+
+    `cobertura(query)` devuelve la fracción de la consulta que reconoce el catálogo
+    (o None si no hay catálogo en memoria); `clasificador` es opcional (predecir(texto)).
+    """
+
+    def __init__(self, cobertura=None, clasificador=None, umbral=0.8, umbral_seleccion=0.5):
+        self.cobertura = cobertura
+        self.clasificador = clasificador
+        self.umbral = umbral
+        self.umbral_seleccion = umbral_seleccion
+        self._conteos = defaultdict(int)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _extraer_consultas(texto):
+        """
+        Quita la frase de búsqueda y el relleno, y separa los productos pedidos juntos:
+        "¿Tienes alguna coca cola?" -> ["coca cola"]; "quiero coca cola, pan y arroz"
+        -> ["coca cola", "pan", "arroz"]. Devuelve (consultas, hubo_disparador).
+        """
+        plano = quitar_acentos(texto).strip()
+        coincidencia = _DISPARADOR.match(plano)
+        resto = plano[coincidencia.end():] if coincidencia else plano
+        resto = re.sub(r"(\d),(\d)", r"\1.\2", resto)  # "1,5 lt" -> "1.5 lt"
+        consultas = []
+        for parte in _SEPARADOR.split(resto):
+            tokens = [t for t in re.findall(r"[a-z0-9.]+", parte) if t not in _RELLENO]
+            # Se quitan signos finales pero se conservan medidas como "1.5"
+            tokens = [t.strip(".") for t in tokens if t.strip(".")]
+            if tokens:
+                consultas.append(" ".join(tokens))
+        return consultas, coincidencia is not None
+
+    @staticmethod
+    def _palabras(consulta):
+        # Sin números ni unidades: "quiero 2" o "500 ml" no nombran un producto
+        return [t for t in tokenizar(consulta) if not t.isdigit() and t not in UNIDADES]
+
+    def _sintetizable(self, decision):
+        """
+        Búsqueda clara en la que cada consulta tiene alguna palabra que el catálogo conoce.
+        """
+        if decision.intencion != "busqueda" or decision.confianza < self.umbral:
+            return False
+        if self.cobertura is None:
+            return True
+        return all((self.cobertura(" ".join(self._palabras(q))) or 0.0) > 0.0 for q in decision.consultas)
+
+    @staticmethod
+    def _responde_pregunta(messages):
+        """
+        El mensaje anterior al del usuario es una pregunta del asistente.
+        """
+        anterior = messages[-2] if len(messages) >= 2 else None
+        if not anterior or anterior.get("role") != "assistant":
+            return False
+        contenido = anterior.get("content") or ""
+        return "?" in contenido[-200:]
+
+    def clasificar(self, texto):
+        tokens = set(tokenizar(texto))
+        if not tokens:
+            return DecisionRuta("otro", 0.0)
+        if tokens & _PEDIDO or re.search(r"\d{7,}", texto):
+            return DecisionRuta("pedido", 0.7)
+        if tokens <= _CHARLA:
+            return DecisionRuta("charla", 0.9)
+
+        consultas, disparador = self._extraer_consultas(texto)
+        tokens_query = set(tokenizar(" ".join(consultas)))
+        if not tokens_query or tokens_query & _ANAFORA:
+            return DecisionRuta("otro", 0.3 if disparador else 0.0)
+        # "quiero 2": una cantidad o medida suelta no es un producto
+        if not all(self._palabras(q) for q in consultas):
+            return DecisionRuta("otro", 0.3 if disparador else 0.0)
+
+        confianza = 0.5 if disparador else 0.1
+        if "?" in texto:
+            confianza += 0.05
+        # Sin catálogo en memoria no hay forma de confirmar que es un producto;
+        # con varios productos cuenta el que el catálogo reconoce peor
+        coberturas = [self.cobertura(q) for q in consultas] if self.cobertura is not None else [None]
+        confianza += 0.15 if None in coberturas else 0.45 * min(coberturas)
+
+        if self.clasificador is not None:
+            intencion, probabilidad = self.clasificador.predecir(texto)
+            p_busqueda = probabilidad if intencion == "busqueda" else 1.0 - probabilidad
+            confianza = (confianza + p_busqueda) / 2
+
+        confianza = min(confianza, 1.0)
+        intencion = "busqueda" if confianza >= self.umbral_seleccion else "otro"
+        return DecisionRuta(intencion, round(confianza, 3), consultas)
+
+    def enrutar(self, messages):
+        """
+        Decide qué hacer con el turno. Solo actúa si el último mensaje es del usuario.
+        """
+        ultimo = messages[-1] if messages else None
+        if not ultimo or ultimo.get("role") != "user":
+            return None
+        decision = self.clasificar(ultimo.get("content") or "")
+        if self._sintetizable(decision) and not self._responde_pregunta(messages):
+            decision.accion = "sintetizar"
+        elif decision.intencion in ("busqueda", "pedido"):
+            decision.accion = "modelo_seleccion"
+        self.registrar(decision.accion, decision.intencion)
+        return decision
+
+    def registrar(self, accion, intencion=None):
+        with self._lock:
+            self._conteos[(accion, intencion)] += 1
+
+    def estadisticas(self):
+        with self._lock:
+            conteos = dict(self._conteos)
+        por_accion = defaultdict(int)
+        for (accion, _), n in conteos.items():
+            por_accion[accion] += n
+        total = sum(n for (accion, _), n in conteos.items() if accion in ("sintetizar", "modelo_seleccion", "completo"))
+        return {
+            "decisiones": total,
+            "por_accion": dict(por_accion),
+            "por_intencion": {f"{a}:{i}": n for (a, i), n in conteos.items() if i is not None},
+            "tasa_sintetizadas": (por_accion["sintetizar"] / total) if total else 0.0
+        }
+
+    def evaluar(self, ejemplos):
+        """
+        Exactitud del router sobre ejemplos etiquetados [(texto, intencion)].
+        Lo crítico es la precisión de las llamadas sintetizadas: una búsqueda
+        sintetizada que no lo era responde mal al usuario.
+        """
+        aciertos = 0
+        sintetizadas = 0
+        sintetizadas_correctas = 0
+        busquedas = 0
+        confusion = defaultdict(int)
+        for texto, esperada in ejemplos:
+            decision = self.clasificar(texto)
+            if self._sintetizable(decision):
+                sintetizadas += 1
+                sintetizadas_correctas += esperada == "busqueda"
+            busquedas += esperada == "busqueda"
+            # "otro" y "charla" cuentan igual: ninguna de las dos se enruta
+            predicha = decision.intencion if decision.intencion in ("busqueda", "pedido") else "otro"
+            real = esperada if esperada in ("busqueda", "pedido") else "otro"
+            aciertos += predicha == real
+            confusion[f"{real}->{predicha}"] += 1
+        total = sum(confusion.values())
+        return {
+            "ejemplos": total,
+            "exactitud": (aciertos / total) if total else 0.0,
+            "sintetizadas": sintetizadas,
+            "precision_sintetizadas": (sintetizadas_correctas / sintetizadas) if sintetizadas else 0.0,
+            "cobertura_busquedas": (sintetizadas_correctas / busquedas) if busquedas else 0.0,
+            "confusion": dict(confusion)
+        }
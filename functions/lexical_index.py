@@ -0,0 +1,108 @@
+# functions/lexical_index.py
+import math
+import re
+from collections import defaultdict
+from utils.helpers import quitar_acentos
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+def tokenizar(texto: str):
+    return _TOKEN.findall(quitar_acentos(texto or ""))
+
+class LexicalIndex:
+    """
+    Índice léxico local sobre los registros de producto:
+    - SKU exacto (p. ej. un código de barras escrito por el cliente).
+    - Nombre exacto, sin tildes ni mayúsculas.
+    - BM25 sobre los tokens del nombre para el resto.
+    """
+
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self, registros, version=None):
+        self.version = version
+        self._por_sku = {}
+        self._por_nombre = {}
+        self._registros = []
+        self._largos = []
+        self._postings = defaultdict(list)  # token -> [(doc, frecuencia)]
+        for registro in registros:
+            doc = len(self._registros)
+            self._registros.append(registro)
+            self._por_sku[str(registro.sku)] = registro
+            self._por_nombre[" ".join(tokenizar(registro.nombre))] = registro
+            tokens = tokenizar(registro.nombre)
+            self._largos.append(len(tokens))
+            frecuencias = defaultdict(int)
+            for token in tokens:
+                frecuencias[token] += 1
+            for token, frecuencia in frecuencias.items():
+                self._postings[token].append((doc, frecuencia))
+        n = len(self._registros)
+        self._largo_promedio = (sum(self._largos) / n) if n and sum(self._largos) else 1.0
+        self._idf = {
+            token: math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            for token, docs in self._postings.items()
+        }
+
+    def __len__(self):
+        return len(self._registros)
+
+    def cobertura(self, query: str):
+        """
+        Fracción de los tokens de la consulta que aparecen en algún nombre del catálogo.
+        """
+        tokens = set(tokenizar(query))
+        if not tokens:
+            return 0.0
+        return sum(1 for t in tokens if t in self._postings) / len(tokens)
+
+    def exacto(self, query: str):
+        """
+        Registro cuyo SKU o nombre coincide exactamente con la consulta, o None.
+        """
+        texto = (query or "").strip()
+        registro = self._por_sku.get(texto)
+        if registro is not None:
+            return registro
+        return self._por_nombre.get(" ".join(tokenizar(texto)))
+
+    def bm25(self, query: str, top_k=5):
+        """
+        Devuelve [(registro, puntaje, tokens_encontrados)] ordenado por puntaje y
+        el número de tokens de la consulta.
+        """
+        tokens_query = set(tokenizar(query))
+        tokens = [t for t in tokens_query if t in self._postings]
+        puntajes = defaultdict(float)
+        coincidencias = defaultdict(int)
+        for token in tokens:
+            idf = self._idf[token]
+            for doc, frecuencia in self._postings[token]:
+                norma = self.K1 * (1 - self.B + self.B * self._largos[doc] / self._largo_promedio)
+                puntajes[doc] += idf * frecuencia * (self.K1 + 1) / (frecuencia + norma)
+                coincidencias[doc] += 1
+        mejores = sorted(puntajes.items(), key=lambda item: item[1], reverse=True)[:top_k]
+        return [(self._registros[doc], puntaje, coincidencias[doc]) for doc, puntaje in mejores], len(tokens_query)
+
+    def buscar(self, query: str, top_k=5, margen=1.5):
+        """
+        Devuelve (registros, confiable). `confiable` indica que la respuesta léxica
+        basta sin búsqueda vectorial: coincidencia exacta, o un único mejor resultado
+        que contiene todos los tokens de la consulta y supera al segundo por `margen`.
+        """
+        registro = self.exacto(query)
+        if registro is not None:
+            return [registro], True
+        resultados, total_tokens = self.bm25(query, top_k)
+        if not resultados:
+            return [], False
+        mejor = resultados[0]
+        segundo = resultados[1][1] if len(resultados) > 1 else 0.0
+        confiable = (
+            total_tokens > 0
+            and mejor[2] == total_tokens
+            and mejor[1] >= margen * segundo
+        )
+        return [r[0] for r in resultados], confiable
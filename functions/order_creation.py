@@ -1,41 +1,99 @@
 # functions/order_creation.py
-import uuid
+import asyncio
 import os
-import json
+import uuid
+from datetime import datetime
 from config.settings import settings
+from functions.price_validation import PriceValidator
+from functions.result_encoding import SkuAliasMap
+from services.order_index import OrderIndex
+from services.order_log import OrderLog
+from services.sales_stats import SalesStats
+from utils.metrics import ETAPAS
 
 class OrderCreation:
-    def __init__(self):
-        self.archivo_ventas = settings.VENTAS_FILE
-        # Asegurar que el directorio existe
-        os.makedirs(os.path.dirname(self.archivo_ventas), exist_ok=True)
+    def __init__(self, order_log: OrderLog = None, order_index: OrderIndex = None, validador: PriceValidator = None,
+                 alias: SkuAliasMap = None, sales_stats: SalesStats = None):
+        if order_log is None:
+            order_log = OrderLog(
+                settings.VENTAS_LOG_DIR,
+                fsync=settings.VENTAS_FSYNC,
+                intervalo_fsync=settings.VENTAS_FSYNC_INTERVALO,
+                max_segmento_bytes=settings.VENTAS_SEGMENTO_MAX_BYTES
+            )
+        self.order_log = order_log
+        # Migración única del antiguo ventas.json (no hace nada si ya se migró)
+        self.order_log.migrar_desde_json(settings.VENTAS_FILE)
+        # Índices de consulta (id, teléfono, SKU, fecha), reconstruidos desde el log al arrancar
+        if order_index is None:
+            order_index = OrderIndex(self.order_log)
+            order_index.reconstruir()
+        self.order_index = order_index
+        # Agregados de ventas (por día, SKU y modalidad) para /api/stats, con snapshot junto al log
+        if sales_stats is None:
+            snapshot = settings.VENTAS_STATS_SNAPSHOT
+            sales_stats = SalesStats(
+                self.order_log,
+                os.path.join(self.order_log.directorio, snapshot) if snapshot else None,
+                snapshot_cada=settings.VENTAS_STATS_SNAPSHOT_CADA
+            )
+            sales_stats.cargar()
+        self.sales_stats = sales_stats
+        # Verificación de precios contra el catálogo (opcional)
+        self.validador = validador
+        # SKUs abreviados en los resultados compactos de búsqueda (opcional)
+        self.alias = alias
     
     def crear_pedido(self, datos_cliente: dict, productos: list):
         id_unico = str(uuid.uuid4())[:8]
+        discrepancias = []
+        if self.alias is not None:
+            productos, desconocidos = self.alias.restaurar(productos)
+            if desconocidos:
+                # Sin el SKU real el pedido no se registra: el modelo debe volver a buscar el producto
+                return {"error": (
+                    f"Referencias de producto desconocidas: {', '.join(desconocidos)}. Vuelve a buscar "
+                    "esos productos con buscar_producto y usa la ref de esa búsqueda; el pedido no se registró."
+                )}
+        if self.validador is not None:
+            productos, discrepancias = self.validador.validar(productos)
         
         pedido = {
             "Pedido": {
                 "accion": "agregar_pedido",
                 "id_unico": id_unico,
+                "fecha": datetime.now().isoformat(timespec="seconds"),
                 "datos_cliente": datos_cliente,
                 "productos": productos
             }
         }
+        if discrepancias:
+            pedido["Pedido"]["validacion"] = {
+                "politica": self.validador.politica,
+                "discrepancias": discrepancias
+            }
         
         try:
-            if os.path.exists(self.archivo_ventas):
-                with open(self.archivo_ventas, 'r', encoding='utf-8') as f:
-                    ventas = json.load(f)
-            else:
-                ventas = []
-            
-            ventas.append(pedido)
-            
-            with open(self.archivo_ventas, 'w', encoding='utf-8') as f:
-                json.dump(ventas, f, indent=4, ensure_ascii=False)
-            
-            print(f"Pedido {id_unico} agregado exitosamente a {self.archivo_ventas}.")
+            with ETAPAS.medir(etapa="escritura_pedido"):
+                posicion = self.order_log.agregar(pedido)
+            self.order_index.registrar(posicion, pedido)
+            self.sales_stats.registrar()
+            print(f"Pedido {id_unico} agregado exitosamente a {self.order_log.directorio}.")
         except Exception as e:
-            print(f"Error al escribir en {self.archivo_ventas}: {e}")
+            print(f"Error al escribir en {self.order_log.directorio}: {e}")
         
         return pedido
+
+class AsyncOrderCreation:
+    """
+    crear_pedido para asgi_app.py. La validación de precios y la escritura en el log
+    (con fsync) son bloqueantes y cortas: corren en el pool de hilos del event loop.
+    """
+
+    def __init__(self, pedidos: OrderCreation):
+        self.pedidos = pedidos
+        self.order_index = pedidos.order_index
+        self.sales_stats = pedidos.sales_stats
+
+    async def crear_pedido(self, datos_cliente: dict, productos: list):
+        return await asyncio.to_thread(self.pedidos.crear_pedido, datos_cliente, productos)
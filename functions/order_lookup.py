@@ -0,0 +1,30 @@
+# functions/order_lookup.py
+from services.order_index import OrderIndex, normalizar_telefono
+
+class OrderLookup:
+    """
+    Consulta de pedidos para el asistente. Exige el teléfono del pedido además del
+    id_unico, para que nadie consulte pedidos ajenos desde el chat.
+    """
+
+    def __init__(self, order_index: OrderIndex):
+        self.order_index = order_index
+
+    def consultar_pedido(self, id_unico: str, telefono: str):
+        pedido = self.order_index.por_id(str(id_unico or "").strip())
+        if pedido is None:
+            return {"message": f"No se encontró el pedido {id_unico}."}
+        telefono_pedido = normalizar_telefono((pedido.get("datos_cliente") or {}).get("telefono"))
+        if not telefono_pedido or telefono_pedido != normalizar_telefono(telefono):
+            return {"message": "El teléfono no coincide con el del pedido."}
+        return {
+            "pedido": {
+                "id_unico": pedido.get("id_unico"),
+                "fecha": pedido.get("fecha"),
+                "modalidad_entrega": (pedido.get("datos_cliente") or {}).get("modalidad_entrega"),
+                "productos": [
+                    {"nombre": p.get("nombre"), "precio_bayovar": p.get("precio_bayovar")}
+                    for p in pedido.get("productos") or []
+                ]
+            }
+        }
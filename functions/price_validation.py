@@ -0,0 +1,186 @@
+# functions/price_validation.py
+import math
+import threading
+from array import array
+from bisect import bisect_left
+from functions.product_cache import ProductRecord
+from services.catalog_version import CatalogVersion
+from utils.metrics import ETAPAS
+
+POLITICA_CORREGIR = "corregir"
+POLITICA_MARCAR = "marcar"
+
+def _version_numerica(version):
+    try:
+        return int(version)
+    except (TypeError, ValueError):
+        return 0
+
+def _precio_valido(precio):
+    # Sin precio, no numérico o no positivo: el SKU cuenta como desconocido (nunca un pedido gratis)
+    try:
+        precio = float(precio)
+    except (TypeError, ValueError):
+        return None
+    return precio if math.isfinite(precio) and precio > 0 else None
+
+def _filas_validas(pares):
+    for sku, precio in pares:
+        precio = _precio_valido(precio)
+        if precio is not None:
+            yield str(sku), precio
+
+class PriceSnapshot:
+    """
+    Tabla SKU -> precio del catálogo en arreglos compactos: SKUs ordenados (búsqueda
+    binaria), precios en array('d') y la versión del catálogo de cada fila en array('q').
+    Una fila de una versión anterior cuenta como faltante y se refresca sola, sin
+    recargar toda la tabla.
+    """
+
+    def __init__(self):
+        self._skus = []
+        self._precios = array("d")
+        self._versiones = array("q")
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._skus)
+
+    def cargar(self, pares, version):
+        """
+        Reemplaza la tabla con [(sku, precio)] de una versión del catálogo.
+        Las filas sin precio válido se omiten.
+        """
+        v = _version_numerica(version)
+        ordenados = sorted(dict(_filas_validas(pares)).items())
+        with self._lock:
+            self._skus = [sku for sku, _ in ordenados]
+            self._precios = array("d", (precio for _, precio in ordenados))
+            self._versiones = array("q", [v]) * len(ordenados)
+        return len(ordenados)
+
+    def actualizar(self, pares, version):
+        """
+        Inserta o actualiza filas sueltas (p. ej. las traídas por un fetch).
+        """
+        v = _version_numerica(version)
+        with self._lock:
+            for sku, precio in _filas_validas(pares):
+                i = bisect_left(self._skus, sku)
+                if i < len(self._skus) and self._skus[i] == sku:
+                    self._precios[i] = precio
+                    self._versiones[i] = v
+                else:
+                    self._skus.insert(i, sku)
+                    self._precios.insert(i, precio)
+                    self._versiones.insert(i, v)
+
+    def obtener_varios(self, skus, version):
+        """
+        Devuelve ({sku: precio} vigentes, [skus faltantes o de otra versión]).
+        """
+        v = _version_numerica(version)
+        precios = {}
+        faltantes = []
+        with self._lock:
+            for sku in skus:
+                i = bisect_left(self._skus, sku)
+                if i < len(self._skus) and self._skus[i] == sku and self._versiones[i] == v:
+                    precios[sku] = self._precios[i]
+                else:
+                    faltantes.append(sku)
+        return precios, faltantes
+
+class PriceValidator:
+    """
+    Verifica los precios de un pedido contra el catálogo antes de guardarlo.
+    Todos los SKUs se resuelven de una vez: primero desde la tabla en memoria y los
+    que falten con un único fetch por id al índice (el id del vector es el SKU).
+    - "corregir": reemplaza precio_bayovar por el del catálogo.
+    - "marcar": deja el precio recibido y solo informa la diferencia.
+    """
+
+    def __init__(self, vector_service, catalog_version: CatalogVersion, politica=POLITICA_CORREGIR,
+                 tolerancia=0.01, snapshot: PriceSnapshot = None):
+        self.vectores = vector_service
+        self.catalog_version = catalog_version
+        self.politica = politica
+        self.tolerancia = tolerancia
+        self.snapshot = snapshot or PriceSnapshot()
+        self.validados = 0
+        self.discrepancias = 0
+        self.fetches = 0
+
+    def cargar_desde_registros(self, registros):
+        """
+        Llena la tabla con los ProductRecord de la caché de productos ya precargada.
+        """
+        return self.snapshot.cargar(
+            ((r.sku, r.precio_bayovar) for r in registros), self.catalog_version.actual()
+        )
+
+    def _precios_catalogo(self, skus):
+        version = self.catalog_version.actual()
+        precios, faltantes = self.snapshot.obtener_varios(skus, version)
+        if faltantes and hasattr(self.vectores, "fetch_metadata"):
+            self.fetches += 1
+            metadatos = self.vectores.fetch_metadata(faltantes) or {}
+            nuevos = []
+            for sku, meta in metadatos.items():
+                # La misma regla de precio que la precarga (precio_base o el de atributos)
+                precio = _precio_valido(ProductRecord.desde_metadata(sku, meta or {}).precio_bayovar)
+                if precio is not None:
+                    nuevos.append((str(sku), precio))
+            self.snapshot.actualizar(nuevos, version)
+            precios.update(nuevos)
+        return precios
+
+    def validar(self, productos):
+        """
+        Devuelve (productos, discrepancias). Con la política "corregir" los productos
+        devueltos llevan el precio del catálogo.
+        """
+        with ETAPAS.medir(etapa="validacion_precios"):
+            skus = list(dict.fromkeys(str(p.get("sku")) for p in productos if isinstance(p, dict) and p.get("sku")))
+            precios = self._precios_catalogo(skus) if skus else {}
+
+        resultado = []
+        discrepancias = []
+        for producto in productos:
+            if not isinstance(producto, dict):
+                resultado.append(producto)
+                continue
+            sku = str(producto.get("sku") or "")
+            precio_catalogo = precios.get(sku)
+            if precio_catalogo is None:
+                discrepancias.append({"sku": sku, "nombre": producto.get("nombre"), "motivo": "sku_desconocido"})
+                resultado.append(producto)
+                continue
+            try:
+                precio_pedido = float(producto.get("precio_bayovar"))
+            except (TypeError, ValueError):
+                precio_pedido = None
+            if precio_pedido is None or abs(precio_pedido - precio_catalogo) > self.tolerancia:
+                discrepancias.append({
+                    "sku": sku,
+                    "nombre": producto.get("nombre"),
+                    "motivo": "precio_distinto",
+                    "precio_recibido": producto.get("precio_bayovar"),
+                    "precio_catalogo": precio_catalogo
+                })
+                if self.politica == POLITICA_CORREGIR:
+                    producto = dict(producto, precio_bayovar=precio_catalogo)
+            resultado.append(producto)
+
+        self.validados += 1
+        self.discrepancias += len(discrepancias)
+        return resultado, discrepancias
+
+    def estadisticas(self):
+        return {
+            "pedidos_validados": self.validados,
+            "discrepancias": self.discrepancias,
+            "fetches": self.fetches,
+            "skus_en_memoria": len(self.snapshot)
+        }
@@ -0,0 +1,122 @@
+# functions/product_cache.py
+import json
+import threading
+from collections import OrderedDict
+
+class ProductRecord:
+    """
+    Producto ya normalizado a partir de la metadata del índice. `vista` es el dict
+    que devuelve buscar_producto, construido una sola vez.
+    """
+    __slots__ = ("id", "nombre", "sku", "precio_bayovar", "atributos", "vista")
+
+    def __init__(self, id, nombre, sku, precio_bayovar, atributos):
+        self.id = id
+        self.nombre = nombre
+        self.sku = sku
+        self.precio_bayovar = precio_bayovar
+        self.atributos = atributos
+        self.vista = {"nombre": nombre, "sku": sku, "precio_bayovar": precio_bayovar}
+
+    @classmethod
+    def desde_metadata(cls, id, meta):
+        nombre = meta.get("nombre", "Producto sin nombre")
+        sku = meta.get("sku", "SKU-no-disponible")
+        precio_bayovar = meta.get("precio_base", 0.0)
+        atributos = {}
+
+        # Manejo adicional si "atributos" está presente
+        if "atributos" in meta:
+            try:
+                atributos = json.loads(meta["atributos"])
+            except (TypeError, ValueError):
+                atributos = {}
+            if precio_bayovar == 0.0 and isinstance(atributos, dict):
+                precio_bayovar = atributos.get("precio_base", 0.0)
+
+        return cls(id, nombre, sku, precio_bayovar, atributos)
+
+class ProductRecordCache:
+    """
+    Registros de producto por id de vector (el SKU en los índices cargados por la ingesta).
+    Se llena con los resultados de las búsquedas o de golpe con precargar(); en ese caso
+    queda `completo` y la búsqueda puede pedir al índice solo ids y puntajes.
+    Se vacía cuando cambia la versión del catálogo.
+    """
+
+    def __init__(self, catalog_version, max_items=50000):
+        self.catalog_version = catalog_version
+        self.max_items = max_items
+        self._registros = OrderedDict()
+        self._version = catalog_version.actual()
+        self._lock = threading.Lock()
+        self.completo = False
+        self.hits = 0
+        self.misses = 0
+
+    def _verificar_version(self):
+        version = self.catalog_version.actual()
+        if version != self._version:
+            self._registros.clear()
+            self.completo = False
+            self._version = version
+
+    def obtener_varios(self, ids):
+        """
+        Devuelve ({id: ProductRecord}, [ids sin registro]).
+        """
+        encontrados = {}
+        faltantes = []
+        with self._lock:
+            self._verificar_version()
+            for id_ in ids:
+                registro = self._registros.get(id_)
+                if registro is None:
+                    faltantes.append(id_)
+                else:
+                    self._registros.move_to_end(id_)
+                    encontrados[id_] = registro
+            self.hits += len(encontrados)
+            self.misses += len(faltantes)
+        return encontrados, faltantes
+
+    def agregar(self, id, metadata):
+        registro = ProductRecord.desde_metadata(id, metadata)
+        with self._lock:
+            self._registros[id] = registro
+            self._registros.move_to_end(id)
+            while len(self._registros) > self.max_items:
+                self._registros.popitem(last=False)
+                self.completo = False
+        return registro
+
+    def precargar(self, pares):
+        """
+        Carga masiva de (id, metadata). Si todo cabe, la caché queda completa.
+        """
+        registros = [ProductRecord.desde_metadata(id_, meta) for id_, meta in pares]
+        with self._lock:
+            self._verificar_version()
+            for registro in registros:
+                self._registros[registro.id] = registro
+            while len(self._registros) > self.max_items:
+                self._registros.popitem(last=False)
+            self.completo = len(registros) <= self.max_items
+        print(f"Caché de productos precargada con {len(registros)} registros.")
+        return len(registros)
+
+    def registros(self):
+        with self._lock:
+            self._verificar_version()
+            return list(self._registros.values())
+
+    def estadisticas(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / total) if total else 0.0,
+                "items": len(self._registros),
+                "completo": self.completo
+            }
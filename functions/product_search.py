@@ -1,45 +1,303 @@
 # functions/product_search.py
-from services.pinecone_service import PineconeService
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from services.openai_service import OpenAIService
-import json
+from services.catalog_version import CatalogVersion
+from functions.product_cache import ProductRecordCache
+from functions.lexical_index import LexicalIndex
+from functions.query_canonicalizer import QueryCanonicalizer
+from config.settings import settings
+from utils.metrics import ETAPAS
 
 class ProductSearch:
-    def __init__(self, pinecone_service: PineconeService, openai_service: OpenAIService):
+    def __init__(self, pinecone_service, openai_service: OpenAIService, product_cache: ProductRecordCache = None,
+                 canonizador: QueryCanonicalizer = None):
         self.pinecone = pinecone_service
         self.openai = openai_service
+        if product_cache is None:
+            product_cache = ProductRecordCache(
+                CatalogVersion(settings.CATALOGO_VERSION_FILE),
+                max_items=settings.PRODUCT_CACHE_SIZE
+            )
+        self.cache = product_cache
+        self.lexico = None
+        # Forma canónica de las consultas para el embedding (opcional)
+        self.canonizador = canonizador
+        # Recarga del catálogo cuando una ingesta cambia su versión
+        self.al_precargar = []  # funciones(registros) a llamar tras cada precarga completa
+        self._precargable = False
+        self._version_precarga = None
+        self._lock_precarga = threading.Lock()
+        # Consultas al índice en paralelo para buscar_productos
+        self._executor = ThreadPoolExecutor(
+            max_workers=settings.BUSQUEDA_CONCURRENCIA,
+            thread_name_prefix="busqueda"
+        )
+
+    def precargar_cache(self):
+        """
+        Carga todos los productos en la caché: desde el índice local o desde settings.CATALOGO_FILE.
+        Con el catálogo completo en memoria también se construye el índice léxico.
+        Si después cambia la versión del catálogo, se repite en segundo plano.
+        """
+        version = self.cache.catalog_version.actual()
+        if hasattr(self.pinecone, "metadatos_completos"):
+            pares = self.pinecone.metadatos_completos()
+        elif settings.CATALOGO_FILE:
+            from services.catalog_ingestion import leer_productos, preparar_producto
+            preparados = (preparar_producto(p) for p in leer_productos(settings.CATALOGO_FILE))
+            pares = ((p[0], p[2]) for p in preparados if p is not None)
+        else:
+            return 0
+        self._precargable = True
+        self._version_precarga = version
+        total = self.cache.precargar(pares)
+        if self.cache.completo:
+            registros = self.cache.registros()
+            if settings.LEXICAL_SEARCH_ENABLED:
+                self.lexico = LexicalIndex(registros, version=version)
+            for funcion in self.al_precargar:
+                funcion(registros)
+        return total
+
+    def _vigilar_version(self):
+        """
+        Si una ingesta cambió la versión del catálogo, la caché se vació y el índice léxico
+        quedó obsoleto: se vuelven a precargar en un hilo (una vez por versión).
+        """
+        if not self._precargable:
+            return
+        version = self.cache.catalog_version.actual()
+        if version == self._version_precarga:
+            return
+        with self._lock_precarga:
+            if version == self._version_precarga:
+                return
+            self._version_precarga = version
+        threading.Thread(target=self._precargar_de_nuevo, name="recarga-catalogo", daemon=True).start()
+
+    def _precargar_de_nuevo(self):
+        try:
+            self.precargar_cache()
+        except Exception as e:
+            print(f"[ERROR] No se pudo volver a precargar el catálogo: {e}")
+
+    def texto_embedding(self, query: str):
+        """
+        Texto con el que se genera el embedding de una consulta (su forma canónica si
+        hay canonizador): variantes de una misma consulta comparten embedding y caché.
+        """
+        return self.canonizador.canonizar(query) if self.canonizador is not None else query
+
+    def textos_embedding(self, vectoriales):
+        """
+        Textos únicos para el embedding de las consultas [(query, léxicos)] y, por consulta,
+        la posición de su texto en esa lista.
+        """
+        textos = [self.texto_embedding(query) for query, _ in vectoriales]
+        unicos = list(dict.fromkeys(textos))
+        return unicos, [unicos.index(texto) for texto in textos]
+
+    def _lexico_vigente(self):
+        self._vigilar_version()
+        if self.lexico is None or self.lexico.version != self.cache.catalog_version.actual():
+            return None
+        return self.lexico
+
+    def cobertura_lexica(self, query: str):
+        """
+        Fracción de la consulta que el catálogo reconoce, o None sin índice léxico.
+        """
+        lexico = self._lexico_vigente()
+        return None if lexico is None else lexico.cobertura(query)
+
+    @staticmethod
+    def _fusionar(vectoriales, lexicos, top_k=5, k=60):
+        """
+        Reciprocal Rank Fusion de los resultados vectoriales y léxicos.
+        """
+        puntajes = {}
+        registros = {}
+        for lista in (vectoriales, lexicos):
+            for rango, registro in enumerate(lista):
+                puntajes[registro.id] = puntajes.get(registro.id, 0.0) + 1.0 / (k + rango + 1)
+                registros[registro.id] = registro
+        ordenados = sorted(puntajes, key=puntajes.get, reverse=True)[:top_k]
+        return [registros[id_] for id_ in ordenados]
+
+    def _registros_locales(self, matches):
+        """
+        Registros de los matches que ya están en la caché o traen metadata.
+        Devuelve ({id: registro}, [ids que hay que traer con un fetch]).
+        """
+        ids = [match.id for match in matches]
+        registros, faltantes = self.cache.obtener_varios(ids)
+        sin_metadata = []
+        if faltantes:
+            por_id = {match.id: match for match in matches}
+            for id_ in faltantes:
+                meta = por_id[id_].metadata
+                if meta:
+                    registros[id_] = self.cache.agregar(id_, meta)
+                else:
+                    sin_metadata.append(id_)
+        return registros, sin_metadata
+
+    def _agregar_metadatos(self, registros, metadatos):
+        for id_, meta in (metadatos or {}).items():
+            registros[id_] = self.cache.agregar(id_, meta or {})
+
+    def _registros(self, matches):
+        """
+        Registros de producto en el orden de los matches, usando la caché y
+        completando los que falten con la metadata del match o con un fetch por id.
+        """
+        registros, sin_metadata = self._registros_locales(matches)
+        if sin_metadata:
+            self._agregar_metadatos(registros, self.pinecone.fetch_metadata(sin_metadata))
+        return [registros[match.id] for match in matches if match.id in registros]
 
     def buscar_producto(self, query: str):
-        embedding = self.openai.generar_embedding(query)
+        with ETAPAS.medir(etapa="buscar_producto"):
+            return self._buscar_producto(query)
+
+    def _buscar_lexico(self, query: str):
+        """
+        Devuelve (registros léxicos, confiable). Sin índice léxico: ([], False).
+        """
+        lexico = self._lexico_vigente()
+        if lexico is None:
+            return [], False
+        return lexico.buscar(query)
+
+    def _resultado(self, embedding, lexicos):
         if embedding is None:
             return {"message": "Error generando embedding."}
-        
-        matches = self.pinecone.query_index(embedding)
+
+        # Con la caché completa basta con ids y puntajes; la metadata no viaja por la red
+        matches = self.pinecone.query_index(embedding, include_metadata=not self.cache.completo)
         if matches is None:
             return {"message": "Error al consultar Pinecone."}
-        
-        productos_encontrados = []
-        for match in matches:
-            meta = match.metadata
-            nombre = meta.get("nombre", "Producto sin nombre")
-            sku = meta.get("sku", "SKU-no-disponible")
-            precio_bayovar = meta.get("precio_base", 0.0)
-            
-            # Manejo adicional si "atributos" está presente
-            if precio_bayovar == 0.0 and "atributos" in meta:
-                try:
-                    atributos = json.loads(meta["atributos"])
-                    precio_bayovar = atributos.get("precio_base", 0.0)
-                except:
-                    pass
-            
-            producto = {
-                "nombre": nombre,
-                "sku": sku,
-                "precio_bayovar": precio_bayovar
-            }
-            productos_encontrados.append(producto)
-        
+        return self._respuesta(self._registros(matches), lexicos)
+
+    def _respuesta(self, registros, lexicos):
+        if lexicos:
+            registros = self._fusionar(registros, lexicos)
+        productos_encontrados = [registro.vista for registro in registros]
+
         if productos_encontrados:
             return {"productos_encontrados": productos_encontrados}
         else:
             return {"message": "No se encontraron productos que coincidan con la búsqueda."}
+
+    def _buscar_producto(self, query: str):
+        # Camino rápido: SKU, nombre exacto o coincidencia léxica clara, sin embedding
+        lexicos, confiable = self._buscar_lexico(query)
+        if confiable:
+            return {"productos_encontrados": [registro.vista for registro in lexicos]}
+
+        return self._resultado(self.openai.generar_embedding(self.texto_embedding(query)), lexicos)
+
+    def buscar_productos(self, queries: list):
+        """
+        Búsqueda de varios productos en un solo paso ("coca cola, pan y arroz"):
+        un único Embedding.create para todas las consultas que no resuelve el índice
+        léxico y las consultas al índice en paralelo. Devuelve los resultados agrupados
+        por consulta, en el orden recibido.
+        """
+        with ETAPAS.medir(etapa="buscar_productos"):
+            consultas, resultados, vectoriales = self._separar_consultas(queries)
+            if not consultas:
+                return {"message": "No se recibieron consultas."}
+
+            if vectoriales:
+                textos, indices = self.textos_embedding(vectoriales)
+                unicos = self.openai.generar_embeddings(textos) or [None] * len(textos)
+                embeddings = [unicos[i] for i in indices]
+                if len(vectoriales) == 1:
+                    (query, lexicos), = vectoriales
+                    resultados[query] = self._resultado(embeddings[0], lexicos)
+                else:
+                    futuros = {
+                        query: self._executor.submit(self._resultado, embedding, lexicos)
+                        for (query, lexicos), embedding in zip(vectoriales, embeddings)
+                    }
+                    for query, futuro in futuros.items():
+                        resultados[query] = futuro.result()
+
+            return {"resultados": [dict(query=query, **resultados[query]) for query in consultas]}
+
+    def _separar_consultas(self, queries):
+        """
+        Limpia las consultas y resuelve las que alcanza el índice léxico.
+        Devuelve (consultas, {query: resultado léxico}, [(query, léxicos) que necesitan embedding]).
+        """
+        # El modelo a veces envía un solo texto en lugar de un arreglo, o elementos que no son texto
+        if isinstance(queries, str):
+            queries = [queries]
+        elif not isinstance(queries, (list, tuple)):
+            queries = []
+        consultas = list(dict.fromkeys(q.strip() for q in queries if isinstance(q, str) and q.strip()))
+        consultas = consultas[:settings.BUSQUEDA_MAX_CONSULTAS]
+        resultados = {}
+        vectoriales = []
+        for query in consultas:
+            lexicos, confiable = self._buscar_lexico(query)
+            if confiable:
+                resultados[query] = {"productos_encontrados": [registro.vista for registro in lexicos]}
+            else:
+                vectoriales.append((query, lexicos))
+        return consultas, resultados, vectoriales
+
+class AsyncProductSearch:
+    """
+    Versión asíncrona de ProductSearch para asgi_app.py. Reutiliza la caché, el índice
+    léxico y la fusión de `busqueda`; solo el embedding y las consultas al índice se esperan
+    sin ocupar un hilo. En buscar_productos las consultas al índice van concurrentes.
+    """
+
+    def __init__(self, busqueda: ProductSearch, openai_service, vector_service):
+        self.busqueda = busqueda
+        self.openai = openai_service
+        self.pinecone = vector_service
+
+    async def buscar_producto(self, query: str):
+        with ETAPAS.medir(etapa="buscar_producto"):
+            lexicos, confiable = self.busqueda._buscar_lexico(query)
+            if confiable:
+                return {"productos_encontrados": [registro.vista for registro in lexicos]}
+            return await self._resultado(
+                await self.openai.generar_embedding(self.busqueda.texto_embedding(query)), lexicos
+            )
+
+    async def _resultado(self, embedding, lexicos):
+        if embedding is None:
+            return {"message": "Error generando embedding."}
+        matches = await self.pinecone.query_index(embedding, include_metadata=not self.busqueda.cache.completo)
+        if matches is None:
+            return {"message": "Error al consultar Pinecone."}
+        registros, sin_metadata = self.busqueda._registros_locales(matches)
+        if sin_metadata:
+            self.busqueda._agregar_metadatos(registros, await self.pinecone.fetch_metadata(sin_metadata))
+        registros = [registros[match.id] for match in matches if match.id in registros]
+        return self.busqueda._respuesta(registros, lexicos)
+
+    async def buscar_productos(self, queries: list):
+        with ETAPAS.medir(etapa="buscar_productos"):
+            consultas, resultados, vectoriales = self.busqueda._separar_consultas(queries)
+            if not consultas:
+                return {"message": "No se recibieron consultas."}
+
+            if vectoriales:
+                textos, indices = self.busqueda.textos_embedding(vectoriales)
+                unicos = await self.openai.generar_embeddings(textos) or [None] * len(textos)
+                embeddings = [unicos[i] for i in indices]
+                respuestas = await asyncio.gather(*(
+                    self._resultado(embedding, lexicos)
+                    for (_, lexicos), embedding in zip(vectoriales, embeddings)
+                ))
+                for (query, _), respuesta in zip(vectoriales, respuestas):
+                    resultados[query] = respuesta
+
+            return {"resultados": [dict(query=query, **resultados[query]) for query in consultas]}
@@ -0,0 +1,180 @@
+# functions/query_canonicalizer.py
+import json
+import re
+import threading
+from functools import lru_cache
+from utils.helpers import quitar_acentos, normalizar_texto
+
+# Variantes frecuentes de marcas -> forma canónica (se amplía con QUERY_SYNONYMS_FILE)
+SINONIMOS = {
+    "cocacola": "coca cola",
+    "coca kola": "coca cola",
+    "coka cola": "coca cola",
+    "incakola": "inca kola",
+    "incacola": "inca kola",
+    "inca cola": "inca kola",
+    "pepsicola": "pepsi",
+    "pepsi cola": "pepsi",
+    "sevenup": "seven up",
+    "7 up": "seven up",
+    "7up": "seven up",
+    "refresco": "gaseosa",
+    "refrescos": "gaseosas",
+}
+# Palabras que no describen el producto
+RELLENO = {
+    "hola", "buenas", "buenos", "dias", "tardes", "noches", "tienes", "tiene", "tienen", "hay", "venden",
+    "vendes", "quiero", "quisiera", "necesito", "busco", "buscame", "buscar", "dame", "me", "das", "da",
+    "puedes", "podrias", "mostrar", "precio", "cuanto", "cuesta", "cuestan", "por", "favor", "porfa",
+    "porfavor", "algun", "alguna", "algunos", "algunas", "el", "la", "los", "las", "un", "una", "unos",
+    "unas", "de", "del", "que", "tal", "y", "o",
+}
+# Unidad -> (unidad base, factor a la base)
+UNIDADES = {
+    "l": ("ml", 1000), "lt": ("ml", 1000), "lts": ("ml", 1000), "ltr": ("ml", 1000), "ltrs": ("ml", 1000),
+    "litro": ("ml", 1000), "litros": ("ml", 1000),
+    "ml": ("ml", 1), "mls": ("ml", 1), "cc": ("ml", 1), "mililitro": ("ml", 1), "mililitros": ("ml", 1),
+    "kg": ("g", 1000), "kgs": ("g", 1000), "kilo": ("g", 1000), "kilos": ("g", 1000),
+    "kilogramo": ("g", 1000), "kilogramos": ("g", 1000),
+    "g": ("g", 1), "gr": ("g", 1), "grs": ("g", 1), "gramo": ("g", 1), "gramos": ("g", 1),
+}
+# Unidades que sin número significan una unidad ("coca cola de litro")
+_UNIDADES_SOLAS = {"litro", "kilo"}
+_NUMEROS = {"un": 1, "uno": 1, "una": 1, "medio": 0.5, "media": 0.5, "dos": 2, "tres": 3, "cuatro": 4,
+            "cinco": 5, "seis": 6}
+# Unidad base -> unidad a partir de 1000 (500 ml, 1.5 l; 400 g, 1 kg)
+_MAYOR = {"ml": "l", "g": "kg"}
+
+_TOKEN = re.compile(r"\d*\.\d+|\d+|[a-z]+")
+
+def _partir(texto):
+    texto = quitar_acentos(texto)
+    texto = re.sub(r"(\d),(\d)", r"\1.\2", texto)  # "1,5 lt" -> "1.5 lt"
+    return _TOKEN.findall(texto)
+
+def _numero(token):
+    if token in _NUMEROS:
+        return _NUMEROS[token]
+    try:
+        return float(token)
+    except ValueError:
+        return None
+
+def _medida(cantidad, base):
+    if cantidad >= 1000:
+        return f"{cantidad / 1000:g} {_MAYOR[base]}"
+    return f"{cantidad:g} {base}"
+
+class QueryCanonicalizer:
+    """
+    Forma canónica de una consulta de producto antes de generar su embedding, para que
+    "Coca-Cola 1L", "coca cola 1 lt" y "cocacola un litro" compartan embedding y caché:
+    - minúsculas y sin tildes; guiones y signos como espacios;
+    - marcas escritas de varias formas según la tabla de sinónimos;
+    - medidas como número + unidad ("1 l", "500 ml", "1.5 l", "400 g", "1 kg"),
+      también escritas con palabras ("un litro", "litro y medio", "medio kilo");
+    - sin palabras de relleno ("tienes", "quiero", artículos).
+    Si no queda nada, devuelve la consulta solo normalizada.
+    """
+
+    def __init__(self, sinonimos=None, relleno=None, max_cache=4096):
+        self.sinonimos = {}
+        for variante, canonica in dict(SINONIMOS, **(sinonimos or {})).items():
+            clave = tuple(_partir(variante))
+            if clave:
+                self.sinonimos[clave] = _partir(canonica)
+        self.max_frase = max((len(clave) for clave in self.sinonimos), default=1)
+        self.relleno = set(RELLENO if relleno is None else relleno)
+        # Las mismas consultas se repiten mucho: se recuerdan las últimas formas canónicas
+        self._canonica = lru_cache(maxsize=max_cache)(self._calcular)
+        self._lock = threading.Lock()
+        self.consultas = 0
+        self.modificadas = 0
+
+    @classmethod
+    def desde_archivo(cls, ruta):
+        """
+        Sinónimos adicionales desde un JSON {"variante": "forma canónica"}.
+        """
+        try:
+            with open(ruta, "r", encoding="utf-8") as f:
+                sinonimos = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"[ERROR] No se pudo leer la tabla de sinónimos {ruta}: {e}")
+            sinonimos = {}
+        return cls(sinonimos=sinonimos)
+
+    def _aplicar_sinonimos(self, tokens):
+        resultado = []
+        i = 0
+        while i < len(tokens):
+            for largo in range(min(self.max_frase, len(tokens) - i), 0, -1):
+                canonica = self.sinonimos.get(tuple(tokens[i:i + largo]))
+                if canonica is not None:
+                    resultado.extend(canonica)
+                    i += largo
+                    break
+            else:
+                resultado.append(tokens[i])
+                i += 1
+        return resultado
+
+    @staticmethod
+    def _normalizar_medidas(tokens):
+        resultado = []
+        i = 0
+        while i < len(tokens):
+            token = tokens[i]
+            cantidad = _numero(token)
+            unidad = UNIDADES.get(tokens[i + 1]) if cantidad is not None and i + 1 < len(tokens) else None
+            if unidad is not None:
+                consumidos = 2
+            elif token in _UNIDADES_SOLAS:
+                cantidad, unidad, consumidos = 1, UNIDADES[token], 1
+            else:
+                resultado.append(token)
+                i += 1
+                continue
+            # "litro y medio", "kilo y medio"
+            if tokens[i + consumidos:i + consumidos + 2] in (["y", "medio"], ["y", "media"]):
+                cantidad += 0.5
+                consumidos += 2
+            base, factor = unidad
+            resultado.append(_medida(round(cantidad * factor, 3), base))
+            i += consumidos
+        return resultado
+
+    def _calcular(self, query):
+        normalizada = normalizar_texto(query)
+        tokens = self._aplicar_sinonimos(_partir(normalizada))
+        tokens = self._normalizar_medidas(tokens)
+        tokens = [t for t in tokens if t not in self.relleno]
+        canonica = " ".join(tokens) or normalizada
+        return canonica, canonica != normalizada
+
+    def canonizar(self, query: str):
+        canonica, modificada = self._canonica(query or "")
+        with self._lock:
+            self.consultas += 1
+            self.modificadas += modificada
+        return canonica
+
+    def __call__(self, query: str):
+        return self.canonizar(query)
+
+    def evaluar(self, consultas):
+        """
+        Tasa de colapso sobre una muestra de consultas: cuántas consultas distintas
+        (ya normalizadas como las usa la caché de embeddings) quedan en una misma forma canónica.
+        """
+        distintas = {normalizar_texto(q) for q in consultas if q and q.strip()}
+        canonicas = {self._canonica(q)[0] for q in distintas}
+        return {
+            "consultas": len(distintas),
+            "canonicas": len(canonicas),
+            "tasa_colapso": (1 - len(canonicas) / len(distintas)) if distintas else 0.0
+        }
+
+    def estadisticas(self):
+        with self._lock:
+            return {"consultas": self.consultas, "modificadas": self.modificadas}
@@ -0,0 +1,255 @@
+# functions/result_encoding.py
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+# Encabezado de la tabla de productos; también identifica el formato al compactar el historial
+ENCABEZADO_PRODUCTOS = "ref|nombre|precio_bayovar"
+_BASE36 = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+def alias_sku(sku):
+    """
+    Alias corto y determinista de un SKU ("p" + 6 caracteres base 36): todos los workers
+    obtienen el mismo alias sin compartir estado.
+    """
+    n = int.from_bytes(hashlib.blake2b(str(sku).encode("utf-8"), digest_size=5).digest(), "big")
+    caracteres = []
+    for _ in range(6):
+        n, resto = divmod(n, 36)
+        caracteres.append(_BASE36[resto])
+    return "p" + "".join(caracteres)
+
+def es_alias(valor):
+    return (isinstance(valor, str) and len(valor) == 7 and valor[0] == "p"
+            and all(c in _BASE36 for c in valor[1:]))
+
+def _texto_celda(valor):
+    return str(valor if valor is not None else "").replace("|", "/").replace("\n", " ")
+
+def _precio(valor):
+    try:
+        return f"{float(valor):g}"
+    except (TypeError, ValueError):
+        return _texto_celda(valor)
+
+class SkuAliasMap:
+    """
+    Mapa alias -> (sku, nombre, precio) de los productos mostrados al modelo.
+    Se llena al codificar resultados y, con el catálogo precargado, con todos los productos.
+    Con `ruta_disco` el mapa se guarda además en SQLite (compartido entre workers y entre
+    reinicios), así un alias mostrado por otro worker, antes de reiniciar o en /chat modo
+    clásico se sigue resolviendo aunque este proceso no lo tenga en memoria.
+    Dos SKUs con el mismo alias se desambiguan por nombre.
+    """
+
+    def __init__(self, max_items=50000, ruta_disco=None):
+        self.max_items = max_items
+        self._por_alias = OrderedDict()  # alias -> {sku: (sku, nombre, precio)}
+        self._lock = threading.Lock()
+        self._lock_disco = threading.Lock()
+        self.restaurados = 0
+        self.desconocidos = 0
+        self._db = None
+        if ruta_disco:
+            self._abrir_disco(ruta_disco)
+
+    def _abrir_disco(self, ruta):
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(ruta)), exist_ok=True)
+            self._db = sqlite3.connect(ruta, timeout=5, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS alias ("
+                "alias TEXT, sku TEXT, nombre TEXT, precio TEXT, PRIMARY KEY (alias, sku))"
+            )
+            self._db.commit()
+        except sqlite3.Error as e:
+            print(f"[ERROR] No se pudo abrir el mapa de alias de SKU en disco ({ruta}): {e}")
+            self._db = None
+
+    def __len__(self):
+        with self._lock:
+            return len(self._por_alias)
+
+    def _en_memoria(self, alias, entrada):
+        # Devuelve True si la entrada es nueva o cambió (hay que escribirla en disco)
+        with self._lock:
+            entradas = self._por_alias.get(alias)
+            if entradas is None:
+                entradas = self._por_alias[alias] = {}
+            nueva = entradas.get(entrada[0]) != entrada
+            entradas[entrada[0]] = entrada
+            self._por_alias.move_to_end(alias)
+            while len(self._por_alias) > self.max_items:
+                self._por_alias.popitem(last=False)
+        return nueva
+
+    def _escribir_disco(self, filas):
+        if self._db is None or not filas:
+            return
+        try:
+            with self._lock_disco, self._db:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO alias (alias, sku, nombre, precio) VALUES (?, ?, ?, ?)",
+                    [(alias, sku, nombre, json.dumps(precio, default=str)) for alias, (sku, nombre, precio) in filas]
+                )
+        except sqlite3.Error as e:
+            print(f"[ERROR] Escritura del mapa de alias de SKU en disco: {e}")
+
+    def _leer_disco(self, alias):
+        if self._db is None:
+            return {}
+        try:
+            with self._lock_disco:
+                filas = self._db.execute(
+                    "SELECT sku, nombre, precio FROM alias WHERE alias = ?", (alias,)
+                ).fetchall()
+        except sqlite3.Error as e:
+            print(f"[ERROR] Lectura del mapa de alias de SKU en disco: {e}")
+            return {}
+        return {sku: (sku, nombre, json.loads(precio)) for sku, nombre, precio in filas}
+
+    def registrar(self, sku, nombre, precio):
+        alias = alias_sku(sku)
+        entrada = (str(sku), nombre, precio)
+        if self._en_memoria(alias, entrada):
+            self._escribir_disco([(alias, entrada)])
+        return alias
+
+    def cargar(self, registros):
+        """
+        Registra los ProductRecord del catálogo precargado (en disco, en una sola transacción).
+        """
+        nuevas = []
+        total = 0
+        for registro in registros:
+            alias = alias_sku(registro.sku)
+            entrada = (str(registro.sku), registro.nombre, registro.precio_bayovar)
+            if self._en_memoria(alias, entrada):
+                nuevas.append((alias, entrada))
+            total += 1
+        self._escribir_disco(nuevas)
+        return total
+
+    def resolver(self, alias, nombre=None):
+        with self._lock:
+            entradas = self._por_alias.get(alias)
+            candidatos = list(entradas.values()) if entradas else []
+        if not candidatos:
+            # Alias mostrado por otro worker o antes de reiniciar
+            for entrada in self._leer_disco(alias).values():
+                self._en_memoria(alias, entrada)
+                candidatos.append(entrada)
+        if not candidatos:
+            return None
+        if len(candidatos) > 1 and nombre:
+            por_nombre = [c for c in candidatos if str(c[1]).casefold() == str(nombre).casefold()]
+            if por_nombre:
+                return por_nombre[0]
+        return candidatos[0]
+
+    def restaurar(self, productos):
+        """
+        Reemplaza los alias de los productos de un pedido por el SKU completo y el precio
+        mostrado. Los SKUs que no son alias se dejan tal cual.
+        Devuelve (productos, alias que no se pudieron resolver).
+        """
+        resultado = []
+        desconocidos = []
+        for producto in productos or []:
+            if isinstance(producto, dict) and es_alias(producto.get("sku")):
+                entrada = self.resolver(producto["sku"], producto.get("nombre"))
+                if entrada is None:
+                    desconocidos.append(producto["sku"])
+                else:
+                    sku, nombre, precio = entrada
+                    producto = dict(producto, sku=sku, precio_bayovar=precio, nombre=producto.get("nombre") or nombre)
+                    self.restaurados += 1
+            resultado.append(producto)
+        self.desconocidos += len(desconocidos)
+        return resultado, desconocidos
+
+    def estadisticas(self):
+        return {
+            "alias": len(self),
+            "restaurados": self.restaurados,
+            "desconocidos": self.desconocidos,
+            "disco": self._db is not None
+        }
+
+class ResultEncoder:
+    """
+    Codifica los resultados de funciones que se guardan en el historial (y se reenvían al
+    modelo en cada turno) en un formato compacto:
+    - Búsquedas: una tabla "ref|nombre|precio_bayovar" con el SKU abreviado (ref) que el
+      modelo repite en crear_pedido; `alias` lo restaura en el servidor.
+    - Pedido creado: id, productos y total, sin los datos del cliente.
+    - Lo demás: JSON sin espacios ni escapes de acentos.
+    Con `compacto=False` se usa json.dumps como antes.
+    """
+
+    def __init__(self, alias: SkuAliasMap = None, compacto=True):
+        self.alias = alias if alias is not None else SkuAliasMap()
+        self.compacto = compacto
+
+    def __call__(self, resultado):
+        return self.codificar(resultado)
+
+    def codificar(self, resultado):
+        if not self.compacto:
+            return json.dumps(resultado)
+        if isinstance(resultado, dict):
+            if "productos_encontrados" in resultado:
+                return "\n".join([ENCABEZADO_PRODUCTOS] + self._filas(resultado["productos_encontrados"]))
+            if "resultados" in resultado:
+                return self._varias_busquedas(resultado["resultados"])
+            if isinstance(resultado.get("Pedido"), dict):
+                return self._pedido(resultado["Pedido"])
+            if set(resultado) == {"message"}:
+                return str(resultado["message"])
+        return json.dumps(resultado, ensure_ascii=False, separators=(",", ":"))
+
+    def _filas(self, productos):
+        filas = []
+        for producto in productos:
+            alias = self.alias.registrar(producto.get("sku"), producto.get("nombre"), producto.get("precio_bayovar"))
+            filas.append(f"{alias}|{_texto_celda(producto.get('nombre'))}|{_precio(producto.get('precio_bayovar'))}")
+        return filas
+
+    def _varias_busquedas(self, resultados):
+        lineas = [ENCABEZADO_PRODUCTOS]
+        for resultado in resultados:
+            lineas.append(f"# {_texto_celda(resultado.get('query'))}")
+            if resultado.get("productos_encontrados"):
+                lineas.extend(self._filas(resultado["productos_encontrados"]))
+            else:
+                lineas.append(f"({_texto_celda(resultado.get('message', 'sin resultados'))})")
+        return "\n".join(lineas)
+
+    @staticmethod
+    def _pedido(pedido):
+        productos = [p for p in pedido.get("productos") or [] if isinstance(p, dict)]
+        total = 0.0
+        for producto in productos:
+            try:
+                total += float(producto.get("precio_bayovar"))
+            except (TypeError, ValueError):
+                pass
+        lineas = [
+            f"Pedido {pedido.get('id_unico')} registrado: "
+            + "; ".join(f"{_texto_celda(p.get('nombre'))} S/{_precio(p.get('precio_bayovar'))}" for p in productos)
+            + f". Total S/{total:.2f}"
+        ]
+        for discrepancia in (pedido.get("validacion") or {}).get("discrepancias") or []:
+            if discrepancia.get("motivo") == "precio_distinto":
+                lineas.append(
+                    f"Precio de {_texto_celda(discrepancia.get('nombre'))} según el catálogo: "
+                    f"S/{_precio(discrepancia.get('precio_catalogo'))} (pedido con S/{_precio(discrepancia.get('precio_recibido'))})"
+                )
+            else:
+                lineas.append(f"Producto no encontrado en el catálogo: {_texto_celda(discrepancia.get('nombre'))}")
+        return "\n".join(lineas)
@@ -0,0 +1,222 @@
+# functions/tools.py
+import asyncio
+import inspect
+from functions.order_lookup import OrderLookup
+from services.admission import Saturado
+from utils.helpers import cargar_json
+
+# Definir tools con JSON Schema (compartidas por main.py, app.py y chats_app.py)
+TOOLS = [
+    {
+        "name": "buscar_producto",
+        "description": "Busca productos en Pinecone dada una query y retorna una lista con sus datos.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "query": {
+                    "type": "string",
+                    "description": "Texto que describe lo que el usuario busca, e.g. 'coca cola'."
+                }
+            },
+            "required": ["query"],
+            "additionalProperties": False
+        }
+    },
+    {
+        "name": "buscar_productos",
+        "description": "Busca varios productos a la vez (una consulta por producto) y retorna los resultados agrupados por consulta.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "queries": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                    "minItems": 1,
+                    "maxItems": 10,
+                    "description": "Una consulta por producto, e.g. ['coca cola', 'pan', 'arroz']."
+                }
+            },
+            "required": ["queries"],
+            "additionalProperties": False
+        }
+    },
+    {
+        "name": "crear_pedido",
+        "description": "Crea un pedido con los datos del cliente y los productos elegidos.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "datos_cliente": {
+                    "type": "object",
+                    "properties": {
+                        "nombre": {"type": "string"},
+                        "telefono": {"type": "string"},
+                        "direccion": {"type": "string"},
+                        "modalidad_entrega": {"type": "string"}
+                    },
+                    "required": ["nombre", "telefono", "direccion", "modalidad_entrega"]
+                },
+                "productos": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "nombre": {"type": "string"},
+                            "sku": {"type": "string"},
+                            "precio_bayovar": {"type": "number"}
+                        },
+                        "required": ["nombre", "sku", "precio_bayovar"]
+                    }
+                }
+            },
+            "required": ["datos_cliente", "productos"],
+            "additionalProperties": False
+        }
+    },
+    {
+        "name": "consultar_pedido",
+        "description": "Consulta el estado y contenido de un pedido ya registrado, dado su id y el teléfono del cliente.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "id_unico": {"type": "string", "description": "Id del pedido que se le dio al cliente."},
+                "telefono": {"type": "string", "description": "Teléfono con el que se registró el pedido."}
+            },
+            "required": ["id_unico", "telefono"],
+            "additionalProperties": False
+        }
+    }
+]
+
+# Mensaje system inicial
+SYSTEM_MESSAGE = {
+    "role": "system",
+    "content": (
+        "Eres un asistente de ventas que puede buscar productos en Pinecone y crear pedidos.\n"
+        "Reglas:\n"
+        "- Usa la función 'buscar_producto' cuando el usuario te pida buscar algo (por ejemplo, '¿Tienes alguna coca cola?').\n"
+        "- Si pide varios productos a la vez (por ejemplo, 'quiero coca cola, pan y arroz'), usa 'buscar_productos' con una consulta por producto.\n"
+        "- Cuando el usuario confirme la compra y proporcione sus datos, usa la función 'crear_pedido'.\n"
+        "- No muestres el SKU en la conversación, pero sí inclúyelo cuando crees el pedido.\n"
+        "- Si los productos llegan como tabla 'ref|nombre|precio_bayovar', usa la ref como sku al crear el pedido.\n"
+        "- Muestra solo precios de Bayóvar (precio_bayovar).\n"
+        "- Después de crear el pedido, saluda con un mensaje como 'Perfecto, hemos tomado tu pedido...' e indica su id.\n"
+        "- Si el usuario pregunta por un pedido anterior, pide su id y teléfono y usa 'consultar_pedido'.\n"
+    )
+}
+
+# Mensajes para informar al usuario mientras se ejecuta cada función
+MENSAJES_FASE = {
+    "buscar_producto": "Buscando productos…",
+    "buscar_productos": "Buscando productos…",
+    "crear_pedido": "Registrando tu pedido…",
+    "consultar_pedido": "Consultando tu pedido…"
+}
+
+# Turnos que la caché semántica puede guardar: solo los que no modifican nada (sin crear pedidos)
+FUNCIONES_CACHEABLES = {"buscar_producto", "buscar_productos"}
+
+class ToolRegistry:
+    """
+    Registro de funciones que el modelo puede invocar: nombre -> (función, schema).
+    Cada función recibe los argumentos ya decodificados como dict.
+    """
+
+    def __init__(self):
+        self._funciones = {}
+        self._schemas = []
+
+    def registrar(self, schema: dict, funcion):
+        self._funciones[schema["name"]] = funcion
+        self._schemas.append(schema)
+
+    def schemas(self):
+        return list(self._schemas)
+
+    def _preparar(self, nombre, argumentos):
+        funcion = self._funciones.get(nombre)
+        if isinstance(argumentos, str):
+            argumentos = cargar_json(argumentos)
+        return funcion, argumentos
+
+    def ejecutar(self, nombre: str, argumentos):
+        funcion, argumentos = self._preparar(nombre, argumentos)
+        if funcion is None:
+            return {"error": f"Función '{nombre}' no existe."}
+        try:
+            return funcion(argumentos)
+        except Saturado:
+            # Sin capacidad en OpenAI el turno completo se rechaza (429), no solo la función
+            raise
+        except Exception as e:
+            print(f"[ERROR] Falló la función '{nombre}': {e}")
+            return {"error": f"La función '{nombre}' falló."}
+
+    async def ejecutar_async(self, nombre: str, argumentos):
+        """
+        Igual que ejecutar() para registros con funciones que devuelven awaitables.
+        """
+        funcion, argumentos = self._preparar(nombre, argumentos)
+        if funcion is None:
+            return {"error": f"Función '{nombre}' no existe."}
+        try:
+            resultado = funcion(argumentos)
+            if inspect.isawaitable(resultado):
+                resultado = await resultado
+            return resultado
+        except Saturado:
+            raise
+        except Exception as e:
+            print(f"[ERROR] Falló la función '{nombre}': {e}")
+            return {"error": f"La función '{nombre}' falló."}
+
+def crear_registro(product_search, order_creation):
+    """
+    Registro con las funciones estándar del asistente.
+    """
+    order_lookup = OrderLookup(order_creation.order_index)
+    schemas = {schema["name"]: schema for schema in TOOLS}
+    registro = ToolRegistry()
+    registro.registrar(
+        schemas["buscar_producto"],
+        lambda args: product_search.buscar_producto(args.get("query", ""))
+    )
+    registro.registrar(
+        schemas["buscar_productos"],
+        lambda args: product_search.buscar_productos(args.get("queries", []))
+    )
+    registro.registrar(
+        schemas["crear_pedido"],
+        lambda args: order_creation.crear_pedido(args.get("datos_cliente", {}), args.get("productos", []))
+    )
+    registro.registrar(
+        schemas["consultar_pedido"],
+        lambda args: order_lookup.consultar_pedido(args.get("id_unico", ""), args.get("telefono", ""))
+    )
+    return registro
+
+def crear_registro_async(product_search, order_creation):
+    """
+    Registro para asgi_app.py con AsyncProductSearch y AsyncOrderCreation; se ejecuta con
+    ToolRegistry.ejecutar_async. consultar_pedido (lectura de disco) corre en un hilo.
+    """
+    order_lookup = OrderLookup(order_creation.order_index)
+    schemas = {schema["name"]: schema for schema in TOOLS}
+    registro = ToolRegistry()
+    registro.registrar(
+        schemas["buscar_producto"],
+        lambda args: product_search.buscar_producto(args.get("query", ""))
+    )
+    registro.registrar(
+        schemas["buscar_productos"],
+        lambda args: product_search.buscar_productos(args.get("queries", []))
+    )
+    registro.registrar(
+        schemas["crear_pedido"],
+        lambda args: order_creation.crear_pedido(args.get("datos_cliente", {}), args.get("productos", []))
+    )
+    registro.registrar(
+        schemas["consultar_pedido"],
+        lambda args: asyncio.to_thread(order_lookup.consultar_pedido, args.get("id_unico", ""), args.get("telefono", ""))
+    )
+    return registro
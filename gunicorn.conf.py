@@ -0,0 +1,20 @@
+# gunicorn.conf.py
+# Uso: gunicorn -c gunicorn.conf.py app:app   (o chats_app:app)
+import os
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("GUNICORN_WORKERS", "2"))
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+# Sin preload: cada worker importa la app (barato) y construye sus servicios después del fork
+preload_app = False
+
+def post_worker_init(worker):
+    """
+    El worker ya escucha en el puerto: calentar servicios en segundo plano mientras
+    /ready responde 503, en lugar de bloquear el arranque.
+    """
+    from config.settings import settings
+    if settings.WARMUP_ENABLED:
+        from services.container import obtener_servicios
+        obtener_servicios().iniciar_calentamiento()
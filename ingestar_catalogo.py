@@ -0,0 +1,31 @@
+# ingestar_catalogo.py
+import argparse
+import sys
+from services.vector_store import crear_servicio_vectorial
+from services.openai_service import OpenAIService
+from services.catalog_ingestion import CatalogIngestion
+
+def main():
+    parser = argparse.ArgumentParser(description="Carga el catálogo (CSV o JSONL) en el índice de productos.")
+    parser.add_argument("ruta", help="Archivo .csv o .jsonl con columnas sku, nombre, precio_base, ...")
+    parser.add_argument("--namespace", default="", help="Namespace del índice.")
+    parser.add_argument("--lote-embeddings", type=int, default=None, help="Productos por llamada de embeddings.")
+    parser.add_argument("--lote-upsert", type=int, default=None, help="Vectores por upsert.")
+    parser.add_argument("--concurrencia", type=int, default=None, help="Llamadas simultáneas a la API y al índice.")
+    parser.add_argument("--forzar", action="store_true", help="Reprocesar también los productos sin cambios.")
+    args = parser.parse_args()
+
+    ingesta = CatalogIngestion(
+        OpenAIService(),
+        crear_servicio_vectorial(),
+        lote_embeddings=args.lote_embeddings,
+        lote_upsert=args.lote_upsert,
+        concurrencia=args.concurrencia
+    )
+    resumen = ingesta.ingestar(args.ruta, namespace=args.namespace, forzar=args.forzar)
+    if resumen["fallidos"]:
+        print(f"[INFO] {resumen['fallidos']} productos no se subieron; vuelve a ejecutar para reintentarlos.")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
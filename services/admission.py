@@ -0,0 +1,325 @@
+# services/admission.py
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+class Saturado(Exception):
+    """
+    No hay capacidad para otra llamada a OpenAI: la cola de espera está llena o
+    la espera superaría el máximo. `reintentar_en` son los segundos sugeridos.
+    """
+
+    def __init__(self, mensaje, reintentar_en=1.0):
+        super().__init__(mensaje)
+        self.reintentar_en = reintentar_en
+
+class SesionOcupada(Exception):
+    """
+    Otro turno de la misma sesión sigue en curso después del tiempo de espera.
+    """
+
+def _liberar_arriendo(session_store, session_id, token):
+    # Si falla, el arriendo vence solo al cumplirse su duración
+    try:
+        session_store.liberar_arriendo(session_id, token)
+    except Exception as e:
+        print(f"[WARN] No se pudo liberar el arriendo de la sesión {session_id}: {e}")
+
+class _Candado:
+    def __init__(self, registro, session_id, lock, token=None):
+        self._registro = registro
+        self._session_id = session_id
+        self._lock = lock
+        self._token = token
+        self._liberado = False
+
+    def liberar(self):
+        # Idempotente: en streaming puede llamarse desde el generador y desde call_on_close
+        if not self._liberado:
+            self._liberado = True
+            try:
+                if self._token is not None:
+                    _liberar_arriendo(self._registro.session_store, self._session_id, self._token)
+            finally:
+                self._lock.release()
+                self._registro._soltar(self._session_id)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.liberar()
+        return False
+
+class SessionLocks:
+    """
+    Un lock por session_id para que los turnos de una misma sesión se ejecuten en orden
+    (obtener historial -> turno -> guardar). Los locks se crean al usarse y se descartan
+    cuando nadie los tiene ni los espera.
+    El lock es por proceso; con un `session_store` además se toma su arriendo de la sesión
+    (fila en SQLite, SET NX PX en Redis), así los workers que comparten el almacén tampoco
+    atienden a la vez la misma sesión. `duracion_arriendo` debe superar el turno más largo.
+    """
+
+    # Espera entre intentos de arriendo: empieza en el mínimo y se duplica hasta el máximo
+    ESPERA_MIN = 0.02
+    ESPERA_MAX = 0.5
+
+    def __init__(self, session_store=None, duracion_arriendo=120.0):
+        self.session_store = session_store
+        self.duracion_arriendo = duracion_arriendo
+        self._locks = {}  # session_id -> [lock, usuarios]
+        self._lock = threading.Lock()
+
+    def adquirir(self, session_id, timeout=None):
+        limite = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            entrada = self._locks.setdefault(session_id, [threading.Lock(), 0])
+            entrada[1] += 1
+        if not entrada[0].acquire(timeout=-1 if timeout is None else timeout):
+            self._soltar(session_id)
+            raise SesionOcupada(f"La sesión {session_id} tiene otro mensaje en curso.")
+        token = None
+        if self.session_store is not None:
+            try:
+                token = self._arrendar(session_id, limite)
+            except BaseException:
+                entrada[0].release()
+                self._soltar(session_id)
+                raise
+            if token is None:
+                entrada[0].release()
+                self._soltar(session_id)
+                raise SesionOcupada(f"La sesión {session_id} tiene otro mensaje en curso en otro worker.")
+        return _Candado(self, session_id, entrada[0], token)
+
+    def _arrendar(self, session_id, limite):
+        espera = self.ESPERA_MIN
+        while True:
+            token = self.session_store.arrendar(session_id, self.duracion_arriendo)
+            if token is not None or (limite is not None and time.monotonic() >= limite):
+                return token
+            time.sleep(espera if limite is None else min(espera, max(limite - time.monotonic(), 0.0)))
+            espera = min(espera * 2, self.ESPERA_MAX)
+
+    def _soltar(self, session_id):
+        with self._lock:
+            entrada = self._locks.get(session_id)
+            if entrada is not None:
+                entrada[1] -= 1
+                if entrada[1] <= 0:
+                    del self._locks[session_id]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._locks)
+
+class AsyncSessionLocks:
+    """
+    SessionLocks para asgi_app.py: un asyncio.Lock por session_id dentro del event loop
+    y, con un `session_store`, su arriendo de la sesión (consultado en un hilo).
+    """
+
+    def __init__(self, session_store=None, duracion_arriendo=120.0):
+        self.session_store = session_store
+        self.duracion_arriendo = duracion_arriendo
+        self._locks = {}  # session_id -> [lock, usuarios]
+
+    @asynccontextmanager
+    async def adquirir(self, session_id, timeout=None):
+        limite = None if timeout is None else time.monotonic() + timeout
+        entrada = self._locks.setdefault(session_id, [asyncio.Lock(), 0])
+        entrada[1] += 1
+        try:
+            try:
+                await asyncio.wait_for(entrada[0].acquire(), timeout)
+            except asyncio.TimeoutError:
+                raise SesionOcupada(f"La sesión {session_id} tiene otro mensaje en curso.") from None
+            try:
+                token = None
+                if self.session_store is not None:
+                    token = await self._arrendar(session_id, limite)
+                    if token is None:
+                        raise SesionOcupada(f"La sesión {session_id} tiene otro mensaje en curso en otro worker.")
+                try:
+                    yield
+                finally:
+                    if token is not None:
+                        await asyncio.to_thread(_liberar_arriendo, self.session_store, session_id, token)
+            finally:
+                entrada[0].release()
+        finally:
+            entrada[1] -= 1
+            if entrada[1] <= 0:
+                del self._locks[session_id]
+
+    async def _arrendar(self, session_id, limite):
+        espera = SessionLocks.ESPERA_MIN
+        while True:
+            token = await asyncio.to_thread(self.session_store.arrendar, session_id, self.duracion_arriendo)
+            if token is not None or (limite is not None and time.monotonic() >= limite):
+                return token
+            await asyncio.sleep(espera if limite is None else min(espera, max(limite - time.monotonic(), 0.0)))
+            espera = min(espera * 2, SessionLocks.ESPERA_MAX)
+
+    def __len__(self):
+        return len(self._locks)
+
+class TokenBucket:
+    """
+    Cubeta de fichas: `capacidad` fichas que se recargan a `por_segundo`.
+    Puede quedar en negativo cuando el consumo real supera al estimado.
+    """
+
+    def __init__(self, capacidad, por_segundo):
+        self.capacidad = float(capacidad)
+        self.por_segundo = float(por_segundo)
+        self.fichas = float(capacidad)
+        self._ultima = time.monotonic()
+
+    def recargar(self, ahora):
+        self.fichas = min(self.capacidad, self.fichas + (ahora - self._ultima) * self.por_segundo)
+        self._ultima = ahora
+
+    def espera(self, cantidad):
+        """
+        Segundos hasta que haya `cantidad` fichas (0 si ya las hay).
+        """
+        faltan = cantidad - self.fichas
+        return 0.0 if faltan <= 0 else faltan / self.por_segundo
+
+class AdmissionController:
+    """
+    Control de admisión de llamadas a OpenAI según los límites de la cuenta:
+    - Una cubeta de peticiones por minuto (rpm) y otra de tokens por minuto (tpm).
+    - Las llamadas sin capacidad esperan en una cola FIFO acotada (`max_cola`).
+    - Si la cola está llena o la espera estimada supera `espera_max`, se rechaza
+      de inmediato con Saturado en lugar de acumular reintentos por 429.
+    Los límites son por proceso: repartir los de la cuenta entre los workers.
+    """
+
+    def __init__(self, rpm=0, tpm=0, max_cola=100, espera_max=10.0):
+        self.cubetas = []
+        if rpm:
+            self.peticiones = TokenBucket(rpm, rpm / 60.0)
+            self.cubetas.append(self.peticiones)
+        else:
+            self.peticiones = None
+        if tpm:
+            self.tokens = TokenBucket(tpm, tpm / 60.0)
+            self.cubetas.append(self.tokens)
+        else:
+            self.tokens = None
+        self.max_cola = max_cola
+        self.espera_max = espera_max
+        self._cola = deque()
+        self._cond = threading.Condition()
+        self.admitidas = 0
+        self.rechazadas = 0
+        self.segundos_espera = 0.0
+
+    def _recargar(self):
+        ahora = time.monotonic()
+        for cubeta in self.cubetas:
+            cubeta.recargar(ahora)
+
+    def _pedido(self, tokens):
+        # Una llamada más grande que la cubeta nunca entraría: se limita a su capacidad
+        pedido = []
+        if self.peticiones is not None:
+            pedido.append((self.peticiones, 1))
+        if self.tokens is not None:
+            pedido.append((self.tokens, min(tokens, self.tokens.capacidad)))
+        return pedido
+
+    def _espera(self, pedido, adelante=0):
+        # Las `adelante` llamadas en cola antes que esta también necesitan su petición
+        return max(
+            (c.espera(n + adelante if c is self.peticiones else n) for c, n in pedido),
+            default=0.0
+        )
+
+    def adquirir(self, tokens=1):
+        """
+        Bloquea hasta que haya capacidad para una llamada de ~`tokens` tokens, o lanza Saturado.
+        """
+        if not self.cubetas:
+            return
+        pedido = self._pedido(tokens)
+        inicio = time.monotonic()
+        with self._cond:
+            self._recargar()
+            if not self._cola and self._espera(pedido) == 0.0:
+                self._consumir(pedido)
+                return
+            estimada = self._espera(pedido, len(self._cola))
+            if len(self._cola) >= self.max_cola or estimada > self.espera_max:
+                self.rechazadas += 1
+                raise Saturado("Demasiadas solicitudes a OpenAI en este momento.", max(estimada, 1.0))
+
+            turno = object()
+            self._cola.append(turno)
+            limite = inicio + self.espera_max
+            try:
+                while True:
+                    self._recargar()
+                    primero = self._cola[0] is turno
+                    if primero and self._espera(pedido) == 0.0:
+                        self._consumir(pedido)
+                        self.segundos_espera += time.monotonic() - inicio
+                        return
+                    restante = limite - time.monotonic()
+                    if restante <= 0:
+                        self.rechazadas += 1
+                        raise Saturado("Se agotó la espera por capacidad de OpenAI.", max(self._espera(pedido), 1.0))
+                    espera = self._espera(pedido) if primero else restante
+                    self._cond.wait(min(restante, max(espera, 0.005)))
+            finally:
+                self._cola.remove(turno)
+                self._cond.notify_all()
+
+    def _consumir(self, pedido):
+        for cubeta, cantidad in pedido:
+            cubeta.fichas -= cantidad
+        self.admitidas += 1
+
+    def ajustar_tokens(self, diferencia):
+        """
+        Corrige la cubeta de tokens con el consumo real (usage) menos el estimado.
+        """
+        if self.tokens is None or not diferencia:
+            return
+        with self._cond:
+            self.tokens.fichas -= diferencia
+            self._cond.notify_all()
+
+    def estadisticas(self):
+        with self._cond:
+            return {
+                "admitidas": self.admitidas,
+                "rechazadas": self.rechazadas,
+                "en_cola": len(self._cola),
+                "segundos_espera": round(self.segundos_espera, 3)
+            }
+
+def instalar_admision(app):
+    """
+    Respuestas HTTP para los rechazos: 429 con Retry-After si OpenAI está saturado
+    y 409 si la sesión ya tiene un turno en curso.
+    """
+    import math
+    from flask import jsonify
+
+    @app.errorhandler(Saturado)
+    def _saturado(error):
+        respuesta = jsonify({"error": "Hay muchas solicitudes en este momento, intente nuevamente en unos segundos."})
+        respuesta.headers["Retry-After"] = str(math.ceil(error.reintentar_en))
+        return respuesta, 429
+
+    @app.errorhandler(SesionOcupada)
+    def _sesion_ocupada(error):
+        return jsonify({"error": "Hay otro mensaje de esta sesión en curso."}), 409
+
+    return app
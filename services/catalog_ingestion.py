@@ -0,0 +1,239 @@
+# services/catalog_ingestion.py
+import csv
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from config.settings import settings
+from services.catalog_version import CatalogVersion
+
+# Columnas que van directo a la metadata; el resto se guarda en "atributos" (JSON)
+CAMPOS_BASE = ("sku", "nombre", "precio_base")
+# Columnas que, si existen, se añaden al texto que se embebe
+CAMPOS_TEXTO = ("nombre", "marca", "categoria", "descripcion", "presentacion")
+
+def leer_productos(ruta):
+    """
+    Lee productos de un CSV o JSONL sin cargar el archivo completo en memoria.
+    """
+    if ruta.lower().endswith((".jsonl", ".ndjson")):
+        with open(ruta, "r", encoding="utf-8") as f:
+            for linea in f:
+                linea = linea.strip()
+                if linea:
+                    yield json.loads(linea)
+    else:
+        with open(ruta, "r", encoding="utf-8-sig", newline="") as f:
+            for fila in csv.DictReader(f):
+                yield fila
+
+def preparar_producto(producto: dict):
+    """
+    Devuelve (id, texto_a_embeber, metadata, hash) o None si el producto no tiene SKU.
+    """
+    sku = str(producto.get("sku") or "").strip()
+    if not sku:
+        return None
+    texto = " ".join(str(producto[c]).strip() for c in CAMPOS_TEXTO if producto.get(c))
+    try:
+        precio = float(producto.get("precio_base") or 0.0)
+    except (TypeError, ValueError):
+        precio = 0.0
+    metadata = {
+        "sku": sku,
+        "nombre": str(producto.get("nombre") or "Producto sin nombre"),
+        "precio_base": precio
+    }
+    extras = {k: v for k, v in producto.items() if k not in CAMPOS_BASE and v not in (None, "")}
+    if extras:
+        metadata["atributos"] = json.dumps(extras, ensure_ascii=False, sort_keys=True)
+    firma = json.dumps([texto, metadata], ensure_ascii=False, sort_keys=True)
+    return sku, texto or metadata["nombre"], metadata, hashlib.sha1(firma.encode("utf-8")).hexdigest()
+
+class EstadoIngesta:
+    """
+    Hash del contenido de cada producto ya subido. Permite omitir productos sin cambios
+    y retomar una ingesta interrumpida.
+    """
+
+    def __init__(self, ruta):
+        os.makedirs(os.path.dirname(os.path.abspath(ruta)), exist_ok=True)
+        self._db = sqlite3.connect(ruta, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS productos ("
+            "namespace TEXT, sku TEXT, hash TEXT, actualizado REAL, PRIMARY KEY (namespace, sku))"
+        )
+        self._db.commit()
+        self._lock = threading.Lock()
+
+    def hashes(self, namespace):
+        with self._lock:
+            return dict(self._db.execute(
+                "SELECT sku, hash FROM productos WHERE namespace = ?", (namespace,)
+            ).fetchall())
+
+    def marcar(self, namespace, pares):
+        ahora = time.time()
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO productos (namespace, sku, hash, actualizado) VALUES (?, ?, ?, ?)",
+                [(namespace, sku, h, ahora) for sku, h in pares]
+            )
+            self._db.commit()
+
+class CatalogIngestion:
+    """
+    Carga el catálogo en el índice vectorial:
+    lectura en streaming -> omitir sin cambios -> embeddings por lotes -> upserts
+    por lotes en paralelo (concurrencia acotada, con reintentos).
+    """
+
+    def __init__(self, openai_service, vector_service, estado: EstadoIngesta = None,
+                 lote_embeddings=None, lote_upsert=None, concurrencia=None, reintentos=3,
+                 catalog_version: CatalogVersion = None):
+        self.openai = openai_service
+        self.vectores = vector_service
+        self.estado = estado or EstadoIngesta(settings.INGESTA_ESTADO_FILE)
+        self.catalog_version = catalog_version or CatalogVersion(settings.CATALOGO_VERSION_FILE)
+        self.lote_embeddings = lote_embeddings or settings.INGESTA_LOTE_EMBEDDINGS
+        self.lote_upsert = lote_upsert or settings.INGESTA_LOTE_UPSERT
+        self.concurrencia = concurrencia or settings.INGESTA_CONCURRENCIA
+        self.reintentos = reintentos
+
+    def _con_reintentos(self, descripcion, funcion, *args):
+        espera = 1.0
+        for intento in range(1, self.reintentos + 1):
+            resultado = funcion(*args)
+            if resultado:
+                return resultado
+            if intento < self.reintentos:
+                print(f"[WARN] Falló {descripcion} (intento {intento}/{self.reintentos}); reintentando en {espera:.0f}s.")
+                time.sleep(espera)
+                espera *= 2
+        return None
+
+    def ingestar(self, ruta, namespace="", forzar=False, reportar_cada=1000):
+        inicio = time.monotonic()
+        previos = {} if forzar else self.estado.hashes(namespace)
+        resumen = {"leidos": 0, "omitidos": 0, "invalidos": 0, "subidos": 0, "fallidos": 0}
+        lock = threading.Lock()
+        # Con un índice que solo escribe al persistir() (índice local), los hashes se marcan
+        # después de persistir: si la ingesta se corta, esos productos se vuelven a subir
+        diferido = hasattr(self.vectores, "persistir")
+        por_marcar = []
+        # Limitan los lotes en vuelo para no acumular memoria si la API o Pinecone van más lentos
+        embeddings_en_vuelo = threading.BoundedSemaphore(self.concurrencia)
+        subidas_en_vuelo = threading.BoundedSemaphore(self.concurrencia * 2)
+
+        def fallar(cantidad, descripcion, error):
+            print(f"[ERROR] Error en {descripcion}: {error}")
+            with lock:
+                resumen["fallidos"] += cantidad
+
+        def subir(lote):
+            try:
+                vectores = [(sku, emb, meta) for sku, emb, meta, _ in lote]
+                ok = self._con_reintentos(
+                    f"upsert de {len(lote)} vectores", self.vectores.upsert_vectores, vectores, namespace
+                )
+                with lock:
+                    if not ok:
+                        resumen["fallidos"] += len(lote)
+                        return
+                    pares = [(sku, h) for sku, _, _, h in lote]
+                    if diferido:
+                        por_marcar.extend(pares)
+                    else:
+                        self.estado.marcar(namespace, pares)
+                    resumen["subidos"] += len(lote)
+            except Exception as e:
+                fallar(len(lote), f"el upsert de {len(lote)} vectores", e)
+            finally:
+                subidas_en_vuelo.release()
+
+        def embeber(pendientes):
+            try:
+                textos = [texto for _, texto, _, _ in pendientes]
+                embeddings = self._con_reintentos(
+                    f"embeddings de {len(textos)} productos",
+                    lambda: self.openai.generar_embeddings(textos, usar_cache=False)
+                )
+                if embeddings is None:
+                    with lock:
+                        resumen["fallidos"] += len(pendientes)
+                    return
+                listos = [(sku, emb, meta, h) for (sku, _, meta, h), emb in zip(pendientes, embeddings)]
+                for i in range(0, len(listos), self.lote_upsert):
+                    subidas_en_vuelo.acquire()
+                    futuros.append(subidas.submit(subir, listos[i:i + self.lote_upsert]))
+            except Exception as e:
+                # Saturado (límites rpm/tpm) u otro error: los productos quedan para la próxima ejecución
+                fallar(len(pendientes), f"los embeddings de {len(pendientes)} productos", e)
+            finally:
+                embeddings_en_vuelo.release()
+
+        def encolar(pendientes):
+            embeddings_en_vuelo.acquire()
+            futuros.append(embebedores.submit(embeber, pendientes))
+
+        futuros = []
+        # Al salir del bloque se espera primero a los embeddings y luego a las subidas
+        with ThreadPoolExecutor(max_workers=self.concurrencia, thread_name_prefix="ingesta-subida") as subidas, \
+                ThreadPoolExecutor(max_workers=self.concurrencia, thread_name_prefix="ingesta-embeddings") as embebedores:
+            pendientes = []
+            for producto in leer_productos(ruta):
+                resumen["leidos"] += 1
+                preparado = preparar_producto(producto)
+                if preparado is None:
+                    resumen["invalidos"] += 1
+                elif previos.get(preparado[0]) == preparado[3]:
+                    resumen["omitidos"] += 1
+                else:
+                    pendientes.append(preparado)
+                    if len(pendientes) >= self.lote_embeddings:
+                        encolar(pendientes)
+                        pendientes = []
+                if reportar_cada and resumen["leidos"] % reportar_cada == 0:
+                    self._reportar(resumen, inicio)
+            if pendientes:
+                encolar(pendientes)
+
+        # Lo que haya escapado a los manejadores de subir/embeber no debe perderse en silencio
+        for futuro in futuros:
+            if futuro.exception() is not None:
+                print(f"[ERROR] Error no controlado en la ingesta: {futuro.exception()}")
+                resumen["fallidos"] += 1
+
+        if diferido:
+            try:
+                persistido = self.vectores.persistir()
+            except Exception as e:
+                print(f"[ERROR] No se pudo persistir el índice: {e}")
+                persistido = False
+            if persistido:
+                self.estado.marcar(namespace, por_marcar)
+            else:
+                resumen["fallidos"] += resumen["subidos"]
+                resumen["subidos"] = 0
+        if resumen["subidos"]:
+            # Invalida las cachés que dependen del catálogo (p. ej. la caché semántica)
+            self.catalog_version.incrementar()
+
+        resumen["segundos"] = round(time.monotonic() - inicio, 2)
+        resumen["productos_por_segundo"] = round(resumen["subidos"] / resumen["segundos"], 1) if resumen["segundos"] else 0.0
+        self._reportar(resumen, inicio)
+        return resumen
+
+    @staticmethod
+    def _reportar(resumen, inicio):
+        segundos = time.monotonic() - inicio
+        ritmo = resumen["subidos"] / segundos if segundos else 0.0
+        print(
+            f"[INGESTA] leídos={resumen['leidos']} omitidos={resumen['omitidos']} "
+            f"subidos={resumen['subidos']} fallidos={resumen['fallidos']} "
+            f"({ritmo:.1f} productos/s, {segundos:.1f}s)"
+        )
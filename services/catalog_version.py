@@ -0,0 +1,38 @@
+# services/catalog_version.py
+import os
+import time
+
+class CatalogVersion:
+    """
+    Versión del catálogo guardada en un archivo compartido por todos los workers.
+    La ingesta la incrementa; las cachés derivadas del catálogo la comparan para invalidarse.
+    """
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self._mtime = None
+        self._version = "0"
+
+    def actual(self):
+        # Solo se relee el archivo cuando cambia su mtime (un stat por consulta)
+        try:
+            mtime = os.stat(self.ruta).st_mtime_ns
+        except OSError:
+            return "0"
+        if mtime != self._mtime:
+            try:
+                with open(self.ruta, "r", encoding="utf-8") as f:
+                    self._version = f.read().strip() or "0"
+                self._mtime = mtime
+            except OSError:
+                pass
+        return self._version
+
+    def incrementar(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.ruta)), exist_ok=True)
+        version = str(time.time_ns())
+        temporal = f"{self.ruta}.{os.getpid()}.tmp"
+        with open(temporal, "w", encoding="utf-8") as f:
+            f.write(version)
+        os.replace(temporal, self.ruta)
+        return version
@@ -0,0 +1,371 @@
+# services/container.py
+import asyncio
+import threading
+import time
+from config.settings import settings
+from services import vector_store
+from utils.metrics import metricas, recolector_admision, recolector_cache, recolector_router
+
+class ServicioNoDisponible(RuntimeError):
+    """
+    No se pudo construir un servicio (credenciales, red, índice...).
+    """
+
+class ServiceContainer:
+    """
+    Servicios compartidos por app.py, chats_app.py y main.py, construidos la primera vez
+    que se usan (no al importar). Así un worker arranca sin esperar a Pinecone ni a OpenAI.
+    calentar() los construye de antemano en segundo plano y /ready informa su estado.
+    """
+
+    def __init__(self):
+        self._instancias = {}
+        # Reentrante: construir el engine construye antes openai_service, etc.
+        self._lock = threading.RLock()
+        self._hilo_calentamiento = None
+        self.estado = "pendiente"
+        self.error = None
+        self.segundos_calentamiento = None
+
+    def _obtener(self, nombre, fabrica):
+        try:
+            return self._instancias[nombre]
+        except KeyError:
+            pass
+        with self._lock:
+            if nombre not in self._instancias:
+                try:
+                    self._instancias[nombre] = fabrica()
+                except (RuntimeError, OSError) as e:
+                    raise ServicioNoDisponible(f"No se pudo inicializar {nombre}: {e}") from e
+            return self._instancias[nombre]
+
+    # --- Servicios ---
+
+    @property
+    def pinecone_service(self):
+        return self._obtener("pinecone_service", vector_store.crear_servicio_vectorial)
+
+    @property
+    def openai_service(self):
+        def crear():
+            from services.openai_service import OpenAIService
+            servicio = OpenAIService()
+            metricas.agregar_recolector(recolector_cache("embeddings", servicio.embedding_cache.estadisticas))
+            metricas.agregar_recolector(recolector_admision(servicio.admision))
+            return servicio
+        return self._obtener("openai_service", crear)
+
+    @property
+    def product_search(self):
+        def crear():
+            from functions.product_search import ProductSearch
+            busqueda = ProductSearch(self.pinecone_service, self.openai_service, canonizador=self.canonizador)
+            busqueda.precargar_cache()
+            metricas.agregar_recolector(recolector_cache("productos", busqueda.cache.estadisticas))
+            return busqueda
+        return self._obtener("product_search", crear)
+
+    @property
+    def canonizador(self):
+        """
+        Canonizador de consultas de producto, o None si está desactivado.
+        """
+        def crear():
+            if not settings.QUERY_CANONICALIZATION_ENABLED:
+                return None
+            from functions.query_canonicalizer import QueryCanonicalizer
+            if settings.QUERY_SYNONYMS_FILE:
+                return QueryCanonicalizer.desde_archivo(settings.QUERY_SYNONYMS_FILE)
+            return QueryCanonicalizer()
+        return self._obtener("canonizador", crear)
+
+    @property
+    def order_creation(self):
+        def crear():
+            from functions.order_creation import OrderCreation
+            return OrderCreation(validador=self.price_validator, alias=self.sku_alias)
+        return self._obtener("order_creation", crear)
+
+    @property
+    def price_validator(self):
+        """
+        Verificador de precios de los pedidos, o None si está desactivado.
+        """
+        def crear():
+            if not settings.PRICE_VALIDATION_POLICY:
+                return None
+            from functions.price_validation import PriceValidator
+            cache = self.product_search.cache
+            validador = PriceValidator(
+                self.pinecone_service,
+                cache.catalog_version,
+                politica=settings.PRICE_VALIDATION_POLICY,
+                tolerancia=settings.PRICE_VALIDATION_TOLERANCE
+            )
+            if cache.completo:
+                validador.cargar_desde_registros(cache.registros())
+            self.product_search.al_precargar.append(validador.cargar_desde_registros)
+            return validador
+        return self._obtener("price_validator", crear)
+
+    @property
+    def sku_alias(self):
+        """
+        Alias cortos de SKU de los resultados compactos, o None con FUNCTION_RESULT_FORMAT=json.
+        """
+        def crear():
+            if settings.FUNCTION_RESULT_FORMAT != "compacto":
+                return None
+            from functions.result_encoding import SkuAliasMap
+            alias = SkuAliasMap(max_items=settings.PRODUCT_CACHE_SIZE, ruta_disco=settings.SKU_ALIAS_FILE or None)
+            cache = self.product_search.cache
+            if cache.completo:
+                alias.cargar(cache.registros())
+            self.product_search.al_precargar.append(alias.cargar)
+            return alias
+        return self._obtener("sku_alias", crear)
+
+    @property
+    def codificador(self):
+        """
+        Codificador de resultados de funciones para el historial.
+        """
+        def crear():
+            from functions.result_encoding import ResultEncoder
+            alias = self.sku_alias
+            return ResultEncoder(alias, compacto=alias is not None)
+        return self._obtener("codificador", crear)
+
+    @property
+    def registro(self):
+        def crear():
+            from functions.tools import crear_registro
+            return crear_registro(self.product_search, self.order_creation)
+        return self._obtener("registro", crear)
+
+    @property
+    def router(self):
+        """
+        Enrutador local de intención, o None si está desactivado.
+        """
+        def crear():
+            if not settings.INTENT_ROUTER_ENABLED:
+                return None
+            from functions.intent_router import IntentRouter, ClasificadorBayes
+            clasificador = None
+            if settings.INTENT_ROUTER_TRAINING_FILE:
+                clasificador = ClasificadorBayes.desde_archivo(settings.INTENT_ROUTER_TRAINING_FILE)
+            router = IntentRouter(
+                cobertura=self.product_search.cobertura_lexica,
+                clasificador=clasificador,
+                umbral=settings.INTENT_ROUTER_THRESHOLD
+            )
+            metricas.agregar_recolector(recolector_router(router))
+            return router
+        return self._obtener("router", crear)
+
+    @property
+    def engine(self):
+        def crear():
+            from services.conversation_engine import ConversationEngine
+            return ConversationEngine(
+                self.openai_service, self.registro,
+                router=self.router, modelo_seleccion=settings.TOOL_SELECTION_MODEL or None,
+                codificador=self.codificador
+            )
+        return self._obtener("engine", crear)
+
+    # --- Versiones asíncronas (asgi_app.py) ---
+    # Envuelven a los servicios síncronos: comparten cachés, índices y métricas.
+
+    @property
+    def async_openai_service(self):
+        def crear():
+            from services.openai_service import AsyncOpenAIService
+            return AsyncOpenAIService(self.openai_service, max_conexiones=settings.ASGI_OPENAI_CONEXIONES)
+        return self._obtener("async_openai_service", crear)
+
+    @property
+    def async_pinecone_service(self):
+        return self._obtener("async_pinecone_service", lambda: vector_store.AsyncPineconeService(self.pinecone_service))
+
+    @property
+    def async_product_search(self):
+        def crear():
+            from functions.product_search import AsyncProductSearch
+            return AsyncProductSearch(self.product_search, self.async_openai_service, self.async_pinecone_service)
+        return self._obtener("async_product_search", crear)
+
+    @property
+    def async_order_creation(self):
+        def crear():
+            from functions.order_creation import AsyncOrderCreation
+            return AsyncOrderCreation(self.order_creation)
+        return self._obtener("async_order_creation", crear)
+
+    @property
+    def async_engine(self):
+        def crear():
+            from functions.tools import crear_registro_async
+            from services.conversation_engine import AsyncConversationEngine
+            return AsyncConversationEngine(
+                self.async_openai_service,
+                crear_registro_async(self.async_product_search, self.async_order_creation),
+                router=self.router, modelo_seleccion=settings.TOOL_SELECTION_MODEL or None,
+                codificador=self.codificador
+            )
+        return self._obtener("async_engine", crear)
+
+    @property
+    def async_session_locks(self):
+        def crear():
+            from services.admission import AsyncSessionLocks
+            return AsyncSessionLocks(self._almacen_compartido(), settings.SESSION_LEASE_TTL)
+        return self._obtener("async_session_locks", crear)
+
+    def construido(self, nombre):
+        """
+        El servicio `nombre` si ya se construyó, sin construirlo; si no, None.
+        """
+        return self._instancias.get(nombre)
+
+    async def obtener_async(self, nombre):
+        """
+        Devuelve el servicio `nombre`; si aún no existe se construye en un hilo
+        para no bloquear el event loop.
+        """
+        if nombre in self._instancias:
+            return self._instancias[nombre]
+        return await asyncio.to_thread(getattr, self, nombre)
+
+    @property
+    def session_store(self):
+        def crear():
+            from services.session_store import crear_session_store
+            return crear_session_store()
+        return self._obtener("session_store", crear)
+
+    def _almacen_compartido(self):
+        # Solo los almacenes compartidos entre workers necesitan arriendo además del lock local
+        if settings.SESSION_BACKEND in ("sqlite", "redis"):
+            return self.session_store
+        return None
+
+    @property
+    def session_locks(self):
+        def crear():
+            from services.admission import SessionLocks
+            return SessionLocks(self._almacen_compartido(), settings.SESSION_LEASE_TTL)
+        return self._obtener("session_locks", crear)
+
+    @property
+    def semantic_cache(self):
+        """
+        Caché semántica de respuestas para el primer turno, o None si está desactivada.
+        """
+        def crear():
+            if not settings.SEMANTIC_CACHE_ENABLED:
+                return None
+            from services.catalog_version import CatalogVersion
+            from services.semantic_cache import SemanticCache
+            cache = SemanticCache(
+                CatalogVersion(settings.CATALOGO_VERSION_FILE),
+                max_items=settings.SEMANTIC_CACHE_SIZE,
+                ttl=settings.SEMANTIC_CACHE_TTL,
+                umbral=settings.SEMANTIC_CACHE_THRESHOLD,
+                dimension=settings.PINECONE_DIMENSION,
+                canonizar=self.canonizador.canonizar if self.canonizador is not None else None
+            )
+            metricas.agregar_recolector(recolector_cache("semantica", cache.estadisticas))
+            return cache
+        return self._obtener("semantic_cache", crear)
+
+    # --- Calentamiento ---
+
+    def calentar(self):
+        """
+        Construye los servicios (incluida la precarga de la caché de productos) y abre las conexiones.
+        """
+        inicio = time.monotonic()
+        self.estado = "calentando"
+        try:
+            self.session_store
+            self.semantic_cache
+            self.engine
+            for servicio in (self.pinecone_service, self.openai_service):
+                if hasattr(servicio, "calentar"):
+                    servicio.calentar()
+        except Exception as e:
+            print(f"[ERROR] Falló el calentamiento de los servicios: {e}")
+            self.error = str(e)
+            self.estado = "error"
+            return False
+        self.segundos_calentamiento = round(time.monotonic() - inicio, 3)
+        self.estado = "listo"
+        print(f"Servicios listos en {self.segundos_calentamiento}s.")
+        return True
+
+    def iniciar_calentamiento(self):
+        """
+        Lanza calentar() en un hilo de fondo (una sola vez por proceso).
+        """
+        with self._lock:
+            if self._hilo_calentamiento is None:
+                self._hilo_calentamiento = threading.Thread(
+                    target=self.calentar, name="calentamiento", daemon=True
+                )
+                self._hilo_calentamiento.start()
+        return self._hilo_calentamiento
+
+    def preparado(self):
+        """
+        Estado para /ready: (listo, detalle). Sin calentamiento, los servicios se
+        construyen en la primera petición y el worker se considera listo.
+        """
+        if not settings.WARMUP_ENABLED:
+            return True, {"estado": "listo", "calentamiento": "desactivado"}
+        detalle = {"estado": self.estado}
+        if self.error:
+            detalle["error"] = self.error
+        if self.segundos_calentamiento is not None:
+            detalle["segundos_calentamiento"] = self.segundos_calentamiento
+        return self.estado == "listo", detalle
+
+_servicios = None
+_servicios_lock = threading.Lock()
+
+def obtener_servicios():
+    """
+    Contenedor de servicios del proceso (uno por worker).
+    """
+    global _servicios
+    if _servicios is None:
+        with _servicios_lock:
+            if _servicios is None:
+                _servicios = ServiceContainer()
+    return _servicios
+
+def instalar_preparacion(app, servicios):
+    """
+    Expone /ready en una app Flask y, si está activado, lanza el calentamiento con la
+    primera petición (normalmente la sonda de readiness, ya con el puerto abierto).
+    Con gunicorn, gunicorn.conf.py lo lanza antes desde post_worker_init.
+    """
+    from flask import jsonify
+
+    if settings.WARMUP_ENABLED:
+        @app.before_request
+        def _calentar_servicios():
+            servicios.iniciar_calentamiento()
+
+    @app.errorhandler(ServicioNoDisponible)
+    def _servicio_no_disponible(error):
+        return jsonify({"error": "Servicio no disponible, intente nuevamente."}), 503
+
+    @app.route('/ready', methods=['GET'])
+    def ready():
+        listo, detalle = servicios.preparado()
+        return jsonify(detalle), 200 if listo else 503
+
+    return app
@@ -0,0 +1,384 @@
+# services/conversation_engine.py
+import asyncio
+import json
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from config.settings import settings
+from functions.tools import MENSAJES_FASE
+from services.admission import Saturado
+from services.history_compaction import HistoryCompactor
+from utils.metrics import CHAT_COMPLETION
+
+# Turno cortado por Saturado después de ejecutar funciones (p. ej. crear_pedido): lo hecho se conserva
+SATURADO_CON_FUNCIONES = (
+    "Hay muchas solicitudes en este momento. Lo ya realizado en este mensaje quedó registrado; "
+    "escriba de nuevo en unos segundos para continuar."
+)
+
+class LlamadaFuncion:
+    __slots__ = ("id", "nombre", "argumentos")
+
+    def __init__(self, id, nombre, argumentos):
+        self.id = id
+        self.nombre = nombre
+        self.argumentos = argumentos
+
+class ConversationEngine:
+    """
+    Ciclo modelo -> funciones -> modelo compartido por main.py, app.py y chats_app.py.
+    - Repite hasta que el modelo responde con texto o se alcanza `max_iteraciones`.
+    - Si el modelo pide varias funciones a la vez (API de tools), se ejecutan en paralelo.
+    - Modifica `messages` en sitio con los mensajes del asistente y de las funciones;
+      al modelo se le envía una versión compactada según el presupuesto de tokens.
+    - `codificador(resultado)` convierte el resultado de cada función en el contenido del
+      mensaje (por defecto json.dumps; ver functions/result_encoding.py).
+    - Con un `router`, las búsquedas claras llaman a buscar_producto sin pasar por el modelo
+      y las probables usan `modelo_seleccion` (más barato) en la primera llamada.
+    - Saturado antes de ejecutar funciones se propaga (el turno se rechaza y el cliente lo
+      reintenta); si ya se ejecutaron, el turno termina con error conservando sus resultados,
+      para que el reintento no repita un pedido ya creado.
+    """
+
+    def __init__(self, openai_service, registro, max_iteraciones=None, max_workers=None, usar_tools=None, model="gpt-4",
+                 compactor=None, router=None, modelo_seleccion=None, codificador=None):
+        self.openai = openai_service
+        self.registro = registro
+        self.router = router
+        self.modelo_seleccion = modelo_seleccion
+        self.codificador = codificador or json.dumps
+        self.max_iteraciones = max_iteraciones or settings.MAX_TOOL_ITERATIONS
+        self.usar_tools = settings.OPENAI_PARALLEL_TOOLS if usar_tools is None else usar_tools
+        self.model = model
+        if compactor is None:
+            compactor = HistoryCompactor(
+                presupuesto_tokens=settings.HISTORY_TOKEN_BUDGET,
+                turnos_recientes=settings.HISTORY_RECENT_TURNS,
+                modelo=model
+            )
+        self.compactor = compactor
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or settings.TOOL_WORKERS,
+            thread_name_prefix="tools"
+        )
+
+    def _parametros(self):
+        schemas = self.registro.schemas()
+        if self.usar_tools:
+            return {"tools": [{"type": "function", "function": schema} for schema in schemas]}
+        return {"functions": schemas}
+
+    # --- Turno completo ---
+
+    def ejecutar_turno(self, messages, observador=None):
+        """
+        Ejecuta un turno y devuelve {"contenido": str|None, "error": str|None, "funciones": [...]}.
+        `observador(nombre, argumentos)` se llama antes de ejecutar cada función.
+        """
+        pasos = self._pasos_turno(messages, observador)
+        respuesta = None
+        error = None
+        while True:
+            try:
+                paso = pasos.send(respuesta) if error is None else pasos.throw(error)
+            except StopIteration as fin:
+                return fin.value
+            error = None
+            try:
+                if paso[0] == "modelo":
+                    respuesta = self._completar(messages, paso[1], paso[2])
+                else:
+                    respuesta = self._despachar(paso[1])
+            except Saturado as e:
+                # _pasos_turno decide si se rechaza el turno o se conserva lo ya ejecutado
+                error = e
+
+    def _pasos_turno(self, messages, observador):
+        """
+        Lógica del turno sin E/S, compartida por ejecutar_turno y AsyncConversationEngine:
+        genera ("modelo", modelo, iteracion) o ("funciones", llamadas), recibe la respuesta
+        del modelo o los resultados, y al terminar devuelve el resultado del turno.
+        """
+        funciones = []
+        decision = self._enrutar(messages)
+        modelo = self.model
+        if decision is not None and decision.accion == "sintetizar":
+            llamada = self._llamada_sintetica(decision)
+            if observador is not None:
+                observador(llamada.nombre, llamada.argumentos)
+            resultados = yield "funciones", [llamada]
+            self._anotar_llamadas(messages, [llamada])
+            self._anotar_resultados(messages, [llamada], resultados)
+            funciones.append(llamada.nombre)
+        elif decision is not None and decision.accion == "modelo_seleccion" and self.modelo_seleccion:
+            modelo = self.modelo_seleccion
+
+        try:
+            return (yield from self._iteraciones(messages, observador, modelo, funciones))
+        except Saturado:
+            if not funciones:
+                raise
+            return {"contenido": None, "error": SATURADO_CON_FUNCIONES, "funciones": funciones}
+
+    def _iteraciones(self, messages, observador, modelo, funciones):
+        for iteracion in range(1, self.max_iteraciones + 1):
+            respuesta = yield "modelo", modelo, iteracion
+            if respuesta is None:
+                return {"contenido": None, "error": "No se obtuvo respuesta de OpenAI.", "funciones": funciones}
+
+            llamadas = self._extraer_llamadas(respuesta)
+            if not llamadas and modelo != self.model:
+                # El modelo barato solo elige funciones; si responde con texto se repite con el principal
+                self.router.registrar("seleccion_sin_funcion")
+                respuesta = yield "modelo", self.model, iteracion
+                if respuesta is None:
+                    return {"contenido": None, "error": "No se obtuvo respuesta de OpenAI.", "funciones": funciones}
+                llamadas = self._extraer_llamadas(respuesta)
+            modelo = self.model
+            if not llamadas:
+                contenido = respuesta.get("content")
+                if contenido:
+                    messages.append({"role": "assistant", "content": contenido})
+                return {"contenido": contenido, "error": None, "funciones": funciones}
+
+            if observador is not None:
+                for llamada in llamadas:
+                    observador(llamada.nombre, llamada.argumentos)
+            # Las llamadas se anotan junto con sus resultados: sin resultados no quedan en el historial
+            resultados = yield "funciones", llamadas
+            self._anotar_llamadas(messages, llamadas)
+            self._anotar_resultados(messages, llamadas, resultados)
+            funciones.extend(llamada.nombre for llamada in llamadas)
+
+        return {
+            "contenido": None,
+            "error": "Se alcanzó el máximo de llamadas a funciones en este turno.",
+            "funciones": funciones
+        }
+
+    def _completar(self, messages, modelo, iteracion):
+        with CHAT_COMPLETION.medir(iteracion=iteracion):
+            return self.openai.chat_completion(
+                messages=self.compactor.compactar(messages), model=modelo, **self._parametros()
+            )
+
+    # --- Enrutamiento local ---
+
+    def _enrutar(self, messages):
+        if self.router is None:
+            return None
+        return self.router.enrutar(messages)
+
+    def _llamada_sintetica(self, decision):
+        # Con la API de tools el mensaje del asistente necesita un id de llamada
+        id_llamada = f"call_{uuid.uuid4().hex[:24]}" if self.usar_tools else None
+        if len(decision.consultas) > 1:
+            argumentos = {"queries": decision.consultas}
+            return LlamadaFuncion(id_llamada, "buscar_productos", json.dumps(argumentos, ensure_ascii=False))
+        argumentos = {"query": decision.query}
+        return LlamadaFuncion(id_llamada, "buscar_producto", json.dumps(argumentos, ensure_ascii=False))
+
+    # --- Turno en streaming ---
+
+    def ejecutar_turno_stream(self, messages):
+        """
+        Igual que ejecutar_turno pero genera eventos (tipo, datos) a medida que llegan:
+        'token', 'herramienta', 'fin' o 'error'.
+        Los tokens se envían según llegan, así que aquí no se usa el modelo de selección.
+        """
+        decision = self._enrutar(messages)
+        ejecutadas = False
+        if decision is not None and decision.accion == "sintetizar":
+            llamada = self._llamada_sintetica(decision)
+            yield "herramienta", {"nombre": llamada.nombre, "mensaje": MENSAJES_FASE.get(llamada.nombre, "Procesando…")}
+            self._resolver_llamadas(messages, [llamada])
+            ejecutadas = True
+
+        for _ in range(self.max_iteraciones):
+            try:
+                deltas = self.openai.chat_completion_stream(
+                    messages=self.compactor.compactar(messages), model=self.model, **self._parametros()
+                )
+            except Saturado:
+                if not ejecutadas:
+                    raise
+                yield "error", {"error": SATURADO_CON_FUNCIONES}
+                return
+            if deltas is None:
+                yield "error", {"error": "No se obtuvo respuesta de OpenAI."}
+                return
+
+            contenido = []
+            funcion = {"name": "", "arguments": ""}
+            tool_calls = {}
+            for delta in deltas:
+                texto = delta.get("content")
+                if texto:
+                    contenido.append(texto)
+                    yield "token", {"texto": texto}
+                fragmento = delta.get("function_call")
+                if fragmento:
+                    funcion["name"] += fragmento.get("name") or ""
+                    funcion["arguments"] += fragmento.get("arguments") or ""
+                for fragmento in delta.get("tool_calls") or []:
+                    actual = tool_calls.setdefault(fragmento["index"], {"id": "", "name": "", "arguments": ""})
+                    actual["id"] += fragmento.get("id") or ""
+                    fn = fragmento.get("function") or {}
+                    actual["name"] += fn.get("name") or ""
+                    actual["arguments"] += fn.get("arguments") or ""
+
+            if tool_calls:
+                llamadas = [
+                    LlamadaFuncion(tc["id"], tc["name"], tc["arguments"])
+                    for _, tc in sorted(tool_calls.items())
+                ]
+            elif funcion["name"]:
+                llamadas = [LlamadaFuncion(None, funcion["name"], funcion["arguments"])]
+            else:
+                assistant_content = "".join(contenido)
+                if assistant_content:
+                    messages.append({"role": "assistant", "content": assistant_content})
+                yield "fin", {"assistant": assistant_content}
+                return
+
+            for llamada in llamadas:
+                yield "herramienta", {
+                    "nombre": llamada.nombre,
+                    "mensaje": MENSAJES_FASE.get(llamada.nombre, "Procesando…")
+                }
+            try:
+                self._resolver_llamadas(messages, llamadas)
+            except Saturado:
+                if not ejecutadas:
+                    raise
+                yield "error", {"error": SATURADO_CON_FUNCIONES}
+                return
+            ejecutadas = True
+
+        yield "error", {"error": "Se alcanzó el máximo de llamadas a funciones en este turno."}
+
+    # --- Funciones ---
+
+    @staticmethod
+    def _extraer_llamadas(mensaje):
+        tool_calls = mensaje.get("tool_calls")
+        if tool_calls:
+            return [
+                LlamadaFuncion(tc["id"], tc["function"]["name"], tc["function"].get("arguments") or "{}")
+                for tc in tool_calls
+            ]
+        function_call = mensaje.get("function_call")
+        if function_call:
+            return [LlamadaFuncion(None, function_call.get("name"), function_call.get("arguments") or "{}")]
+        return []
+
+    def _despachar(self, llamadas):
+        if len(llamadas) == 1:
+            llamada = llamadas[0]
+            return [self.registro.ejecutar(llamada.nombre, llamada.argumentos)]
+        futuros = [
+            self._executor.submit(self.registro.ejecutar, llamada.nombre, llamada.argumentos)
+            for llamada in llamadas
+        ]
+        resultados = []
+        for futuro in futuros:
+            try:
+                resultados.append(futuro.result())
+            except Saturado as e:
+                resultados.append(e)
+        return self._reunir(resultados)
+
+    @staticmethod
+    def _reunir(resultados):
+        # En un lote paralelo, el Saturado de una función no descarta las que ya terminaron
+        # (p. ej. crear_pedido): solo se propaga si ninguna se ejecutó
+        saturados = [r for r in resultados if isinstance(r, Saturado)]
+        if saturados and len(saturados) == len(resultados):
+            raise saturados[0]
+        return [
+            {"error": "No hay capacidad en este momento para esta función."} if isinstance(r, Saturado) else r
+            for r in resultados
+        ]
+
+    def _resolver_llamadas(self, messages, llamadas):
+        resultados = self._despachar(llamadas)
+        self._anotar_llamadas(messages, llamadas)
+        self._anotar_resultados(messages, llamadas, resultados)
+
+    @staticmethod
+    def _anotar_llamadas(messages, llamadas):
+        # El mensaje del asistente con la(s) llamada(s) va antes de los resultados
+        if llamadas[0].id is not None:
+            messages.append({
+                "role": "assistant",
+                "content": None,
+                "tool_calls": [
+                    {
+                        "id": llamada.id,
+                        "type": "function",
+                        "function": {"name": llamada.nombre, "arguments": llamada.argumentos}
+                    }
+                    for llamada in llamadas
+                ]
+            })
+        else:
+            llamada = llamadas[0]
+            messages.append({
+                "role": "assistant",
+                "content": None,
+                "function_call": {"name": llamada.nombre, "arguments": llamada.argumentos}
+            })
+
+    def _anotar_resultados(self, messages, llamadas, resultados):
+        for llamada, resultado in zip(llamadas, resultados):
+            if llamada.id is not None:
+                messages.append({
+                    "role": "tool",
+                    "tool_call_id": llamada.id,
+                    "content": self.codificador(resultado)
+                })
+            else:
+                messages.append({
+                    "role": "function",
+                    "name": llamada.nombre,
+                    "content": self.codificador(resultado)
+                })
+
+class AsyncConversationEngine(ConversationEngine):
+    """
+    ConversationEngine para asgi_app.py: el mismo turno (_pasos_turno) con un servicio
+    de OpenAI y un registro asíncronos. Las funciones pedidas a la vez se esperan juntas.
+    Sin streaming: asgi_app.py solo expone /api/chat y /chat.
+    """
+
+    async def ejecutar_turno(self, messages, observador=None):
+        pasos = self._pasos_turno(messages, observador)
+        respuesta = None
+        error = None
+        while True:
+            try:
+                paso = pasos.send(respuesta) if error is None else pasos.throw(error)
+            except StopIteration as fin:
+                return fin.value
+            error = None
+            try:
+                if paso[0] == "modelo":
+                    respuesta = await self._completar(messages, paso[1], paso[2])
+                else:
+                    respuesta = await self._despachar(paso[1])
+            except Saturado as e:
+                error = e
+
+    async def _completar(self, messages, modelo, iteracion):
+        with CHAT_COMPLETION.medir(iteracion=iteracion):
+            return await self.openai.chat_completion(
+                messages=self.compactor.compactar(messages), model=modelo, **self._parametros()
+            )
+
+    async def _despachar(self, llamadas):
+        resultados = await asyncio.gather(*(
+            self.registro.ejecutar_async(llamada.nombre, llamada.argumentos) for llamada in llamadas
+        ), return_exceptions=True)
+        for resultado in resultados:
+            if isinstance(resultado, BaseException) and not isinstance(resultado, Saturado):
+                raise resultado
+        return self._reunir(resultados)
@@ -0,0 +1,178 @@
+# services/embedding_cache.py
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from utils.helpers import normalizar_texto
+
+class EmbeddingCache:
+    """
+    Caché de embeddings en dos niveles:
+    - Memoria: LRU acotado con TTL.
+    - Disco (opcional): SQLite que sobrevive a reinicios y se comparte entre procesos.
+    La clave es el texto normalizado más el nombre del modelo.
+    obtener()/guardar() usan ambos niveles. Desde un event loop se usa obtener_memoria()
+    y guardar_memoria() (sin E/S) y el disco, con su propio lock, desde un hilo.
+    """
+
+    def __init__(self, max_items=2048, ttl=86400, ruta_disco=None, ttl_disco=None):
+        self.max_items = max_items
+        self.ttl = ttl
+        self.ttl_disco = ttl_disco
+        self._memoria = OrderedDict()  # clave -> (expira_en, vector)
+        self._lock = threading.Lock()
+        self._lock_disco = threading.Lock()
+        self.hits = 0
+        self.hits_disco = 0
+        self.misses = 0
+        self._db = None
+        if ruta_disco:
+            self._abrir_disco(ruta_disco)
+
+    def _abrir_disco(self, ruta):
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(ruta)), exist_ok=True)
+            self._db = sqlite3.connect(ruta, timeout=5, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "clave TEXT PRIMARY KEY, modelo TEXT, creado REAL, vector BLOB)"
+            )
+            self._db.commit()
+        except sqlite3.Error as e:
+            print(f"[ERROR] No se pudo abrir la caché de embeddings en disco ({ruta}): {e}")
+            self._db = None
+
+    @staticmethod
+    def clave(texto: str, modelo: str):
+        base = f"{modelo}\x00{normalizar_texto(texto)}"
+        return hashlib.sha1(base.encode("utf-8")).hexdigest()
+
+    @property
+    def en_disco(self):
+        return self._db is not None
+
+    def obtener(self, texto: str, modelo: str):
+        vector = self.obtener_memoria(texto, modelo)
+        if vector is None and self.en_disco:
+            vector = self.obtener_disco([texto], modelo)[0]
+        return vector
+
+    def obtener_memoria(self, texto: str, modelo: str):
+        """
+        Solo el nivel de memoria. Sin disco, un None cuenta como miss; con disco lo cuenta obtener_disco().
+        """
+        clave = self.clave(texto, modelo)
+        ahora = time.time()
+        with self._lock:
+            entrada = self._memoria.get(clave)
+            if entrada is not None:
+                expira_en, vector = entrada
+                if expira_en > ahora:
+                    self._memoria.move_to_end(clave)
+                    self.hits += 1
+                    return vector
+                del self._memoria[clave]
+            if self._db is None:
+                self.misses += 1
+            return None
+
+    def obtener_disco(self, textos, modelo: str):
+        """
+        Vectores (o None) de `textos` en el nivel de disco; los encontrados pasan a memoria.
+        """
+        ahora = time.time()
+        claves = [self.clave(texto, modelo) for texto in textos]
+        with self._lock_disco:
+            vectores = [self._leer_disco(clave, ahora) for clave in claves]
+        with self._lock:
+            for clave, vector in zip(claves, vectores):
+                if vector is None:
+                    self.misses += 1
+                    continue
+                self._guardar_memoria(clave, vector, ahora)
+                self.hits += 1
+                self.hits_disco += 1
+        return vectores
+
+    def guardar(self, texto: str, modelo: str, vector):
+        self.guardar_memoria(texto, modelo, vector)
+        if self.en_disco:
+            self.guardar_disco([texto], modelo, [vector])
+
+    def guardar_memoria(self, texto: str, modelo: str, vector):
+        clave = self.clave(texto, modelo)
+        with self._lock:
+            self._guardar_memoria(clave, vector, time.time())
+
+    def guardar_disco(self, textos, modelo: str, vectores):
+        ahora = time.time()
+        with self._lock_disco:
+            for texto, vector in zip(textos, vectores):
+                self._escribir_disco(self.clave(texto, modelo), modelo, vector, ahora)
+
+    def _guardar_memoria(self, clave, vector, ahora):
+        self._memoria[clave] = (ahora + self.ttl, vector)
+        self._memoria.move_to_end(clave)
+        while len(self._memoria) > self.max_items:
+            self._memoria.popitem(last=False)
+
+    def _leer_disco(self, clave, ahora):
+        if self._db is None:
+            return None
+        try:
+            fila = self._db.execute(
+                "SELECT creado, vector FROM embeddings WHERE clave = ?", (clave,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            print(f"[ERROR] Lectura de la caché de embeddings en disco: {e}")
+            return None
+        if fila is None:
+            return None
+        creado, blob = fila
+        if self.ttl_disco and creado + self.ttl_disco <= ahora:
+            return None
+        vector = array("f")
+        vector.frombytes(blob)
+        return vector.tolist()
+
+    def _escribir_disco(self, clave, modelo, vector, ahora):
+        if self._db is None:
+            return
+        try:
+            # float32 es suficiente para similitud coseno y ocupa la mitad que float64
+            blob = array("f", vector).tobytes()
+            self._db.execute(
+                "INSERT OR REPLACE INTO embeddings (clave, modelo, creado, vector) VALUES (?, ?, ?, ?)",
+                (clave, modelo, ahora, blob)
+            )
+            self._db.commit()
+        except sqlite3.Error as e:
+            print(f"[ERROR] Escritura de la caché de embeddings en disco: {e}")
+
+    def estadisticas(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "hits_disco": self.hits_disco,
+                "misses": self.misses,
+                "hit_rate": (self.hits / total) if total else 0.0,
+                "items_memoria": len(self._memoria),
+                "disco": self._db is not None
+            }
+
+    def limpiar(self):
+        with self._lock:
+            self._memoria.clear()
+        with self._lock_disco:
+            if self._db is not None:
+                try:
+                    self._db.execute("DELETE FROM embeddings")
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    print(f"[ERROR] No se pudo limpiar la caché de embeddings en disco: {e}")
@@ -0,0 +1,150 @@
+# services/history_compaction.py
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from functions.result_encoding import ENCABEZADO_PRODUCTOS
+
+try:
+    import tiktoken
+except ImportError:  # Sin tiktoken se usa una estimación por caracteres
+    tiktoken = None
+
+class HistoryCompactor:
+    """
+    Reduce el historial que se envía a chat_completion a un presupuesto de tokens:
+    - El mensaje system y los últimos `turnos_recientes` turnos del usuario se envían tal cual.
+    - Los resultados de funciones anteriores se reemplazan por un resumen corto (cacheado).
+    - Si aún se excede el presupuesto, se descartan los mensajes más antiguos.
+    El historial guardado en la sesión no se modifica.
+    """
+
+    # Tokens fijos que la API añade por cada mensaje
+    TOKENS_POR_MENSAJE = 4
+
+    def __init__(self, presupuesto_tokens=3000, turnos_recientes=2, modelo="gpt-4", max_cache=4096):
+        self.presupuesto_tokens = presupuesto_tokens
+        self.turnos_recientes = turnos_recientes
+        self.max_cache = max_cache
+        self._codificador = None
+        if tiktoken is not None:
+            try:
+                self._codificador = tiktoken.encoding_for_model(modelo)
+            except Exception:
+                self._codificador = tiktoken.get_encoding("cl100k_base")
+        self._resumenes = OrderedDict()  # hash del contenido -> resumen
+        self._tokens = OrderedDict()  # hash del texto -> número de tokens
+        self._lock = threading.Lock()
+
+    # --- Conteo de tokens ---
+
+    def _contar_texto(self, texto):
+        if not texto:
+            return 0
+        if self._codificador is None:
+            return len(texto) // 4 + 1
+        clave = hashlib.blake2b(texto.encode("utf-8"), digest_size=12).digest()
+        with self._lock:
+            tokens = self._tokens.get(clave)
+            if tokens is not None:
+                self._tokens.move_to_end(clave)
+                return tokens
+        tokens = len(self._codificador.encode(texto))
+        with self._lock:
+            self._recordar(self._tokens, clave, tokens)
+        return tokens
+
+    def contar_mensaje(self, mensaje):
+        tokens = self.TOKENS_POR_MENSAJE + self._contar_texto(mensaje.get("content"))
+        for campo in ("function_call", "tool_calls"):
+            if mensaje.get(campo):
+                tokens += self._contar_texto(json.dumps(mensaje[campo], ensure_ascii=False))
+        return tokens
+
+    def contar_tokens(self, messages):
+        return sum(self.contar_mensaje(m) for m in messages)
+
+    # --- Resúmenes ---
+
+    def _recordar(self, cache, clave, valor):
+        cache[clave] = valor
+        cache.move_to_end(clave)
+        while len(cache) > self.max_cache:
+            cache.popitem(last=False)
+
+    def resumir_resultado(self, contenido):
+        clave = hashlib.blake2b(contenido.encode("utf-8"), digest_size=12).digest()
+        with self._lock:
+            resumen = self._resumenes.get(clave)
+            if resumen is not None:
+                self._resumenes.move_to_end(clave)
+                return resumen
+        resumen = self._resumir(contenido)
+        with self._lock:
+            self._recordar(self._resumenes, clave, resumen)
+        return resumen
+
+    @staticmethod
+    def _resumir_productos(productos):
+        return "; ".join(
+            f"{p.get('nombre')} (sku {p.get('sku')}, S/{p.get('precio_bayovar')})" for p in productos
+        )
+
+    @staticmethod
+    def _resumir(contenido):
+        if contenido.startswith(ENCABEZADO_PRODUCTOS):
+            # La tabla compacta ya es un resumen y sus refs hacen falta para crear el pedido
+            return contenido
+        try:
+            datos = json.loads(contenido)
+        except ValueError:
+            return contenido[:200]
+        if not isinstance(datos, dict):
+            return contenido[:200]
+        if "productos_encontrados" in datos:
+            # Se conservan SKU y precio para que el modelo pueda crear el pedido
+            return "Resumen de búsqueda anterior: " + HistoryCompactor._resumir_productos(datos["productos_encontrados"])
+        if "resultados" in datos:
+            return "Resumen de búsqueda anterior: " + " | ".join(
+                f"{r.get('query')}: {HistoryCompactor._resumir_productos(r.get('productos_encontrados') or [])}"
+                for r in datos["resultados"]
+            )
+        if "Pedido" in datos:
+            return f"Pedido {datos['Pedido'].get('id_unico')} creado."
+        return contenido[:200]
+
+    # --- Compactación ---
+
+    def _inicio_recientes(self, messages):
+        vistos = 0
+        for i in range(len(messages) - 1, -1, -1):
+            if messages[i].get("role") == "user":
+                vistos += 1
+                if vistos == self.turnos_recientes:
+                    return i
+        return 1 if messages and messages[0].get("role") == "system" else 0
+
+    def compactar(self, messages):
+        """
+        Devuelve una nueva lista de mensajes que respeta el presupuesto cuando es posible.
+        """
+        if not self.presupuesto_tokens or self.contar_tokens(messages) <= self.presupuesto_tokens:
+            return messages
+
+        inicio = 1 if messages and messages[0].get("role") == "system" else 0
+        recientes = max(self._inicio_recientes(messages), inicio)
+        cabecera = messages[:inicio]
+        antiguos = []
+        for m in messages[inicio:recientes]:
+            if m.get("role") in ("function", "tool") and m.get("content"):
+                m = dict(m, content=self.resumir_resultado(m["content"]))
+            antiguos.append(m)
+        cola = messages[recientes:]
+
+        total = self.contar_tokens(cabecera) + self.contar_tokens(antiguos) + self.contar_tokens(cola)
+        while antiguos and total > self.presupuesto_tokens:
+            total -= self.contar_mensaje(antiguos.pop(0))
+            # No dejar resultados de funciones sin el mensaje del asistente que los pidió
+            while antiguos and antiguos[0].get("role") in ("function", "tool"):
+                total -= self.contar_mensaje(antiguos.pop(0))
+        return cabecera + antiguos + cola
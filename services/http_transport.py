@@ -0,0 +1,214 @@
+# services/http_transport.py
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import openai
+import requests
+from requests.adapters import HTTPAdapter
+
+# Errores de OpenAI que vale la pena reintentar (429, 5xx, timeouts y conexión)
+ERRORES_REINTENTABLES = (
+    openai.error.RateLimitError,
+    openai.error.ServiceUnavailableError,
+    openai.error.APIConnectionError,
+    openai.error.Timeout,
+    openai.error.TryAgain,
+)
+
+def crear_sesion_http(pool_maxsize=32):
+    """
+    Sesión HTTP con keep-alive y un pool de conexiones compartido por todos los hilos.
+    Los reintentos se manejan arriba, no en urllib3.
+    """
+    session = requests.Session()
+    adaptador = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize, max_retries=0)
+    session.mount("https://", adaptador)
+    session.mount("http://", adaptador)
+    return session
+
+def _percentil(valores, p):
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p / 100))]
+
+class _Estadisticas:
+    def __init__(self, muestras):
+        self.llamadas = 0
+        self.reintentos = 0
+        self.errores = 0
+        self.coberturas = 0
+        self.coberturas_ganadas = 0
+        self.latencias = deque(maxlen=muestras)
+
+class ResilientTransport:
+    """
+    Capa de transporte para las llamadas a OpenAI:
+    - Sesión HTTP con pool y keep-alive (openai.requestssession).
+    - Plazo por llamada (request_timeout) y plazo total que incluye los reintentos.
+    - Reintentos con backoff exponencial y jitter en 429/5xx, respetando Retry-After.
+    - Cobertura (hedging) opcional: si una llamada supera el p95 observado se lanza
+      una segunda idéntica y se usa la primera que responda.
+    """
+
+    def __init__(self, max_reintentos=3, backoff_base=0.5, backoff_max=8.0, pool_maxsize=32,
+                 muestras=500, min_muestras_cobertura=20, percentil_cobertura=95):
+        self.max_reintentos = max_reintentos
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.min_muestras_cobertura = min_muestras_cobertura
+        self.percentil_cobertura = percentil_cobertura
+        self.session = crear_sesion_http(pool_maxsize)
+        openai.requestssession = self.session
+        self._muestras = muestras
+        self._estadisticas = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=pool_maxsize, thread_name_prefix="openai-cobertura")
+
+    def _stats(self, tipo):
+        stats = self._estadisticas.get(tipo)
+        if stats is None:
+            with self._lock:
+                stats = self._estadisticas.setdefault(tipo, _Estadisticas(self._muestras))
+        return stats
+
+    @staticmethod
+    def _retry_after(error):
+        headers = getattr(error, "headers", None) or {}
+        for clave, escala in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+            valor = headers.get(clave)
+            if valor is not None:
+                try:
+                    return float(valor) * escala
+                except (TypeError, ValueError):
+                    pass
+        return None
+
+    @staticmethod
+    def _es_reintentable(error):
+        if isinstance(error, ERRORES_REINTENTABLES):
+            return True
+        estado = getattr(error, "http_status", None)
+        return isinstance(error, openai.error.APIError) and (estado is None or estado >= 500)
+
+    def _exito(self, stats, inicio):
+        with self._lock:
+            stats.llamadas += 1
+            stats.latencias.append(time.monotonic() - inicio)
+
+    def _espera_reintento(self, stats, error, intento, limite):
+        """
+        Segundos a esperar antes de reintentar, o None si no se reintenta (se cuenta el error).
+        """
+        espera = None
+        if self._es_reintentable(error) and intento < self.max_reintentos:
+            espera = self._retry_after(error)
+            if espera is None:
+                espera = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** intento)))
+            if time.monotonic() + espera >= limite:
+                espera = None
+        with self._lock:
+            if espera is None:
+                stats.llamadas += 1
+                stats.errores += 1
+            else:
+                stats.reintentos += 1
+        return espera
+
+    def llamar(self, tipo, funcion, timeout, plazo_total=None, **kwargs):
+        """
+        Ejecuta funcion(**kwargs, request_timeout=...) con reintentos.
+        Relanza el último error si se agotan los intentos o el plazo total.
+        """
+        stats = self._stats(tipo)
+        limite = time.monotonic() + (plazo_total or timeout * (self.max_reintentos + 1))
+        intento = 0
+        while True:
+            restante = limite - time.monotonic()
+            inicio = time.monotonic()
+            try:
+                resultado = funcion(request_timeout=max(0.1, min(timeout, restante)), **kwargs)
+                self._exito(stats, inicio)
+                return resultado
+            except Exception as e:
+                espera = self._espera_reintento(stats, e, intento, limite)
+                if espera is None:
+                    raise
+                intento += 1
+                time.sleep(espera)
+
+    async def llamar_async(self, tipo, funcion, timeout, plazo_total=None, **kwargs):
+        """
+        Igual que llamar() para funciones asíncronas (openai.*.acreate): las esperas
+        entre reintentos no bloquean el event loop.
+        """
+        stats = self._stats(tipo)
+        limite = time.monotonic() + (plazo_total or timeout * (self.max_reintentos + 1))
+        intento = 0
+        while True:
+            restante = limite - time.monotonic()
+            inicio = time.monotonic()
+            try:
+                resultado = await funcion(request_timeout=max(0.1, min(timeout, restante)), **kwargs)
+                self._exito(stats, inicio)
+                return resultado
+            except Exception as e:
+                espera = self._espera_reintento(stats, e, intento, limite)
+                if espera is None:
+                    raise
+                intento += 1
+                await asyncio.sleep(espera)
+
+    def llamar_con_cobertura(self, tipo, funcion, timeout, **kwargs):
+        """
+        Igual que llamar(), pero si la llamada tarda más que el p95 reciente lanza
+        una segunda y devuelve la primera respuesta exitosa.
+        """
+        stats = self._stats(tipo)
+        with self._lock:
+            umbral = None
+            if len(stats.latencias) >= self.min_muestras_cobertura:
+                umbral = _percentil(list(stats.latencias), self.percentil_cobertura)
+        if umbral is None:
+            return self.llamar(tipo, funcion, timeout, **kwargs)
+
+        principal = self._executor.submit(self.llamar, tipo, funcion, timeout, **kwargs)
+        hechos, _ = wait([principal], timeout=umbral)
+        if hechos:
+            return principal.result()
+
+        with self._lock:
+            stats.coberturas += 1
+        cobertura = self._executor.submit(self.llamar, tipo, funcion, timeout, **kwargs)
+        pendientes = {principal, cobertura}
+        ultimo_error = None
+        while pendientes:
+            hechos, pendientes = wait(pendientes, return_when=FIRST_COMPLETED)
+            for futuro in hechos:
+                if futuro.exception() is None:
+                    if futuro is cobertura:
+                        with self._lock:
+                            stats.coberturas_ganadas += 1
+                    return futuro.result()
+                ultimo_error = futuro.exception()
+        raise ultimo_error
+
+    def estadisticas(self):
+        with self._lock:
+            resultado = {}
+            for tipo, stats in self._estadisticas.items():
+                latencias = list(stats.latencias)
+                resultado[tipo] = {
+                    "llamadas": stats.llamadas,
+                    "reintentos": stats.reintentos,
+                    "errores": stats.errores,
+                    "coberturas": stats.coberturas,
+                    "coberturas_ganadas": stats.coberturas_ganadas,
+                    "p50": _percentil(latencias, 50),
+                    "p95": _percentil(latencias, 95),
+                    "p99": _percentil(latencias, 99)
+                }
+            return resultado
@@ -0,0 +1,281 @@
+# services/local_index_service.py
+import json
+import os
+import shutil
+import threading
+import time
+import numpy as np
+from services.catalog_version import CatalogVersion
+from utils.metrics import ETAPAS
+
+class LocalMatch:
+    """
+    Resultado con la misma forma que los matches de Pinecone (.id, .score, .metadata).
+    """
+    __slots__ = ("id", "score", "metadata")
+
+    def __init__(self, id, score, metadata):
+        self.id = id
+        self.score = score
+        self.metadata = metadata
+
+    def __repr__(self):
+        return f"LocalMatch(id={self.id!r}, score={self.score:.4f})"
+
+class _Snapshot:
+    """
+    Un snapshot cargado. Se reemplaza completo al recargar, así una consulta en curso
+    nunca mezcla los ids de un snapshot con las filas de otro.
+    """
+    __slots__ = ("nombre", "ids", "metadatos", "namespaces", "vectores", "escalas", "cuantizacion",
+                 "posiciones", "con_namespaces")
+
+    def __init__(self, nombre=None, ids=None, metadatos=None, namespaces=None, vectores=None, escalas=None,
+                 cuantizacion="float32"):
+        self.nombre = nombre
+        self.ids = ids or []
+        self.metadatos = metadatos or []
+        self.namespaces = np.array(namespaces or [""] * len(self.ids), dtype=object)
+        self.vectores = vectores if vectores is not None else np.zeros((0, 0), dtype=np.float32)
+        self.escalas = escalas
+        self.cuantizacion = cuantizacion
+        self.posiciones = {id_: i for i, id_ in enumerate(self.ids)}
+        self.con_namespaces = bool((self.namespaces != "").any())
+
+class LocalIndexService:
+    """
+    Índice vectorial en proceso, alternativa a PineconeService para catálogos pequeños.
+    Los vectores se guardan normalizados (float32 o int8 cuantizado por fila) en un
+    .npy que se abre con mmap, así que la búsqueda coseno es un solo producto matriz-vector.
+
+    Cada snapshot se escribe en un directorio nuevo ("snapshot-<n>") y el archivo ACTUAL
+    apunta al vigente: los archivos abiertos con mmap por otros workers nunca se reescriben.
+    Con `catalog_version`, el servicio recarga el snapshot cuando una ingesta cambia la versión.
+    """
+
+    ARCHIVO_VECTORES = "vectores.npy"
+    ARCHIVO_ESCALAS = "escalas.npy"
+    ARCHIVO_META = "snapshot.json"
+    ARCHIVO_ACTUAL = "ACTUAL"
+    # Snapshots anteriores que se conservan (un worker puede estar terminando de cargarlos)
+    SNAPSHOTS_ANTERIORES = 1
+    # Filas por bloque al decuantizar int8 (acota la memoria temporal)
+    BLOQUE_INT8 = 4096
+
+    def __init__(self, directorio, catalog_version: CatalogVersion = None):
+        self.directorio = directorio
+        self.catalog_version = catalog_version
+        self._pendientes = {}  # (namespace, id) -> (valores, metadata) aún no persistidos
+        self._lock = threading.Lock()
+        self._version = None
+        self.cargar()
+
+    # Atributos del snapshot vigente
+    ids = property(lambda self: self._snapshot.ids)
+    metadatos = property(lambda self: self._snapshot.metadatos)
+    cuantizacion = property(lambda self: self._snapshot.cuantizacion)
+
+    @classmethod
+    def _ruta_snapshot(cls, directorio):
+        """
+        Directorio del snapshot vigente, o None si no hay ninguno.
+        """
+        try:
+            with open(os.path.join(directorio, cls.ARCHIVO_ACTUAL), "r", encoding="utf-8") as f:
+                nombre = f.read().strip()
+            if nombre:
+                return os.path.join(directorio, nombre)
+        except OSError:
+            pass
+        # Formato anterior: el snapshot directamente en el directorio
+        if os.path.exists(os.path.join(directorio, cls.ARCHIVO_META)):
+            return directorio
+        return None
+
+    def cargar(self):
+        version = self.catalog_version.actual() if self.catalog_version is not None else None
+        ruta = self._ruta_snapshot(self.directorio)
+        if ruta is None:
+            print(f"[WARN] No existe snapshot de índice local en {self.directorio}; el índice está vacío.")
+            self._snapshot = _Snapshot()
+            self._version = version
+            return
+
+        with open(os.path.join(ruta, self.ARCHIVO_META), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        cuantizacion = meta.get("cuantizacion", "float32")
+        escalas = None
+        if cuantizacion == "int8":
+            escalas = np.load(os.path.join(ruta, self.ARCHIVO_ESCALAS), mmap_mode="r")
+        self._snapshot = _Snapshot(
+            nombre=os.path.basename(ruta),
+            ids=meta["ids"],
+            metadatos=meta["metadatos"],
+            namespaces=meta.get("namespaces"),
+            vectores=np.load(os.path.join(ruta, self.ARCHIVO_VECTORES), mmap_mode="r"),
+            escalas=escalas,
+            cuantizacion=cuantizacion
+        )
+        self._version = version
+        print(f"Índice local cargado: {len(self._snapshot.ids)} vectores ({cuantizacion}).")
+
+    def _vigente(self):
+        """
+        Snapshot vigente; si la versión del catálogo cambió, antes se recarga.
+        """
+        if self.catalog_version is not None and self.catalog_version.actual() != self._version:
+            with self._lock:
+                if self.catalog_version.actual() != self._version:
+                    try:
+                        self.cargar()
+                    except (OSError, ValueError, KeyError) as e:
+                        print(f"[ERROR] No se pudo recargar el índice local: {e}")
+        return self._snapshot
+
+    def _puntajes(self, snapshot, q):
+        if snapshot.cuantizacion != "int8":
+            return snapshot.vectores @ q
+        puntajes = np.empty(snapshot.vectores.shape[0], dtype=np.float32)
+        for inicio in range(0, snapshot.vectores.shape[0], self.BLOQUE_INT8):
+            fin = inicio + self.BLOQUE_INT8
+            bloque = snapshot.vectores[inicio:fin].astype(np.float32)
+            puntajes[inicio:fin] = (bloque @ q) * snapshot.escalas[inicio:fin]
+        return puntajes
+
+    def query_index(self, vector, top_k=5, namespace="", include_metadata=True):
+        try:
+            snapshot = self._vigente()
+            if not snapshot.ids:
+                return []
+            q = np.asarray(vector, dtype=np.float32)
+            norma = np.linalg.norm(q)
+            if norma == 0:
+                return []
+            q = q / norma
+
+            with ETAPAS.medir(etapa="consulta_indice"):
+                puntajes = self._puntajes(snapshot, q)
+            if namespace or snapshot.con_namespaces:
+                puntajes = np.where(snapshot.namespaces == namespace, puntajes, -np.inf)
+
+            k = min(top_k, puntajes.shape[0])
+            candidatos = np.argpartition(-puntajes, k - 1)[:k]
+            candidatos = candidatos[np.argsort(-puntajes[candidatos])]
+            return [
+                LocalMatch(snapshot.ids[i], float(puntajes[i]), snapshot.metadatos[i] if include_metadata else None)
+                for i in candidatos
+                if puntajes[i] != -np.inf
+            ]
+        except Exception as e:
+            print(f"[ERROR] Error al consultar el índice local: {e}")
+            return None
+
+    def fetch_metadata(self, ids, namespace=""):
+        snapshot = self._vigente()
+        return {
+            id_: snapshot.metadatos[snapshot.posiciones[id_]]
+            for id_ in ids
+            if id_ in snapshot.posiciones
+        }
+
+    def metadatos_completos(self):
+        """
+        Todos los pares (id, metadata) del snapshot, para precargar cachés.
+        """
+        snapshot = self._vigente()
+        return list(zip(snapshot.ids, snapshot.metadatos))
+
+    def upsert_vectores(self, vectores, namespace=""):
+        """
+        Acumula (id, valores, metadata) en memoria; persistir() los incorpora al snapshot.
+        """
+        for id_, valores, metadata in vectores:
+            self._pendientes[(namespace, id_)] = (valores, metadata)
+        return True
+
+    @staticmethod
+    def _vectores_actuales(snapshot):
+        if snapshot.cuantizacion == "int8":
+            return np.asarray(snapshot.vectores, dtype=np.float32) * np.asarray(snapshot.escalas)[:, None]
+        return np.asarray(snapshot.vectores, dtype=np.float32)
+
+    def persistir(self, cuantizacion=None):
+        """
+        Escribe un snapshot nuevo con los vectores existentes más los pendientes y lo carga.
+        Devuelve True si los pendientes quedaron en disco (o no había ninguno).
+        """
+        pendientes = self._pendientes
+        if not pendientes:
+            return True
+        snapshot = self._vigente()
+        ids, namespaces, metadatos, filas = [], [], [], []
+        if snapshot.ids:
+            actuales = self._vectores_actuales(snapshot)
+            for i, id_ in enumerate(snapshot.ids):
+                if (snapshot.namespaces[i], id_) in pendientes:
+                    continue
+                ids.append(id_)
+                namespaces.append(snapshot.namespaces[i])
+                metadatos.append(snapshot.metadatos[i])
+                filas.append(actuales[i])
+        for (namespace, id_), (valores, metadata) in pendientes.items():
+            ids.append(id_)
+            namespaces.append(namespace)
+            metadatos.append(metadata)
+            filas.append(np.asarray(valores, dtype=np.float32))
+        self.construir_snapshot(
+            self.directorio, ids, np.vstack(filas), metadatos,
+            namespaces=namespaces, cuantizacion=cuantizacion or snapshot.cuantizacion
+        )
+        self._pendientes = {}
+        self.cargar()
+        return True
+
+    @classmethod
+    def construir_snapshot(cls, directorio, ids, vectores, metadatos, namespaces=None, cuantizacion="float32"):
+        """
+        Escribe un snapshot del índice en un directorio nuevo y lo publica en ACTUAL.
+        Los vectores se normalizan aquí para que la consulta no tenga que hacerlo.
+        """
+        os.makedirs(directorio, exist_ok=True)
+        matriz = np.asarray(vectores, dtype=np.float32)
+        normas = np.linalg.norm(matriz, axis=1, keepdims=True)
+        normas[normas == 0] = 1.0
+        matriz = matriz / normas
+
+        nombre = f"snapshot-{time.time_ns()}"
+        temporal = os.path.join(directorio, f".{nombre}.{os.getpid()}.tmp")
+        os.makedirs(temporal)
+        if cuantizacion == "int8":
+            maximos = np.abs(matriz).max(axis=1)
+            maximos[maximos == 0] = 1.0
+            escalas = (maximos / 127.0).astype(np.float32)
+            cuantizada = np.round(matriz / escalas[:, None]).astype(np.int8)
+            np.save(os.path.join(temporal, cls.ARCHIVO_VECTORES), cuantizada)
+            np.save(os.path.join(temporal, cls.ARCHIVO_ESCALAS), escalas)
+        else:
+            np.save(os.path.join(temporal, cls.ARCHIVO_VECTORES), matriz)
+        with open(os.path.join(temporal, cls.ARCHIVO_META), "w", encoding="utf-8") as f:
+            json.dump({
+                "ids": list(ids),
+                "metadatos": list(metadatos),
+                "namespaces": list(namespaces) if namespaces is not None else None,
+                "cuantizacion": cuantizacion
+            }, f, ensure_ascii=False)
+        os.replace(temporal, os.path.join(directorio, nombre))
+
+        # ACTUAL se cambia al final y de forma atómica: los lectores ven el snapshot anterior o el nuevo
+        ruta_actual = os.path.join(directorio, cls.ARCHIVO_ACTUAL)
+        with open(f"{ruta_actual}.{os.getpid()}.tmp", "w", encoding="utf-8") as f:
+            f.write(nombre)
+        os.replace(f"{ruta_actual}.{os.getpid()}.tmp", ruta_actual)
+        cls._limpiar_anteriores(directorio, nombre)
+        print(f"Snapshot de índice local escrito en {directorio}/{nombre} ({len(ids)} vectores, {cuantizacion}).")
+        return nombre
+
+    @classmethod
+    def _limpiar_anteriores(cls, directorio, vigente):
+        # Borrar un archivo abierto con mmap no afecta al proceso que lo usa (el inodo sigue vivo)
+        anteriores = sorted(n for n in os.listdir(directorio) if n.startswith("snapshot-") and n != vigente)
+        for nombre in anteriores[:max(len(anteriores) - cls.SNAPSHOTS_ANTERIORES, 0)]:
+            shutil.rmtree(os.path.join(directorio, nombre), ignore_errors=True)
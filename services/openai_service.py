@@ -1,38 +1,333 @@
 # services/openai_service.py
+import asyncio
+import json
 import openai
-import sys
 from config.settings import settings
+from services.admission import AdmissionController, Saturado
+from services.embedding_cache import EmbeddingCache
+from services.http_transport import ResilientTransport
+from utils.metrics import ETAPAS, TOKENS
+
+# Tokens reservados para la respuesta al estimar una llamada de chat
+_RESERVA_COMPLETION = 256
 
 class OpenAIService:
     def __init__(self):
         if not settings.OPENAI_API_KEY:
             print("Error: La variable de entorno 'OPENAI_API_KEY' no está configurada.")
-            sys.exit(1)
+            raise RuntimeError("La variable de entorno 'OPENAI_API_KEY' no está configurada.")
         openai.api_key = settings.OPENAI_API_KEY
+        self.embedding_cache = EmbeddingCache(
+            max_items=settings.EMBEDDING_CACHE_SIZE,
+            ttl=settings.EMBEDDING_CACHE_TTL,
+            ruta_disco=settings.EMBEDDING_CACHE_FILE or None,
+            ttl_disco=settings.EMBEDDING_CACHE_DISK_TTL
+        )
+        self.transport = ResilientTransport(
+            max_reintentos=settings.OPENAI_MAX_RETRIES,
+            pool_maxsize=settings.OPENAI_POOL_SIZE
+        )
+        self.admision = AdmissionController(
+            rpm=settings.OPENAI_RPM,
+            tpm=settings.OPENAI_TPM,
+            max_cola=settings.ADMISION_MAX_COLA,
+            espera_max=settings.ADMISION_ESPERA_MAX
+        )
 
-    def generar_embedding(self, texto: str):
+    def calentar(self):
+        """
+        Abre una conexión del pool (TLS incluido) con una llamada sin costo.
+        """
         try:
-            response = openai.Embedding.create(
-                input=texto,
-                model="text-embedding-ada-002"
+            self.transport.session.get(
+                f"{openai.api_base}/models",
+                headers={"Authorization": f"Bearer {openai.api_key}"},
+                timeout=settings.OPENAI_TIMEOUT_EMBEDDING
+            )
+        except Exception as e:
+            print(f"[WARN] No se pudo calentar la conexión con OpenAI: {e}")
+
+    @staticmethod
+    def _estimar_tokens(*partes):
+        # ~4 caracteres por token; basta para no pasarse del límite por minuto
+        caracteres = 0
+        for parte in partes:
+            if not parte:
+                continue
+            if isinstance(parte, str):
+                caracteres += len(parte)
+            elif isinstance(parte, list) and all(isinstance(p, str) for p in parte):
+                caracteres += sum(len(p) for p in parte)
+            else:
+                caracteres += len(json.dumps(parte, ensure_ascii=False, default=str))
+        return caracteres // 4 + 1
+
+    def _admitir(self, estimado):
+        """
+        Espera capacidad en los límites de la cuenta (o lanza Saturado).
+        """
+        if not self.admision.cubetas:
+            return
+        with ETAPAS.medir(etapa="admision"):
+            self.admision.adquirir(estimado)
+
+    def _ajustar_uso(self, response, estimado):
+        uso = response.get("usage") if response is not None else None
+        if uso and uso.get("total_tokens"):
+            self.admision.ajustar_tokens(uso["total_tokens"] - estimado)
+
+    def _crear_embeddings(self, entrada, model):
+        if settings.OPENAI_HEDGE_EMBEDDINGS:
+            llamar = self.transport.llamar_con_cobertura
+        else:
+            llamar = self.transport.llamar
+        estimado = self._estimar_tokens(entrada)
+        self._admitir(estimado)
+        with ETAPAS.medir(etapa="embedding"):
+            response = llamar(
+                "embedding", openai.Embedding.create, settings.OPENAI_TIMEOUT_EMBEDDING,
+                input=entrada, model=model
             )
-            return response['data'][0]['embedding']
+        self._registrar_uso(response)
+        self._ajustar_uso(response, estimado)
+        return response
+
+    @staticmethod
+    def _registrar_uso(response):
+        uso = response.get("usage") if response is not None else None
+        if uso:
+            for tipo in ("prompt_tokens", "completion_tokens"):
+                if uso.get(tipo):
+                    TOKENS.inc(uso[tipo], tipo=tipo)
+
+    def generar_embedding(self, texto: str, model=settings.EMBEDDING_MODEL):
+        embedding = self.embedding_cache.obtener(texto, model)
+        if embedding is not None:
+            return embedding
+        try:
+            response = self._crear_embeddings(texto, model)
+            embedding = response['data'][0]['embedding']
+            self.embedding_cache.guardar(texto, model, embedding)
+            return embedding
+        except Saturado:
+            raise
         except Exception as e:
             print(f"[ERROR] No se pudo generar embedding para: {texto}\nError: {e}")
             return None
 
-    def chat_completion(self, messages, functions=None, model="gpt-4", function_call="auto"):
+    def generar_embeddings(self, textos: list, model=settings.EMBEDDING_MODEL, usar_cache=True):
+        """
+        Embeddings de varios textos con una sola llamada (input como arreglo).
+        Devuelve la lista en el mismo orden, o None si falla la llamada.
+        """
+        embeddings = [None] * len(textos)
+        pendientes = []
+        for i, texto in enumerate(textos):
+            if usar_cache:
+                embeddings[i] = self.embedding_cache.obtener(texto, model)
+            if embeddings[i] is None:
+                pendientes.append(i)
+        if not pendientes:
+            return embeddings
+        try:
+            response = self._crear_embeddings([textos[i] for i in pendientes], model)
+            for item in response['data']:
+                i = pendientes[item['index']]
+                embeddings[i] = item['embedding']
+                if usar_cache:
+                    self.embedding_cache.guardar(textos[i], model, embeddings[i])
+            return embeddings
+        except Saturado:
+            raise
+        except Exception as e:
+            print(f"[ERROR] No se pudieron generar {len(pendientes)} embeddings en lote.\nError: {e}")
+            return None
+
+    @staticmethod
+    def _parametros_funciones(functions, function_call, tools, tool_choice):
+        # Con `tools` el modelo puede pedir varias funciones en una misma respuesta
+        if tools:
+            return {"tools": tools, "tool_choice": tool_choice}
+        return {"functions": functions, "function_call": function_call}
+
+    def chat_completion(self, messages, functions=None, model="gpt-4", function_call="auto", tools=None, tool_choice="auto"):
         """
         Emula la forma en la que llamas a la API de ChatCompletion en main.py.
+        Lanza Saturado si no hay capacidad para la llamada.
+        """
+        estimado = self._estimar_tokens(messages, functions, tools) + _RESERVA_COMPLETION
+        self._admitir(estimado)
+        try:
+            response = self.transport.llamar(
+                "chat", openai.ChatCompletion.create, settings.OPENAI_TIMEOUT_CHAT,
+                model=model,
+                messages=messages,
+                **self._parametros_funciones(functions, function_call, tools, tool_choice)
+            )
+            self._registrar_uso(response)
+            self._ajustar_uso(response, estimado)
+            return response.choices[0].message
+        except openai.error.OpenAIError as e:
+            print(f"Error al llamar a la API de OpenAI: {e}")
+            return None
+
+    def chat_completion_stream(self, messages, functions=None, model="gpt-4", function_call="auto", tools=None, tool_choice="auto"):
+        """
+        Igual que chat_completion pero con stream=True. Devuelve un generador de
+        deltas (con 'content' o fragmentos de 'function_call'/'tool_calls'), o None si falla la llamada.
+        El stream no informa el uso: la cubeta de tokens se queda con lo estimado.
         """
+        self._admitir(self._estimar_tokens(messages, functions, tools) + _RESERVA_COMPLETION)
         try:
-            response = openai.ChatCompletion.create(
+            # Solo se reintenta la apertura del stream, antes de recibir tokens
+            response = self.transport.llamar(
+                "chat_stream", openai.ChatCompletion.create, settings.OPENAI_TIMEOUT_CHAT,
                 model=model,
                 messages=messages,
-                functions=functions,
-                function_call=function_call
+                stream=True,
+                **self._parametros_funciones(functions, function_call, tools, tool_choice)
             )
+        except openai.error.OpenAIError as e:
+            print(f"Error al llamar a la API de OpenAI (stream): {e}")
+            return None
+        return self._deltas(response)
+
+    @staticmethod
+    def _deltas(response):
+        for chunk in response:
+            if chunk.choices:
+                yield chunk.choices[0].delta
+
+    def estadisticas(self):
+        return {
+            "embedding_cache": self.embedding_cache.estadisticas(),
+            "transporte": self.transport.estadisticas(),
+            "admision": self.admision.estadisticas()
+        }
+
+class AsyncOpenAIService:
+    """
+    Versión asíncrona de OpenAIService para asgi_app.py (openai.*.acreate sobre aiohttp):
+    mientras espera a OpenAI no ocupa un hilo. Comparte con `servicio` la caché de
+    embeddings, el control de admisión y las estadísticas del transporte.
+    Sin cobertura (hedging) de embeddings: los reintentos sí se aplican.
+    """
+
+    def __init__(self, servicio: OpenAIService, max_conexiones=256):
+        self.servicio = servicio
+        self.embedding_cache = servicio.embedding_cache
+        self.admision = servicio.admision
+        self.transport = servicio.transport
+        self.max_conexiones = max_conexiones
+        self._sesion_http = None
+
+    def _sesion(self):
+        # Una sesión aiohttp (pool con keep-alive) por proceso, creada dentro del event loop
+        if self._sesion_http is None or self._sesion_http.closed:
+            import aiohttp
+            self._sesion_http = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_conexiones)
+            )
+        return self._sesion_http
+
+    async def cerrar(self):
+        if self._sesion_http is not None and not self._sesion_http.closed:
+            await self._sesion_http.close()
+
+    async def _admitir(self, estimado):
+        # La espera por capacidad es rara (solo con límites configurados): se hace en un hilo
+        if self.admision.cubetas:
+            with ETAPAS.medir(etapa="admision"):
+                await asyncio.to_thread(self.admision.adquirir, estimado)
+
+    async def _llamar(self, tipo, funcion, timeout, **kwargs):
+        token = openai.aiosession.set(self._sesion())
+        try:
+            return await self.transport.llamar_async(tipo, funcion, timeout, **kwargs)
+        finally:
+            openai.aiosession.reset(token)
+
+    async def _crear_embeddings(self, entrada, model):
+        estimado = self.servicio._estimar_tokens(entrada)
+        await self._admitir(estimado)
+        with ETAPAS.medir(etapa="embedding"):
+            response = await self._llamar(
+                "embedding", openai.Embedding.acreate, settings.OPENAI_TIMEOUT_EMBEDDING,
+                input=entrada, model=model
+            )
+        self.servicio._registrar_uso(response)
+        self.servicio._ajustar_uso(response, estimado)
+        return response
+
+    # La caché de embeddings se consulta en memoria dentro del loop; su nivel de disco
+    # (SQLite, con lock propio) se lee y escribe en un hilo para no bloquear el event loop
+
+    async def _obtener_cacheados(self, textos, model):
+        cache = self.embedding_cache
+        embeddings = [cache.obtener_memoria(texto, model) for texto in textos]
+        faltan = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if faltan and cache.en_disco:
+            encontrados = await asyncio.to_thread(cache.obtener_disco, [textos[i] for i in faltan], model)
+            for i, embedding in zip(faltan, encontrados):
+                embeddings[i] = embedding
+        return embeddings
+
+    async def _guardar_cacheados(self, textos, model, embeddings):
+        cache = self.embedding_cache
+        for texto, embedding in zip(textos, embeddings):
+            cache.guardar_memoria(texto, model, embedding)
+        if cache.en_disco:
+            await asyncio.to_thread(cache.guardar_disco, textos, model, embeddings)
+
+    async def generar_embedding(self, texto: str, model=settings.EMBEDDING_MODEL):
+        embedding = (await self._obtener_cacheados([texto], model))[0]
+        if embedding is not None:
+            return embedding
+        try:
+            response = await self._crear_embeddings(texto, model)
+            embedding = response['data'][0]['embedding']
+            await self._guardar_cacheados([texto], model, [embedding])
+            return embedding
+        except Saturado:
+            raise
+        except Exception as e:
+            print(f"[ERROR] No se pudo generar embedding para: {texto}\nError: {e}")
+            return None
+
+    async def generar_embeddings(self, textos: list, model=settings.EMBEDDING_MODEL, usar_cache=True):
+        embeddings = await self._obtener_cacheados(textos, model) if usar_cache else [None] * len(textos)
+        pendientes = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if not pendientes:
+            return embeddings
+        try:
+            response = await self._crear_embeddings([textos[i] for i in pendientes], model)
+            for item in response['data']:
+                embeddings[pendientes[item['index']]] = item['embedding']
+            if usar_cache:
+                await self._guardar_cacheados([textos[i] for i in pendientes], model, [embeddings[i] for i in pendientes])
+            return embeddings
+        except Saturado:
+            raise
+        except Exception as e:
+            print(f"[ERROR] No se pudieron generar {len(pendientes)} embeddings en lote.\nError: {e}")
+            return None
+
+    async def chat_completion(self, messages, functions=None, model="gpt-4", function_call="auto", tools=None, tool_choice="auto"):
+        estimado = self.servicio._estimar_tokens(messages, functions, tools) + _RESERVA_COMPLETION
+        await self._admitir(estimado)
+        try:
+            response = await self._llamar(
+                "chat", openai.ChatCompletion.acreate, settings.OPENAI_TIMEOUT_CHAT,
+                model=model,
+                messages=messages,
+                **OpenAIService._parametros_funciones(functions, function_call, tools, tool_choice)
+            )
+            self.servicio._registrar_uso(response)
+            self.servicio._ajustar_uso(response, estimado)
             return response.choices[0].message
         except openai.error.OpenAIError as e:
             print(f"Error al llamar a la API de OpenAI: {e}")
             return None
+
+    def estadisticas(self):
+        return self.servicio.estadisticas()
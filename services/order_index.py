@@ -0,0 +1,138 @@
+# services/order_index.py
+import heapq
+import re
+import threading
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from services.order_log import OrderLog
+
+def normalizar_telefono(telefono):
+    """
+    Solo dígitos y sin el prefijo de país 51: "+51 999 888 777" -> "999888777".
+    """
+    digitos = re.sub(r"\D", "", str(telefono or ""))
+    if len(digitos) == 11 and digitos.startswith("51"):
+        digitos = digitos[2:]
+    return digitos
+
+class OrderIndex:
+    """
+    Índices secundarios en memoria sobre el registro de pedidos: id_unico, teléfono,
+    SKU y fecha (día). Guardan posiciones (segmento, offset) del log; el pedido se lee
+    del disco solo al devolverlo.
+    - reconstruir() recorre el log completo (al arrancar).
+    - registrar() agrega un pedido recién escrito por este proceso.
+    - Antes de cada consulta se leen los pedidos que otros workers hayan anexado.
+    """
+
+    def __init__(self, order_log: OrderLog):
+        self.order_log = order_log
+        self._lock = threading.RLock()
+        self._limpiar()
+
+    def _limpiar(self):
+        self._por_id = {}
+        self._por_telefono = defaultdict(list)
+        self._por_sku = defaultdict(list)
+        self._por_fecha = defaultdict(list)
+        self._dias = []  # días con pedidos, ordenados (para rangos)
+        self._indexadas = set()
+        self._ultima = None  # última posición recorrida en el log
+        self._fin_recorrido = None  # tamaño del log en el último recorrido
+
+    def reconstruir(self):
+        with self._lock:
+            self._limpiar()
+            self._ponerse_al_dia()
+            total = len(self._indexadas)
+        print(f"Índice de pedidos construido con {total} pedidos.")
+        return total
+
+    def _ponerse_al_dia(self):
+        final = self.order_log.posicion_final()
+        if final is None or final == self._fin_recorrido:
+            return
+        for segmento, offset, registro in self.order_log.iterar(desde=self._ultima):
+            self._agregar((segmento, offset), registro)
+            self._ultima = (segmento, offset)
+        self._fin_recorrido = final
+
+    def _agregar(self, posicion, registro):
+        if posicion in self._indexadas:
+            return
+        pedido = registro.get("Pedido") if isinstance(registro, dict) else None
+        if not isinstance(pedido, dict):
+            return
+        self._indexadas.add(posicion)
+        id_unico = pedido.get("id_unico")
+        if id_unico:
+            self._por_id[str(id_unico)] = posicion
+        datos_cliente = pedido.get("datos_cliente") or {}
+        telefono = normalizar_telefono(datos_cliente.get("telefono"))
+        if telefono:
+            self._por_telefono[telefono].append(posicion)
+        skus = {str(p.get("sku")) for p in pedido.get("productos") or [] if isinstance(p, dict) and p.get("sku")}
+        for sku in skus:
+            self._por_sku[sku].append(posicion)
+        dia = str(pedido.get("fecha") or "")[:10]
+        if dia:
+            if dia not in self._por_fecha:
+                self._dias.insert(bisect_left(self._dias, dia), dia)
+            self._por_fecha[dia].append(posicion)
+
+    def registrar(self, posicion, registro):
+        with self._lock:
+            self._agregar(tuple(posicion), registro)
+
+    # --- Consultas ---
+
+    def _leer(self, posiciones, limite):
+        # Los más recientes primero
+        pedidos = []
+        for posicion in heapq.nlargest(limite, posiciones):
+            try:
+                pedidos.append(self.order_log.leer(posicion)["Pedido"])
+            except (OSError, ValueError, KeyError) as e:
+                print(f"[ERROR] No se pudo leer el pedido en {posicion}: {e}")
+        return pedidos
+
+    def por_id(self, id_unico):
+        with self._lock:
+            self._ponerse_al_dia()
+            posicion = self._por_id.get(str(id_unico))
+        if posicion is None:
+            return None
+        pedidos = self._leer([posicion], 1)
+        return pedidos[0] if pedidos else None
+
+    def buscar(self, telefono=None, sku=None, desde=None, hasta=None, limite=50):
+        """
+        Pedidos que cumplen todos los filtros dados (teléfono, SKU, rango de días
+        "AAAA-MM-DD" inclusivo), del más reciente al más antiguo.
+        """
+        with self._lock:
+            self._ponerse_al_dia()
+            conjuntos = []
+            if telefono:
+                conjuntos.append(set(self._por_telefono.get(normalizar_telefono(telefono), ())))
+            if sku:
+                conjuntos.append(set(self._por_sku.get(str(sku), ())))
+            if desde or hasta:
+                inicio = bisect_left(self._dias, desde) if desde else 0
+                fin = bisect_right(self._dias, hasta) if hasta else len(self._dias)
+                conjuntos.append({p for dia in self._dias[inicio:fin] for p in self._por_fecha[dia]})
+        if not conjuntos:
+            return []
+        # Se intersecta empezando por el conjunto más chico
+        conjuntos.sort(key=len)
+        posiciones = conjuntos[0].intersection(*conjuntos[1:])
+        return self._leer(posiciones, limite)
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                "pedidos": len(self._indexadas),
+                "telefonos": len(self._por_telefono),
+                "skus": len(self._por_sku),
+                "dias": len(self._dias)
+            }
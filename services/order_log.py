@@ -0,0 +1,229 @@
+# services/order_log.py
+import glob
+import json
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin bloqueo entre procesos
+    fcntl = None
+
+FSYNC_SIEMPRE = "siempre"
+FSYNC_INTERVALO = "intervalo"
+FSYNC_NUNCA = "nunca"
+
+class _Entrada:
+    __slots__ = ("linea", "posicion", "error", "lista")
+
+    def __init__(self, linea):
+        self.linea = linea
+        self.posicion = None
+        self.error = None
+        self.lista = False
+
+class OrderLog:
+    """
+    Registro de pedidos de solo-anexado en formato JSON lines.
+    - Cada escritura toma un bloqueo de archivo (fcntl) para ser segura entre workers.
+    - Las escrituras concurrentes de un mismo proceso se agrupan (group commit):
+      un hilo líder escribe el lote completo con un solo write/fsync.
+    - Los segmentos rotan al superar `max_segmento_bytes`.
+    """
+
+    PATRON_SEGMENTO = "ventas-{:06d}.jsonl"
+
+    def __init__(self, directorio, fsync=FSYNC_SIEMPRE, intervalo_fsync=1.0, max_segmento_bytes=64 * 1024 * 1024):
+        self.directorio = directorio
+        self.fsync = fsync
+        self.intervalo_fsync = intervalo_fsync
+        self.max_segmento_bytes = max_segmento_bytes
+        self._ruta_lock = os.path.join(directorio, "ventas.lock")
+        self._cond = threading.Condition()
+        self._pendientes = []
+        self._escribiendo = False
+        self._ultimo_fsync = 0.0
+        os.makedirs(directorio, exist_ok=True)
+        if fcntl is None:
+            print("[WARN] fcntl no disponible: el registro de ventas no se bloquea entre procesos.")
+
+    # --- Escritura ---
+
+    def agregar(self, registro: dict):
+        """
+        Anexa un registro y devuelve su posición (segmento, offset) una vez persistido.
+        """
+        entrada = _Entrada(json.dumps(registro, ensure_ascii=False) + "\n")
+        with self._cond:
+            self._pendientes.append(entrada)
+            while not entrada.lista and self._escribiendo:
+                self._cond.wait()
+            if entrada.lista:
+                if entrada.error:
+                    raise entrada.error
+                return entrada.posicion
+            # Este hilo pasa a ser el líder y escribe todo lo pendiente
+            self._escribiendo = True
+            lote = self._pendientes
+            self._pendientes = []
+
+        try:
+            self._escribir_lote(lote)
+        except Exception as e:
+            for pendiente in lote:
+                pendiente.error = e
+        finally:
+            with self._cond:
+                for pendiente in lote:
+                    pendiente.lista = True
+                self._escribiendo = False
+                self._cond.notify_all()
+
+        if entrada.error:
+            raise entrada.error
+        return entrada.posicion
+
+    def _escribir_lote(self, lote):
+        with self._bloqueo_archivo():
+            ruta = self._segmento_para_escribir()
+            with open(ruta, "ab") as f:
+                offset = f.tell()
+                if offset > 0 and self._ultimo_byte(ruta) != b"\n":
+                    # Una escritura anterior quedó cortada: empezar en línea nueva
+                    f.write(b"\n")
+                    offset += 1
+                datos = []
+                nombre = os.path.basename(ruta)
+                for entrada in lote:
+                    linea = entrada.linea.encode("utf-8")
+                    entrada.posicion = (nombre, offset)
+                    offset += len(linea)
+                    datos.append(linea)
+                f.write(b"".join(datos))
+                f.flush()
+                self._sincronizar(f)
+
+    def _sincronizar(self, f):
+        if self.fsync == FSYNC_SIEMPRE:
+            os.fsync(f.fileno())
+        elif self.fsync == FSYNC_INTERVALO:
+            ahora = time.monotonic()
+            if ahora - self._ultimo_fsync >= self.intervalo_fsync:
+                os.fsync(f.fileno())
+                self._ultimo_fsync = ahora
+
+    @staticmethod
+    def _ultimo_byte(ruta):
+        with open(ruta, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1)
+
+    def _bloqueo_archivo(self):
+        return _BloqueoArchivo(self._ruta_lock)
+
+    def _segmento_para_escribir(self):
+        segmentos = self.segmentos()
+        if not segmentos:
+            return os.path.join(self.directorio, self.PATRON_SEGMENTO.format(1))
+        actual = segmentos[-1]
+        if os.path.getsize(actual) >= self.max_segmento_bytes:
+            numero = self._numero_segmento(actual) + 1
+            return os.path.join(self.directorio, self.PATRON_SEGMENTO.format(numero))
+        return actual
+
+    # --- Lectura ---
+
+    def segmentos(self):
+        return sorted(glob.glob(os.path.join(self.directorio, "ventas-*.jsonl")))
+
+    @staticmethod
+    def _numero_segmento(ruta):
+        return int(os.path.basename(ruta)[len("ventas-"):-len(".jsonl")])
+
+    def iterar(self, desde=None):
+        """
+        Recorre los registros en orden sin cargar el log completo en memoria.
+        Genera tuplas (segmento, offset, registro). `desde` es una posición
+        (segmento, offset) a partir de la cual continuar.
+        """
+        for ruta in self.segmentos():
+            nombre = os.path.basename(ruta)
+            offset = 0
+            if desde is not None:
+                if nombre < desde[0]:
+                    continue
+                if nombre == desde[0]:
+                    offset = desde[1]
+            with open(ruta, "rb") as f:
+                f.seek(offset)
+                for linea in f:
+                    inicio = offset
+                    offset += len(linea)
+                    if not linea.endswith(b"\n"):
+                        # Línea incompleta (escritura en curso o cortada)
+                        break
+                    try:
+                        registro = json.loads(linea)
+                    except ValueError:
+                        continue
+                    yield nombre, inicio, registro
+
+    def leer(self, posicion):
+        segmento, offset = posicion
+        with open(os.path.join(self.directorio, segmento), "rb") as f:
+            f.seek(offset)
+            return json.loads(f.readline())
+
+    def posicion_final(self):
+        segmentos = self.segmentos()
+        if not segmentos:
+            return None
+        return os.path.basename(segmentos[-1]), os.path.getsize(segmentos[-1])
+
+    # --- Migración ---
+
+    def migrar_desde_json(self, ruta_json):
+        """
+        Migración única del antiguo arreglo `ventas.json` al log. Deja una marca
+        en el directorio para no repetirla; el archivo original no se modifica.
+        """
+        marca = os.path.join(self.directorio, ".migrado")
+        if os.path.exists(marca) or not os.path.exists(ruta_json):
+            return 0
+        with self._bloqueo_archivo():
+            if os.path.exists(marca):
+                return 0
+            try:
+                with open(ruta_json, "r", encoding="utf-8") as f:
+                    ventas = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"[ERROR] No se pudo leer {ruta_json} para migrar: {e}")
+                return 0
+            ruta = self._segmento_para_escribir()
+            with open(ruta, "ab") as f:
+                for pedido in ventas:
+                    f.write((json.dumps(pedido, ensure_ascii=False) + "\n").encode("utf-8"))
+                f.flush()
+                os.fsync(f.fileno())
+            with open(marca, "w", encoding="utf-8") as f:
+                f.write(os.path.abspath(ruta_json))
+        print(f"{len(ventas)} pedidos migrados desde {ruta_json} a {self.directorio}.")
+        return len(ventas)
+
+class _BloqueoArchivo:
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self._f = None
+
+    def __enter__(self):
+        self._f = open(self.ruta, "a")
+        if fcntl is not None:
+            fcntl.flock(self._f.fileno(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl is not None:
+            fcntl.flock(self._f.fileno(), fcntl.LOCK_UN)
+        self._f.close()
+        return False
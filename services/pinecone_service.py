@@ -1,18 +1,43 @@
 from pinecone.grpc import PineconeGRPC as Pinecone
 from pinecone import ServerlessSpec
 from config.settings import settings
-import sys
+from utils.metrics import ETAPAS
+import os
+import time
 
 class PineconeService:
     def __init__(self):
         try:
             self.pc = Pinecone(api_key=settings.PINECONE_API_KEY)
-            self.setup_index()
         except Exception as e:
             print(f"[ERROR] No se pudo inicializar el cliente de Pinecone: {e}")
-            sys.exit(1)
+            raise RuntimeError("No se pudo inicializar el cliente de Pinecone.") from e
+        self.setup_index()
+
+    @staticmethod
+    def _indice_verificado():
+        """
+        True si otro worker (o un arranque anterior) ya confirmó que el índice existe.
+        """
+        try:
+            edad = time.time() - os.path.getmtime(settings.PINECONE_INDEX_MARKER)
+        except OSError:
+            return False
+        return edad < settings.PINECONE_INDEX_CHECK_TTL
+
+    @staticmethod
+    def _marcar_indice_verificado():
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(settings.PINECONE_INDEX_MARKER)), exist_ok=True)
+            with open(settings.PINECONE_INDEX_MARKER, "w", encoding="utf-8") as f:
+                f.write(settings.INDEX_NAME)
+        except OSError as e:
+            print(f"[WARN] No se pudo guardar la marca del índice Pinecone: {e}")
 
     def setup_index(self):
+        if self._indice_verificado():
+            self.index = self.pc.Index(settings.INDEX_NAME)
+            return
         try:
             if settings.INDEX_NAME not in self.pc.list_indexes():
                 self.pc.create_index(
@@ -34,18 +59,51 @@ class PineconeService:
                 self.index = self.pc.Index(settings.INDEX_NAME)
             else:
                 print(f"[ERROR] No se pudo crear/listar índice Pinecone: {e}")
-                sys.exit(1)
+                raise RuntimeError("No se pudo crear/listar el índice de Pinecone.") from e
+        self._marcar_indice_verificado()
+
+    def calentar(self):
+        """
+        Abre el canal con el índice antes de la primera consulta real.
+        """
+        try:
+            self.index.describe_index_stats()
+        except Exception as e:
+            print(f"[WARN] No se pudo calentar la conexión con Pinecone: {e}")
 
-    def query_index(self, vector, top_k=5, namespace=""):
+    def query_index(self, vector, top_k=5, namespace="", include_metadata=True):
         try:
-            response = self.index.query(
-                vector=vector,
-                top_k=top_k,
-                include_values=False,
-                include_metadata=True,
-                namespace=namespace
-            )
+            with ETAPAS.medir(etapa="consulta_indice"):
+                response = self.index.query(
+                    vector=vector,
+                    top_k=top_k,
+                    include_values=False,
+                    include_metadata=include_metadata,
+                    namespace=namespace
+                )
             return response.matches
         except Exception as e:
             print(f"[ERROR] Error al consultar Pinecone: {e}")
             return None
+
+    def fetch_metadata(self, ids, namespace=""):
+        """
+        Metadata de varios vectores por id en una sola llamada: {id: metadata}.
+        """
+        try:
+            response = self.index.fetch(ids=list(ids), namespace=namespace)
+            return {id_: vector.metadata for id_, vector in response.vectors.items()}
+        except Exception as e:
+            print(f"[ERROR] Error al leer vectores de Pinecone: {e}")
+            return None
+
+    def upsert_vectores(self, vectores, namespace=""):
+        """
+        Sube una lista de (id, valores, metadata). Devuelve True si tuvo éxito.
+        """
+        try:
+            self.index.upsert(vectors=vectores, namespace=namespace)
+            return True
+        except Exception as e:
+            print(f"[ERROR] Error al subir {len(vectores)} vectores a Pinecone: {e}")
+            return False
@@ -0,0 +1,223 @@
+# services/sales_stats.py
+import heapq
+import json
+import os
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from services.order_log import OrderLog
+from utils.helpers import quitar_acentos
+
+VERSION_SNAPSHOT = 1
+
+def _cantidad(producto):
+    try:
+        cantidad = float(producto.get("cantidad", 1))
+    except (TypeError, ValueError):
+        return 1.0
+    return cantidad if cantidad > 0 else 1.0
+
+def _importe(producto):
+    try:
+        return float(producto.get("precio_bayovar")) * _cantidad(producto)
+    except (TypeError, ValueError):
+        return 0.0
+
+def _modalidad(datos_cliente):
+    # El modelo escribe la modalidad libremente: "Delivery", "delivery ", "recojo en tienda"...
+    modalidad = quitar_acentos(str((datos_cliente or {}).get("modalidad_entrega") or "")).strip()
+    return " ".join(modalidad.split()) or "sin_especificar"
+
+def _sumar(acumulado, pedidos, unidades, ingresos):
+    acumulado[0] += pedidos
+    acumulado[1] += unidades
+    acumulado[2] += ingresos
+
+def _fila(acumulado):
+    return {"pedidos": acumulado[0], "unidades": round(acumulado[1], 3), "ingresos": round(acumulado[2], 2)}
+
+class SalesStats:
+    """
+    Agregados de ventas mantenidos de forma incremental sobre el registro de pedidos:
+    totales por día, por SKU y por modalidad de entrega.
+    - cargar() parte del último snapshot (agregados + posición del log) y lee solo lo
+      anexado después; sin snapshot válido recorre el log en streaming (OrderLog.iterar).
+    - registrar() se llama tras cada crear_pedido y lee desde la última posición aplicada,
+      así también suma los pedidos que otros workers hayan escrito.
+    - El snapshot se reescribe cada `snapshot_cada` pedidos (escritura atómica).
+    """
+
+    def __init__(self, order_log: OrderLog, ruta_snapshot=None, snapshot_cada=50):
+        self.order_log = order_log
+        self.ruta_snapshot = ruta_snapshot
+        self.snapshot_cada = snapshot_cada
+        self._lock = threading.RLock()
+        self._limpiar()
+
+    def _limpiar(self):
+        self._totales = [0, 0.0, 0.0]  # pedidos, unidades, ingresos
+        self._por_dia = {}  # "AAAA-MM-DD" -> [pedidos, unidades, ingresos]
+        self._dias = []  # días ordenados (para rangos)
+        self._por_sku = {}  # sku -> [pedidos, unidades, ingresos, nombre]
+        self._por_modalidad = {}  # modalidad -> [pedidos, unidades, ingresos]
+        self._ultima = None  # posición (segmento, offset) del último pedido aplicado
+        self._fin_recorrido = None  # tamaño del log en el último recorrido
+        self._sin_guardar = 0
+
+    # --- Carga y actualización ---
+
+    def cargar(self):
+        """
+        Restaura el snapshot (si corresponde a este log) y se pone al día con el log.
+        """
+        inicio = time.perf_counter()
+        with self._lock:
+            self._limpiar()
+            desde_snapshot = self._leer_snapshot()
+            if not desde_snapshot:
+                self._limpiar()
+            leidos = self._ponerse_al_dia()
+            if leidos or not desde_snapshot:
+                self.guardar()
+            total = self._totales[0]
+        origen = "snapshot + log" if desde_snapshot else "log completo"
+        print(f"Estadísticas de ventas cargadas ({origen}): {total} pedidos en {time.perf_counter() - inicio:.3f}s.")
+        return total
+
+    def _ponerse_al_dia(self):
+        final = self.order_log.posicion_final()
+        if final is None or final == self._fin_recorrido:
+            return 0
+        leidos = 0
+        for segmento, offset, registro in self.order_log.iterar(desde=self._ultima):
+            posicion = (segmento, offset)
+            # iterar(desde=...) empieza en el último pedido ya aplicado
+            if self._ultima is not None and posicion <= self._ultima:
+                continue
+            self._aplicar(registro)
+            self._ultima = posicion
+            leidos += 1
+        self._fin_recorrido = final
+        self._sin_guardar += leidos
+        return leidos
+
+    def _aplicar(self, registro):
+        pedido = registro.get("Pedido") if isinstance(registro, dict) else None
+        if not isinstance(pedido, dict):
+            return
+        productos = [p for p in pedido.get("productos") or [] if isinstance(p, dict)]
+        unidades = sum(_cantidad(p) for p in productos)
+        ingresos = sum(_importe(p) for p in productos)
+
+        _sumar(self._totales, 1, unidades, ingresos)
+        dia = str(pedido.get("fecha") or "")[:10]
+        if dia:
+            if dia not in self._por_dia:
+                self._dias.insert(bisect_left(self._dias, dia), dia)
+                self._por_dia[dia] = [0, 0.0, 0.0]
+            _sumar(self._por_dia[dia], 1, unidades, ingresos)
+        modalidad = _modalidad(pedido.get("datos_cliente"))
+        _sumar(self._por_modalidad.setdefault(modalidad, [0, 0.0, 0.0]), 1, unidades, ingresos)
+
+        vistos = set()
+        for producto in productos:
+            sku = str(producto.get("sku") or "")
+            if not sku:
+                continue
+            acumulado = self._por_sku.setdefault(sku, [0, 0.0, 0.0, producto.get("nombre")])
+            # Un pedido con el mismo SKU en dos líneas cuenta como un pedido
+            _sumar(acumulado, 0 if sku in vistos else 1, _cantidad(producto), _importe(producto))
+            vistos.add(sku)
+
+    def registrar(self):
+        """
+        Suma el pedido recién escrito (y los anexados antes por otros workers).
+        """
+        with self._lock:
+            self._ponerse_al_dia()
+            if self.snapshot_cada and self._sin_guardar >= self.snapshot_cada:
+                self.guardar()
+
+    # --- Snapshot ---
+
+    def guardar(self):
+        if not self.ruta_snapshot:
+            return False
+        with self._lock:
+            snapshot = {
+                "version": VERSION_SNAPSHOT,
+                "posicion": list(self._ultima) if self._ultima else None,
+                "totales": self._totales,
+                "por_dia": self._por_dia,
+                "por_sku": self._por_sku,
+                "por_modalidad": self._por_modalidad
+            }
+            temporal = f"{self.ruta_snapshot}.{os.getpid()}.tmp"
+            try:
+                with open(temporal, "w", encoding="utf-8") as f:
+                    json.dump(snapshot, f, ensure_ascii=False, separators=(",", ":"))
+                os.replace(temporal, self.ruta_snapshot)
+            except OSError as e:
+                print(f"[ERROR] No se pudo guardar el snapshot de estadísticas en {self.ruta_snapshot}: {e}")
+                return False
+            self._sin_guardar = 0
+        return True
+
+    def _leer_snapshot(self):
+        if not self.ruta_snapshot or not os.path.exists(self.ruta_snapshot):
+            return False
+        try:
+            with open(self.ruta_snapshot, "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+            if snapshot.get("version") != VERSION_SNAPSHOT:
+                return False
+            posicion = snapshot.get("posicion")
+            if posicion is not None:
+                # Si el log ya no contiene esa posición (se borró o reemplazó), se reconstruye
+                ruta = os.path.join(self.order_log.directorio, posicion[0])
+                if not os.path.exists(ruta) or os.path.getsize(ruta) <= posicion[1]:
+                    print("[WARN] El snapshot de estadísticas no coincide con el registro de ventas; se reconstruye.")
+                    return False
+                self._ultima = (posicion[0], int(posicion[1]))
+            self._totales = snapshot["totales"]
+            self._por_dia = snapshot["por_dia"]
+            self._dias = sorted(self._por_dia)
+            self._por_sku = snapshot["por_sku"]
+            self._por_modalidad = snapshot["por_modalidad"]
+        except (OSError, ValueError, KeyError, TypeError, IndexError) as e:
+            print(f"[WARN] Snapshot de estadísticas inválido ({self.ruta_snapshot}): {e}")
+            return False
+        return True
+
+    # --- Consultas ---
+
+    def resumen(self, desde=None, hasta=None, top=10):
+        """
+        Totales, serie por día (rango "AAAA-MM-DD" inclusivo), los `top` SKUs por ingresos
+        y los totales por modalidad de entrega. SKUs y modalidades son acumulados históricos.
+        """
+        with self._lock:
+            self._ponerse_al_dia()
+            inicio = bisect_left(self._dias, desde) if desde else 0
+            fin = bisect_right(self._dias, hasta) if hasta else len(self._dias)
+            por_dia = [dict(_fila(self._por_dia[dia]), dia=dia) for dia in self._dias[inicio:fin]]
+            top_skus = heapq.nlargest(top, self._por_sku.items(), key=lambda item: item[1][2])
+            respuesta = {
+                "totales": _fila(self._totales),
+                "por_dia": por_dia,
+                "top_skus": [dict(_fila(a), sku=sku, nombre=a[3]) for sku, a in top_skus],
+                "por_modalidad": {m: _fila(a) for m, a in sorted(self._por_modalidad.items())},
+                "posicion": list(self._ultima) if self._ultima else None
+            }
+        if desde or hasta:
+            respuesta["rango"] = _fila([sum(d[k] for d in por_dia) for k in ("pedidos", "unidades", "ingresos")])
+        return respuesta
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                "pedidos": self._totales[0],
+                "dias": len(self._dias),
+                "skus": len(self._por_sku),
+                "modalidades": len(self._por_modalidad)
+            }
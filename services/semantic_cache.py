@@ -0,0 +1,100 @@
+# services/semantic_cache.py
+import threading
+import time
+import numpy as np
+from functions.lexical_index import tokenizar
+
+class SemanticCache:
+    """
+    Caché de respuestas para turnos sin historial previo, indexada por el embedding
+    del mensaje del usuario. Un mensaje cuyo coseno con uno guardado supera `umbral`
+    reutiliza los mensajes que produjo ese turno (llamadas a funciones y respuesta).
+    Se vacía cuando cambia la versión del catálogo.
+
+    El coseno no distingue bien tamaños ni marcas ("coca cola 500 ml" / "coca cola 1 litro"
+    superan 0.95): además debe coincidir la forma canónica del texto (`canonizar`, o sus
+    tokens si no hay canonizador), así un hit nunca muestra otro producto u otro precio.
+    """
+
+    def __init__(self, catalog_version, max_items=1000, ttl=3600, umbral=0.95, dimension=1536, canonizar=None):
+        self.catalog_version = catalog_version
+        self.max_items = max_items
+        self.ttl = ttl
+        self.umbral = umbral
+        self._matriz = np.zeros((max_items, dimension), dtype=np.float32)
+        self._expira = np.zeros(max_items, dtype=np.float64)
+        self._mensajes = [None] * max_items
+        self._claves = [None] * max_items
+        self.canonizar = canonizar
+        self._usados = 0
+        self._siguiente = 0
+        self._version = catalog_version.actual()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _normalizar(embedding):
+        v = np.asarray(embedding, dtype=np.float32)
+        norma = np.linalg.norm(v)
+        return v / norma if norma else v
+
+    def _clave(self, texto):
+        if texto is None:
+            return None
+        if self.canonizar is not None:
+            return self.canonizar(texto)
+        return " ".join(tokenizar(texto))
+
+    def _verificar_version(self):
+        version = self.catalog_version.actual()
+        if version != self._version:
+            self._expira[:] = 0
+            self._mensajes = [None] * self.max_items
+            self._claves = [None] * self.max_items
+            self._usados = 0
+            self._siguiente = 0
+            self._version = version
+
+    def buscar(self, embedding, texto=None):
+        """
+        Devuelve la lista de mensajes guardada para un mensaje similar (y con la misma
+        forma canónica que `texto`, si se indica), o None.
+        """
+        q = self._normalizar(embedding)
+        clave = self._clave(texto)
+        with self._lock:
+            self._verificar_version()
+            if self._usados:
+                similitudes = self._matriz[:self._usados] @ q
+                similitudes[self._expira[:self._usados] < time.time()] = -1.0
+                candidatos = np.flatnonzero(similitudes >= self.umbral)
+                for i in candidatos[np.argsort(-similitudes[candidatos])]:
+                    if clave is None or self._claves[i] == clave:
+                        self.hits += 1
+                        return [dict(m) for m in self._mensajes[i]]
+            self.misses += 1
+            return None
+
+    def guardar(self, embedding, mensajes, texto=None):
+        clave = self._clave(texto)
+        with self._lock:
+            self._verificar_version()
+            # Búfer circular: al llenarse se reemplaza la entrada más antigua
+            i = self._siguiente
+            self._matriz[i] = self._normalizar(embedding)
+            self._expira[i] = time.time() + self.ttl
+            self._mensajes[i] = [dict(m) for m in mensajes]
+            self._claves[i] = clave
+            self._siguiente = (i + 1) % self.max_items
+            self._usados = max(self._usados, i + 1)
+
+    def estadisticas(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / total) if total else 0.0,
+                "items": self._usados
+            }
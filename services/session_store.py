@@ -0,0 +1,394 @@
+# services/session_store.py
+import hashlib
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from config.settings import settings
+from functions.tools import SYSTEM_MESSAGE
+
+# --- Formato compacto del historial ---
+# "S"                       -> SYSTEM_MESSAGE compartido (no se copia)
+# ["u", contenido]          -> mensaje del usuario
+# ["a", contenido]          -> respuesta del asistente
+# ["f", nombre, clave]      -> resultado de función; el contenido se guarda una sola vez por clave
+# ["t", tool_call_id, clave]-> resultado de tool (API de tools)
+# {...}                     -> cualquier otro mensaje, tal cual
+
+def clave_blob(contenido: str):
+    return hashlib.blake2b(contenido.encode("utf-8"), digest_size=12).hexdigest()
+
+def codificar_historial(messages):
+    """
+    Devuelve (entradas, blobs) donde blobs es {clave: contenido} de los resultados de funciones.
+    """
+    entradas = []
+    blobs = {}
+    for m in messages:
+        rol = m.get("role")
+        if m is SYSTEM_MESSAGE or m == SYSTEM_MESSAGE:
+            entradas.append("S")
+        elif rol in ("user", "assistant") and len(m) == 2 and isinstance(m.get("content"), str):
+            entradas.append(["u" if rol == "user" else "a", m["content"]])
+        elif rol == "function" and len(m) == 3:
+            clave = clave_blob(m["content"])
+            blobs[clave] = m["content"]
+            entradas.append(["f", m["name"], clave])
+        elif rol == "tool" and len(m) == 3:
+            clave = clave_blob(m["content"])
+            blobs[clave] = m["content"]
+            entradas.append(["t", m["tool_call_id"], clave])
+        else:
+            entradas.append(m)
+    return entradas, blobs
+
+def decodificar_historial(entradas, obtener_blob):
+    messages = []
+    for e in entradas:
+        if e == "S":
+            messages.append(SYSTEM_MESSAGE)
+        elif isinstance(e, dict):
+            messages.append(dict(e))
+        elif e[0] == "u":
+            messages.append({"role": "user", "content": e[1]})
+        elif e[0] == "a":
+            messages.append({"role": "assistant", "content": e[1]})
+        elif e[0] == "f":
+            messages.append({"role": "function", "name": e[1], "content": obtener_blob(e[2]) or "{}"})
+        elif e[0] == "t":
+            messages.append({"role": "tool", "tool_call_id": e[1], "content": obtener_blob(e[2]) or "{}"})
+    return messages
+
+def _tamano_entradas(entradas):
+    total = 0
+    for e in entradas:
+        if isinstance(e, dict):
+            total += len(json.dumps(e))
+        elif isinstance(e, list):
+            total += sum(len(x) for x in e)
+        else:
+            total += 1
+    return total
+
+class SessionStore:
+    """
+    Interfaz común: obtener(session_id) -> lista de mensajes o None,
+    guardar(session_id, messages) y eliminar(session_id).
+    arrendar/liberar_arriendo: arriendo por sesión para que dos workers no atiendan a la vez
+    la misma sesión; en memoria (un solo proceso) basta el lock local y siempre se concede.
+    """
+
+    def arrendar(self, session_id, duracion):
+        """
+        Token del arriendo de la sesión por `duracion` segundos, o None si otro lo tiene.
+        """
+        return secrets.token_hex(8)
+
+    def liberar_arriendo(self, session_id, token):
+        """
+        Suelta el arriendo solo si sigue siendo el de `token` (pudo vencer y pasar a otro).
+        """
+
+    def obtener(self, session_id):
+        raise NotImplementedError
+
+    def guardar(self, session_id, messages):
+        raise NotImplementedError
+
+    def eliminar(self, session_id):
+        raise NotImplementedError
+
+    def estadisticas(self):
+        return {}
+
+class MemorySessionStore(SessionStore):
+    """
+    Sesiones en memoria del proceso con expulsión LRU, TTL de inactividad y tope de memoria.
+    Los resultados de funciones idénticos se comparten entre sesiones (conteo de referencias).
+    """
+
+    def __init__(self, max_sesiones=10000, ttl_inactividad=7200, max_bytes=64 * 1024 * 1024):
+        self.max_sesiones = max_sesiones
+        self.ttl_inactividad = ttl_inactividad
+        self.max_bytes = max_bytes
+        self._sesiones = OrderedDict()  # session_id -> (ultimo_acceso, entradas, tamaño, claves)
+        self._blobs = {}  # clave -> [contenido, referencias]
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.expulsadas = 0
+
+    def obtener(self, session_id):
+        ahora = time.time()
+        with self._lock:
+            self._expirar(ahora)
+            sesion = self._sesiones.get(session_id)
+            if sesion is None:
+                return None
+            self._sesiones[session_id] = (ahora,) + sesion[1:]
+            self._sesiones.move_to_end(session_id)
+            return decodificar_historial(sesion[1], lambda clave: self._blobs[clave][0])
+
+    def guardar(self, session_id, messages):
+        entradas, blobs = codificar_historial(messages)
+        ahora = time.time()
+        with self._lock:
+            self._quitar(session_id)
+            for clave, contenido in blobs.items():
+                blob = self._blobs.get(clave)
+                if blob is None:
+                    self._blobs[clave] = [contenido, 1]
+                    self._bytes += len(contenido)
+                else:
+                    blob[1] += 1
+            tamano = _tamano_entradas(entradas)
+            self._sesiones[session_id] = (ahora, entradas, tamano, tuple(blobs))
+            self._bytes += tamano
+            self._expirar(ahora)
+            while self._sesiones and (len(self._sesiones) > self.max_sesiones or self._bytes > self.max_bytes):
+                self._quitar(next(iter(self._sesiones)))
+                self.expulsadas += 1
+
+    def eliminar(self, session_id):
+        with self._lock:
+            self._quitar(session_id)
+
+    def _quitar(self, session_id):
+        sesion = self._sesiones.pop(session_id, None)
+        if sesion is None:
+            return
+        self._bytes -= sesion[2]
+        for clave in sesion[3]:
+            blob = self._blobs[clave]
+            blob[1] -= 1
+            if blob[1] == 0:
+                self._bytes -= len(blob[0])
+                del self._blobs[clave]
+
+    def _expirar(self, ahora):
+        # Las sesiones están en orden de último acceso: basta mirar el principio
+        limite = ahora - self.ttl_inactividad
+        while self._sesiones:
+            session_id, sesion = next(iter(self._sesiones.items()))
+            if sesion[0] > limite:
+                break
+            self._quitar(session_id)
+            self.expulsadas += 1
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                "backend": "memoria",
+                "sesiones": len(self._sesiones),
+                "blobs": len(self._blobs),
+                "bytes": self._bytes,
+                "expulsadas": self.expulsadas
+            }
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Sesiones en un archivo SQLite compartido por varios procesos (modo WAL).
+    Los resultados de funciones se guardan una vez en la tabla `blobs`.
+    """
+
+    # Cada cuántas escrituras se purgan sesiones inactivas y blobs huérfanos
+    PURGAR_CADA = 200
+
+    def __init__(self, ruta, ttl_inactividad=7200):
+        self.ruta = ruta
+        self.ttl_inactividad = ttl_inactividad
+        self._local = threading.local()
+        self._escrituras = 0
+        os.makedirs(os.path.dirname(os.path.abspath(ruta)), exist_ok=True)
+        con = self._conexion()
+        con.execute(
+            "CREATE TABLE IF NOT EXISTS sesiones ("
+            "id TEXT PRIMARY KEY, datos TEXT, claves TEXT, actualizado REAL)"
+        )
+        con.execute("CREATE INDEX IF NOT EXISTS sesiones_actualizado ON sesiones(actualizado)")
+        con.execute("CREATE TABLE IF NOT EXISTS blobs (clave TEXT PRIMARY KEY, contenido TEXT)")
+        con.execute("CREATE TABLE IF NOT EXISTS arriendos (id TEXT PRIMARY KEY, token TEXT, vence REAL)")
+        con.commit()
+
+    def _conexion(self):
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = sqlite3.connect(self.ruta, timeout=10)
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("PRAGMA synchronous=NORMAL")
+            self._local.con = con
+        return con
+
+    def obtener(self, session_id):
+        con = self._conexion()
+        fila = con.execute(
+            "SELECT datos, actualizado FROM sesiones WHERE id = ?", (session_id,)
+        ).fetchone()
+        if fila is None or fila[1] < time.time() - self.ttl_inactividad:
+            return None
+        entradas = json.loads(fila[0])
+        claves = [e[2] for e in entradas if isinstance(e, list) and e[0] in ("f", "t")]
+        blobs = {}
+        if claves:
+            marcadores = ",".join("?" * len(claves))
+            blobs = dict(con.execute(
+                f"SELECT clave, contenido FROM blobs WHERE clave IN ({marcadores})", claves
+            ).fetchall())
+        return decodificar_historial(entradas, blobs.get)
+
+    def guardar(self, session_id, messages):
+        entradas, blobs = codificar_historial(messages)
+        con = self._conexion()
+        with con:
+            if blobs:
+                con.executemany(
+                    "INSERT OR IGNORE INTO blobs (clave, contenido) VALUES (?, ?)", blobs.items()
+                )
+            con.execute(
+                "INSERT OR REPLACE INTO sesiones (id, datos, claves, actualizado) VALUES (?, ?, ?, ?)",
+                (session_id, json.dumps(entradas, ensure_ascii=False), json.dumps(list(blobs)), time.time())
+            )
+        self._escrituras += 1
+        if self._escrituras % self.PURGAR_CADA == 0:
+            self.purgar()
+
+    def eliminar(self, session_id):
+        con = self._conexion()
+        with con:
+            con.execute("DELETE FROM sesiones WHERE id = ?", (session_id,))
+
+    def arrendar(self, session_id, duracion):
+        token = secrets.token_hex(8)
+        ahora = time.time()
+        con = self._conexion()
+        # El DELETE toma el lock de escritura: borrar el vencido e insertar es atómico entre procesos
+        with con:
+            con.execute("DELETE FROM arriendos WHERE id = ? AND vence < ?", (session_id, ahora))
+            cursor = con.execute(
+                "INSERT OR IGNORE INTO arriendos (id, token, vence) VALUES (?, ?, ?)",
+                (session_id, token, ahora + duracion)
+            )
+        return token if cursor.rowcount == 1 else None
+
+    def liberar_arriendo(self, session_id, token):
+        con = self._conexion()
+        with con:
+            con.execute("DELETE FROM arriendos WHERE id = ? AND token = ?", (session_id, token))
+
+    def purgar(self):
+        con = self._conexion()
+        try:
+            with con:
+                con.execute(
+                    "DELETE FROM sesiones WHERE actualizado < ?", (time.time() - self.ttl_inactividad,)
+                )
+                con.execute(
+                    "DELETE FROM blobs WHERE clave NOT IN "
+                    "(SELECT j.value FROM sesiones, json_each(sesiones.claves) AS j)"
+                )
+                con.execute("DELETE FROM arriendos WHERE vence < ?", (time.time(),))
+        except sqlite3.Error as e:
+            print(f"[ERROR] No se pudo purgar el almacén de sesiones: {e}")
+
+    def estadisticas(self):
+        con = self._conexion()
+        return {
+            "backend": "sqlite",
+            "sesiones": con.execute("SELECT COUNT(*) FROM sesiones").fetchone()[0],
+            "blobs": con.execute("SELECT COUNT(*) FROM blobs").fetchone()[0]
+        }
+
+# Borra el arriendo solo si sigue siendo el propio (comparar y borrar en un paso)
+_LIBERAR_ARRIENDO = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+class RedisSessionStore(SessionStore):
+    """
+    Sesiones en Redis (o cualquier cliente compatible con get/set/delete/expire/eval,
+    por ejemplo un sustituto local en pruebas). La expiración la maneja Redis.
+    El arriendo de una sesión es una clave con SET NX PX.
+    """
+
+    def __init__(self, cliente, ttl_inactividad=7200, prefijo="chat_ventas:"):
+        self.cliente = cliente
+        self.ttl_inactividad = ttl_inactividad
+        self.prefijo = prefijo
+
+    def _clave_sesion(self, session_id):
+        return f"{self.prefijo}sesion:{session_id}"
+
+    def _clave_blob(self, clave):
+        return f"{self.prefijo}blob:{clave}"
+
+    def _clave_arriendo(self, session_id):
+        return f"{self.prefijo}arriendo:{session_id}"
+
+    @staticmethod
+    def _texto(valor):
+        return valor.decode("utf-8") if isinstance(valor, bytes) else valor
+
+    def obtener(self, session_id):
+        datos = self.cliente.get(self._clave_sesion(session_id))
+        if datos is None:
+            return None
+
+        def obtener_blob(clave):
+            return self._texto(self.cliente.get(self._clave_blob(clave)))
+
+        return decodificar_historial(json.loads(self._texto(datos)), obtener_blob)
+
+    def guardar(self, session_id, messages):
+        entradas, blobs = codificar_historial(messages)
+        # Los blobs viven al menos tanto como la sesión más reciente que los usa
+        for clave, contenido in blobs.items():
+            clave_redis = self._clave_blob(clave)
+            if not self.cliente.expire(clave_redis, self.ttl_inactividad):
+                self.cliente.set(clave_redis, contenido, ex=self.ttl_inactividad)
+        self.cliente.set(
+            self._clave_sesion(session_id),
+            json.dumps(entradas, ensure_ascii=False),
+            ex=self.ttl_inactividad
+        )
+
+    def eliminar(self, session_id):
+        self.cliente.delete(self._clave_sesion(session_id))
+
+    def arrendar(self, session_id, duracion):
+        token = secrets.token_hex(8)
+        if self.cliente.set(self._clave_arriendo(session_id), token, nx=True, px=max(int(duracion * 1000), 1)):
+            return token
+        return None
+
+    def liberar_arriendo(self, session_id, token):
+        self.cliente.eval(_LIBERAR_ARRIENDO, 1, self._clave_arriendo(session_id), token)
+
+    def estadisticas(self):
+        return {"backend": "redis"}
+
+def crear_session_store():
+    """
+    Devuelve el almacén de sesiones configurado en settings.SESSION_BACKEND
+    ("memoria", "sqlite" o "redis").
+    """
+    backend = settings.SESSION_BACKEND
+    if backend == "sqlite":
+        return SQLiteSessionStore(settings.SESSION_DB_FILE, ttl_inactividad=settings.SESSION_IDLE_TTL)
+    if backend == "redis":
+        try:
+            import redis
+        except ImportError as e:
+            # RuntimeError: el contenedor lo informa como servicio no disponible (503, /ready)
+            raise RuntimeError("SESSION_BACKEND=redis requiere el paquete 'redis' (pip install redis).") from e
+        cliente = redis.Redis.from_url(settings.REDIS_URL)
+        return RedisSessionStore(cliente, ttl_inactividad=settings.SESSION_IDLE_TTL)
+    return MemorySessionStore(
+        max_sesiones=settings.SESSION_MAX_SESSIONS,
+        ttl_inactividad=settings.SESSION_IDLE_TTL,
+        max_bytes=settings.SESSION_MAX_BYTES
+    )
@@ -0,0 +1,33 @@
+# services/vector_store.py
+import asyncio
+from config.settings import settings
+
+def crear_servicio_vectorial():
+    """
+    Devuelve el backend de búsqueda vectorial configurado en settings.VECTOR_BACKEND.
+    Ambos exponen query_index(vector, top_k, namespace) con matches[*].metadata.
+    """
+    if settings.VECTOR_BACKEND == "local":
+        from services.local_index_service import LocalIndexService
+        from services.catalog_version import CatalogVersion
+        return LocalIndexService(settings.LOCAL_INDEX_DIR, CatalogVersion(settings.CATALOGO_VERSION_FILE))
+    from services.pinecone_service import PineconeService
+    return PineconeService()
+
+class AsyncPineconeService:
+    """
+    Versión asíncrona del backend vectorial (PineconeService o LocalIndexService) para
+    asgi_app.py. El cliente de Pinecone es síncrono (gRPC): cada consulta corre en el pool
+    de hilos del event loop, que solo se ocupa lo que dura la consulta y no el turno completo.
+    """
+
+    def __init__(self, servicio):
+        self.servicio = servicio
+
+    async def query_index(self, vector, top_k=5, namespace="", include_metadata=True):
+        return await asyncio.to_thread(
+            self.servicio.query_index, vector, top_k=top_k, namespace=namespace, include_metadata=include_metadata
+        )
+
+    async def fetch_metadata(self, ids, namespace=""):
+        return await asyncio.to_thread(self.servicio.fetch_metadata, ids, namespace=namespace)
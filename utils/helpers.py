@@ -1,5 +1,7 @@
 # utils/helpers.py
 import json
+import re
+import unicodedata
 
 def cargar_json(content: str):
     try:
@@ -7,3 +9,26 @@ def cargar_json(content: str):
     except json.JSONDecodeError:
         print("[ERROR] No se pudo decodificar el JSON.")
         return {}
+
+_ESPACIOS = re.compile(r"\s+")
+
+def normalizar_texto(texto: str):
+    """
+    Normaliza un texto para usarlo como clave: minúsculas y espacios colapsados.
+    """
+    if not texto:
+        return ""
+    return _ESPACIOS.sub(" ", texto).strip().casefold()
+
+def quitar_acentos(texto: str):
+    """
+    Minúsculas y sin tildes ni diéresis ("Costeño" -> "costeno").
+    """
+    descompuesto = unicodedata.normalize("NFKD", texto.casefold())
+    return "".join(c for c in descompuesto if not unicodedata.combining(c))
+
+def formatear_sse(evento: str, datos):
+    """
+    Serializa un evento Server-Sent Events.
+    """
+    return f"event: {evento}\ndata: {json.dumps(datos, ensure_ascii=False)}\n\n"
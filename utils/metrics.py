@@ -0,0 +1,243 @@
+# utils/metrics.py
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _etiquetas(pares):
+    if not pares:
+        return ""
+    contenido = ",".join(
+        '{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in pares
+    )
+    return "{" + contenido + "}"
+
+class _Metrica:
+    tipo = ""
+
+    def __init__(self, nombre, ayuda):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def cabecera(self):
+        return [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} {self.tipo}"]
+
+class Contador(_Metrica):
+    tipo = "counter"
+
+    def inc(self, valor=1, **etiquetas):
+        clave = tuple(sorted(etiquetas.items()))
+        with self._lock:
+            self._valores[clave] = self._valores.get(clave, 0) + valor
+
+    def exportar(self):
+        with self._lock:
+            valores = list(self._valores.items())
+        return self.cabecera() + [f"{self.nombre}{_etiquetas(k)} {v}" for k, v in valores]
+
+class Medidor(_Metrica):
+    tipo = "gauge"
+
+    def inc(self, valor=1, **etiquetas):
+        clave = tuple(sorted(etiquetas.items()))
+        with self._lock:
+            self._valores[clave] = self._valores.get(clave, 0) + valor
+
+    def dec(self, valor=1, **etiquetas):
+        self.inc(-valor, **etiquetas)
+
+    def set(self, valor, **etiquetas):
+        with self._lock:
+            self._valores[tuple(sorted(etiquetas.items()))] = valor
+
+    def exportar(self):
+        with self._lock:
+            valores = list(self._valores.items())
+        return self.cabecera() + [f"{self.nombre}{_etiquetas(k)} {v}" for k, v in valores]
+
+class Histograma(_Metrica):
+    tipo = "histogram"
+
+    def __init__(self, nombre, ayuda, buckets=BUCKETS_SEGUNDOS):
+        super().__init__(nombre, ayuda)
+        self.buckets = tuple(buckets)
+
+    def observar(self, valor, **etiquetas):
+        clave = tuple(sorted(etiquetas.items()))
+        i = bisect_left(self.buckets, valor)
+        with self._lock:
+            serie = self._valores.get(clave)
+            if serie is None:
+                # [conteos por bucket (+Inf al final), suma, total]
+                serie = self._valores[clave] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            serie[0][i] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    @contextmanager
+    def medir(self, **etiquetas):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar(time.perf_counter() - inicio, **etiquetas)
+
+    def exportar(self):
+        with self._lock:
+            valores = [(k, list(s[0]), s[1], s[2]) for k, s in self._valores.items()]
+        lineas = self.cabecera()
+        for clave, conteos, suma, total in valores:
+            acumulado = 0
+            for limite, conteo in zip(self.buckets + (float("inf"),), conteos):
+                acumulado += conteo
+                le = "+Inf" if limite == float("inf") else repr(limite)
+                lineas.append(f"{self.nombre}_bucket{_etiquetas(clave + (('le', le),))} {acumulado}")
+            lineas.append(f"{self.nombre}_sum{_etiquetas(clave)} {suma}")
+            lineas.append(f"{self.nombre}_count{_etiquetas(clave)} {total}")
+        return lineas
+
+class RegistroMetricas:
+    """
+    Registro de métricas del proceso, exportable en el formato de texto de Prometheus.
+    Los recolectores son funciones que, al exportar, devuelven
+    [(nombre, tipo, ayuda, {etiquetas}, valor)] a partir de estadísticas ya existentes.
+    """
+
+    def __init__(self):
+        self._metricas = {}
+        self._recolectores = []
+        self._lock = threading.Lock()
+
+    def _obtener(self, clase, nombre, ayuda, **kwargs):
+        with self._lock:
+            metrica = self._metricas.get(nombre)
+            if metrica is None:
+                metrica = self._metricas[nombre] = clase(nombre, ayuda, **kwargs)
+            return metrica
+
+    def contador(self, nombre, ayuda):
+        return self._obtener(Contador, nombre, ayuda)
+
+    def medidor(self, nombre, ayuda):
+        return self._obtener(Medidor, nombre, ayuda)
+
+    def histograma(self, nombre, ayuda, buckets=BUCKETS_SEGUNDOS):
+        return self._obtener(Histograma, nombre, ayuda, buckets=buckets)
+
+    def agregar_recolector(self, funcion):
+        with self._lock:
+            self._recolectores.append(funcion)
+
+    def exportar(self):
+        with self._lock:
+            metricas = list(self._metricas.values())
+            recolectores = list(self._recolectores)
+        lineas = []
+        for metrica in metricas:
+            lineas.extend(metrica.exportar())
+        # El formato exige que las muestras de una misma métrica vayan juntas
+        familias = {}
+        for recolector in recolectores:
+            try:
+                muestras = recolector()
+            except Exception as e:
+                print(f"[ERROR] Falló un recolector de métricas: {e}")
+                continue
+            for nombre, tipo, ayuda, etiquetas, valor in muestras:
+                familia = familias.setdefault(nombre, [f"# HELP {nombre} {ayuda}", f"# TYPE {nombre} {tipo}"])
+                familia.append(f"{nombre}{_etiquetas(sorted(etiquetas.items()))} {valor}")
+        for familia in familias.values():
+            lineas.extend(familia)
+        return "\n".join(lineas) + "\n"
+
+# Registro global del proceso
+metricas = RegistroMetricas()
+
+ETAPAS = metricas.histograma(
+    "chat_ventas_etapa_segundos", "Duración de cada etapa del turno (embedding, consulta al índice, funciones)."
+)
+CHAT_COMPLETION = metricas.histograma(
+    "chat_ventas_chat_completion_segundos", "Duración de cada llamada al modelo, por número de llamada en el turno."
+)
+TOKENS = metricas.contador(
+    "chat_ventas_openai_tokens_total", "Tokens consumidos según el campo usage de OpenAI."
+)
+HTTP = metricas.histograma(
+    "chat_ventas_http_segundos", "Duración de las peticiones HTTP por endpoint y estado."
+)
+EN_CURSO = metricas.medidor(
+    "chat_ventas_http_en_curso", "Peticiones HTTP en curso por endpoint."
+)
+
+def recolector_cache(nombre_cache, obtener_estadisticas):
+    """
+    Recolector para cualquier caché con estadisticas() -> {"hits", "misses", ...}.
+    """
+    def recolectar():
+        stats = obtener_estadisticas()
+        return [
+            ("chat_ventas_cache_hits_total", "counter", "Aciertos de caché.", {"cache": nombre_cache}, stats.get("hits", 0)),
+            ("chat_ventas_cache_misses_total", "counter", "Fallos de caché.", {"cache": nombre_cache}, stats.get("misses", 0)),
+        ]
+    return recolectar
+
+def recolector_router(router):
+    """
+    Decisiones del enrutador de intención por acción (sintetizar, modelo_seleccion, completo...).
+    """
+    def recolectar():
+        return [
+            ("chat_ventas_router_decisiones_total", "counter", "Decisiones del enrutador local de intención.",
+             {"accion": accion}, n)
+            for accion, n in router.estadisticas()["por_accion"].items()
+        ]
+    return recolectar
+
+def recolector_admision(admision):
+    """
+    Llamadas a OpenAI admitidas, rechazadas (429) y en espera por el control de admisión.
+    """
+    def recolectar():
+        stats = admision.estadisticas()
+        return [
+            ("chat_ventas_admision_admitidas_total", "counter", "Llamadas a OpenAI admitidas.", {}, stats["admitidas"]),
+            ("chat_ventas_admision_rechazadas_total", "counter", "Llamadas a OpenAI rechazadas por saturación.", {}, stats["rechazadas"]),
+            ("chat_ventas_admision_en_cola", "gauge", "Llamadas a OpenAI esperando capacidad.", {}, stats["en_cola"]),
+        ]
+    return recolectar
+
+def instrumentar_app(app):
+    """
+    Mide duración y peticiones en curso de cada endpoint de una app Flask y expone /metrics.
+    En endpoints con streaming se mide hasta que empieza la respuesta.
+    """
+    from flask import Response, g, request
+
+    @app.before_request
+    def _inicio_peticion():
+        g._metricas_inicio = time.perf_counter()
+        g._metricas_endpoint = request.url_rule.rule if request.url_rule else "desconocido"
+        EN_CURSO.inc(endpoint=g._metricas_endpoint)
+
+    @app.after_request
+    def _fin_peticion(response):
+        inicio = g.get("_metricas_inicio")
+        if inicio is not None:
+            HTTP.observar(time.perf_counter() - inicio, endpoint=g._metricas_endpoint, estado=response.status_code)
+        return response
+
+    @app.teardown_request
+    def _cierre_peticion(error=None):
+        # teardown se ejecuta incluso si hubo una excepción no controlada
+        if g.pop("_metricas_inicio", None) is not None:
+            EN_CURSO.dec(endpoint=g.pop("_metricas_endpoint", None))
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        return Response(metricas.exportar(), mimetype="text/plain; version=0.0.4")
+
+    return app